@@ -0,0 +1,104 @@
+import logging
+import os
+
+from flask import Blueprint, current_app, jsonify, request, send_from_directory
+
+from extensions import db
+from helpers import admin_required, login_required
+from jobs import enqueue, job_status, recent_jobs
+from models import Job
+from profiling import list_profiles, profile_dir
+
+
+admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
+logger = logging.getLogger(__name__)
+
+MAX_WINDOW_SECONDS = 3600
+
+
+@admin_bp.route("/profiling", methods=["GET"])
+@login_required
+@admin_required
+def profiling_status():
+    """Show the active profiling window and the stored profiles."""
+    window = current_app.extensions["profiling"]["window"]
+    return jsonify({"window": window.current(), "profiles": list_profiles(profile_dir())})
+
+
+@admin_bp.route("/profiling", methods=["POST"])
+@login_required
+@admin_required
+def start_profiling():
+    """Profile every request under ``path_prefix`` for ``seconds``."""
+    data = request.get_json(silent=True) or request.form
+    try:
+        seconds = min(float(data.get("seconds", 60)), MAX_WINDOW_SECONDS)
+    except (TypeError, ValueError):
+        return jsonify({"error": "seconds must be a number"}), 400
+    path_prefix = data.get("path_prefix") or "/"
+    if seconds <= 0 or not path_prefix.startswith("/"):
+        return jsonify({"error": "seconds must be positive and path_prefix must start with /"}), 400
+
+    window = current_app.extensions["profiling"]["window"].open(seconds, path_prefix)
+    logger.info("Profiling %s for %.0f seconds", path_prefix, seconds)
+    return jsonify({"window": window}), 201
+
+
+@admin_bp.route("/profiling", methods=["DELETE"])
+@login_required
+@admin_required
+def stop_profiling():
+    current_app.extensions["profiling"]["window"].close()
+    return jsonify({"window": None})
+
+
+@admin_bp.route("/profiling/<name>")
+@login_required
+@admin_required
+def download_profile(name):
+    """Download one collapsed-stack file (feed it to flamegraph.pl or speedscope)."""
+    if not name.endswith(".folded") or os.path.basename(name) != name:
+        return jsonify({"error": "not found"}), 404
+    return send_from_directory(profile_dir(), name, mimetype="text/plain", as_attachment=True)
+
+
+@admin_bp.route("/jobs", methods=["GET"])
+@login_required
+@admin_required
+def list_jobs():
+    """Recent background jobs with their progress, optionally filtered by ``status``."""
+    try:
+        limit = min(int(request.args.get("limit", 50)), 500)
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+    return jsonify({"jobs": [job_status(job) for job in recent_jobs(request.args.get("status"), limit)]})
+
+
+@admin_bp.route("/jobs", methods=["POST"])
+@login_required
+@admin_required
+def queue_job():
+    """Queue ``kind`` with ``payload``; an identical waiting job is reused."""
+    data = request.get_json(silent=True) or {}
+    payload = data.get("payload") or {}
+    try:
+        priority = int(data.get("priority", 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "priority must be a number"}), 400
+    if not isinstance(payload, dict):
+        return jsonify({"error": "payload must be an object"}), 400
+    try:
+        job_id = enqueue(data.get("kind"), payload, priority=priority)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify({"job": job_status(db.session.get(Job, job_id))}), 201
+
+
+@admin_bp.route("/jobs/<int:job_id>")
+@login_required
+@admin_required
+def show_job(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify({"job": job_status(job)})
@@ -0,0 +1,232 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy import func, select
+
+from extensions import db
+from models import PortfolioValue, Trade
+
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS = 252
+ROLLING_WINDOW = 21
+MEMO_SIZE = 1024
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _trade_arrays(user_id):
+    trades = Trade.__table__
+    rows = db.session.execute(
+        select(trades.c.symbol, trades.c.shares, trades.c.price, trades.c.timestamp)
+        .where(trades.c.user_id == user_id)
+        .order_by(trades.c.timestamp.asc(), trades.c.id.asc())
+    ).all()
+    symbols = np.array([row.symbol for row in rows], dtype=object)
+    shares = np.fromiter((row.shares for row in rows), dtype=np.float64, count=len(rows))
+    prices = np.fromiter((row.price for row in rows), dtype=np.float64, count=len(rows))
+    days = np.array([row.timestamp.date() for row in rows], dtype="datetime64[D]")
+    return symbols, shares, prices, days
+
+
+def _value_arrays(user_id):
+    values = PortfolioValue.__table__
+    rows = db.session.execute(
+        select(values.c.as_of, values.c.market_value)
+        .where(values.c.user_id == user_id)
+        .order_by(values.c.as_of.asc())
+    ).all()
+    days = np.array([row.as_of for row in rows], dtype="datetime64[D]")
+    market_value = np.fromiter((row.market_value for row in rows), dtype=np.float64, count=len(rows))
+    return days, market_value
+
+
+def daily_returns(market_value, flows):
+    """Flow-adjusted returns of the invested sleeve between consecutive snapshots.
+
+    ``flows[t]`` is the net cash put into positions during the interval ending
+    at snapshot ``t``; it is treated as arriving at the end of that interval.
+    Intervals that start from an empty sleeve have no defined return.
+    """
+    previous = market_value[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = (market_value[1:] - flows[1:]) / previous - 1
+    return returns[previous > 0]
+
+
+def time_weighted_return(returns):
+    return float(np.prod(1 + returns) - 1) if len(returns) else 0.0
+
+
+def max_drawdown(returns):
+    """Largest peak-to-trough fall of the cumulative return index."""
+    if not len(returns):
+        return 0.0
+    index = np.cumprod(1 + returns)
+    peaks = np.maximum.accumulate(np.concatenate(([1.0], index)))[1:]
+    return float(np.min(index / peaks - 1))
+
+
+def rolling_volatility(returns, window=ROLLING_WINDOW):
+    """Annualised standard deviation of returns over a trailing window.
+
+    Snapshots are taken once per trading day, so returns annualise by
+    ``sqrt(TRADING_DAYS)``.
+    """
+    if len(returns) < window:
+        return np.zeros(0)
+    windows = np.lib.stride_tricks.sliding_window_view(returns, window)
+    return windows.std(axis=1, ddof=1) * np.sqrt(TRADING_DAYS)
+
+
+def money_weighted_return(cash_flows, days, terminal_value, terminal_day):
+    """Annualised internal rate of return of the investor's cash flows.
+
+    ``cash_flows`` are from the investor's side (buys negative, sells
+    positive), and the position is assumed to be liquidated for
+    ``terminal_value`` on ``terminal_day``.
+    """
+    if not len(cash_flows):
+        return None
+    flows = np.append(cash_flows, terminal_value)
+    years = np.append((days - days[0]).astype(np.float64), float((terminal_day - days[0]).astype(int))) / 365.0
+    if years[-1] <= 0 or not (np.any(flows > 0) and np.any(flows < 0)):
+        return None
+
+    def npv(rate):
+        return np.sum(flows / (1 + rate) ** years)
+
+    # Bisection on the bracketing interval is robust where Newton diverges.
+    low, high = -0.9999, 10.0
+    if npv(low) * npv(high) > 0:
+        return None
+    for _ in range(100):
+        middle = (low + high) / 2
+        if npv(low) * npv(middle) <= 0:
+            high = middle
+        else:
+            low = middle
+        if high - low < 1e-9:
+            break
+    return float((low + high) / 2)
+
+
+def symbol_contributions(symbols, shares, prices, current_prices):
+    """Total P&L per symbol, independent of the lot accounting method.
+
+    P&L = sale proceeds + value of remaining shares - purchase cost, all
+    aggregated per symbol with ``np.bincount``. Symbols without a current
+    price are valued at their last trade price.
+    """
+    if not len(symbols):
+        return []
+    names, index = np.unique(symbols.astype(str), return_inverse=True)
+    cash_flow = np.bincount(index, weights=-shares * prices, minlength=len(names))
+    remaining = np.bincount(index, weights=shares, minlength=len(names))
+    last_trade = np.zeros(len(names))
+    last_trade[index] = prices
+    marks = np.array([current_prices.get(name, last_trade[i]) for i, name in enumerate(names)])
+    pnl = cash_flow + remaining * marks
+
+    invested = np.bincount(index, weights=np.where(shares > 0, shares * prices, 0.0), minlength=len(names))
+    total_invested = invested.sum()
+    order = np.argsort(-pnl)
+    return [
+        {
+            "symbol": str(names[i]),
+            "pnl": round(float(pnl[i]), 2),
+            "contribution_percent": round(float(pnl[i] / total_invested * 100), 4) if total_invested else 0.0,
+        }
+        for i in order
+    ]
+
+
+def compute_analytics(user_id, current_prices):
+    symbols, shares, prices, trade_days = _trade_arrays(user_id)
+    value_days, market_value = _value_arrays(user_id)
+
+    flows = np.zeros(len(value_days))
+    if len(value_days) and len(trade_days):
+        slots = np.searchsorted(value_days, trade_days, side="left")
+        inside = slots < len(value_days)
+        flows = np.bincount(slots[inside], weights=(shares * prices)[inside], minlength=len(value_days))
+
+    if len(value_days) > 1:
+        returns = daily_returns(market_value, flows)
+        return_days = value_days[1:][market_value[:-1] > 0]
+    else:
+        returns = np.zeros(0)
+        return_days = value_days[:0]
+    twr = time_weighted_return(returns)
+    span_years = float((return_days[-1] - value_days[0]).astype(int)) / 365.0 if len(returns) else 0.0
+    rolling = rolling_volatility(returns)
+    rolling_days = return_days[ROLLING_WINDOW - 1:]
+
+    remaining = {}
+    for symbol, quantity in zip(symbols.tolist(), shares.tolist()):
+        remaining[symbol] = remaining.get(symbol, 0.0) + quantity
+    last_prices = dict(zip(symbols.tolist(), prices.tolist()))
+    terminal_value = sum(
+        quantity * current_prices.get(symbol, last_prices[symbol])
+        for symbol, quantity in remaining.items()
+        if quantity > 0
+    )
+    mwr = money_weighted_return(-shares * prices, trade_days, terminal_value, np.datetime64("today", "D"))
+
+    return {
+        "snapshots": int(len(value_days)),
+        "trades": int(len(symbols)),
+        "time_weighted_return": round(twr, 6),
+        "time_weighted_return_annualized": round((1 + twr) ** (1 / span_years) - 1, 6) if span_years >= 1 else None,
+        "money_weighted_return_annualized": mwr if mwr is None else round(mwr, 6),
+        "volatility_annualized": round(float(returns.std(ddof=1) * np.sqrt(TRADING_DAYS)), 6) if len(returns) > 1 else None,
+        "rolling_volatility": [
+            {"date": str(day), "value": round(float(value), 6)}
+            for day, value in zip(rolling_days, rolling)
+        ],
+        "max_drawdown": round(max_drawdown(returns), 6),
+        "contributions": symbol_contributions(symbols, shares, prices, current_prices),
+    }
+
+
+def analytics_version(user_id):
+    """Cache key that changes with the user's next trade or snapshot."""
+    trades = Trade.__table__
+    values = PortfolioValue.__table__
+    last_trade = db.session.execute(select(func.max(trades.c.id)).where(trades.c.user_id == user_id)).scalar()
+    last_snapshot = db.session.execute(select(func.max(values.c.as_of)).where(values.c.user_id == user_id)).scalar()
+    return last_trade, last_snapshot
+
+
+def portfolio_analytics(user_id, price_source):
+    """Return memoised analytics for ``user_id``.
+
+    ``price_source`` is called with the open symbols only when the cached
+    result is out of date, so quotes are fetched once per trade or snapshot.
+    """
+    version = analytics_version(user_id)
+    with _memo_lock:
+        cached = _memo.get(user_id)
+        if cached and cached[0] == version:
+            _memo.move_to_end(user_id)
+            return cached[1]
+
+    holdings = db.session.execute(
+        select(Trade.__table__.c.symbol)
+        .where(Trade.__table__.c.user_id == user_id)
+        .group_by(Trade.__table__.c.symbol)
+        .having(func.sum(Trade.__table__.c.shares) > 0)
+    ).scalars().all()
+    logger.debug("Recomputing analytics for user %s at version %s", user_id, version)
+    result = compute_analytics(user_id, price_source(holdings))
+
+    with _memo_lock:
+        _memo[user_id] = (version, result)
+        _memo.move_to_end(user_id)
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return result
@@ -1,16 +1,27 @@
+import logging
+from datetime import datetime, timezone
+
 from flask import Blueprint, jsonify, request
 from flask import session
 
+from analytics import portfolio_analytics
+from database import read_replica
 from extensions import db
-from helpers import get_finance_response, get_market_data, login_required, lookup
-from models import Portfolio, User, ensure_portfolios_populated
+from helpers import get_finance_response, login_required, lookup, market_snapshot
+from jobs import enqueue
+from lots import ensure_lots_populated, open_lot_rows, realized_gains
+from models import ensure_portfolios_populated, holding_rows, user_cash
+from price_store import get_price_store, should_backfill
+from valuation import fetch_prices
 
 
 api_bp = Blueprint("api", __name__)
+logger = logging.getLogger(__name__)
 
 
 @api_bp.route("/chatbot", methods=["POST"])
 @login_required
+@read_replica
 def chatbot():
     """Handle chatbot requests"""
     try:
@@ -21,9 +32,9 @@ def chatbot():
             return jsonify({"response": "Please ask me a question about finance!"})
 
         ensure_portfolios_populated(session["user_id"])
-        user = User.query.get(session["user_id"])
-        holdings = Portfolio.query.filter_by(user_id=session["user_id"]).order_by(Portfolio.symbol.asc()).all()
-        market_data = get_market_data()
+        cash = user_cash(session["user_id"]) or 0
+        holdings = holding_rows(session["user_id"])
+        _, market_data = market_snapshot()
 
         positions = []
         invested_value = 0
@@ -39,8 +50,8 @@ def chatbot():
             invested_value += holding.total_cost_basis
 
         portfolio_context = {
-            "cash": user.cash if user else 0,
-            "total_value": (user.cash if user else 0) + invested_value,
+            "cash": cash,
+            "total_value": cash + invested_value,
             "positions": positions,
         }
 
@@ -56,6 +67,7 @@ def chatbot():
 
 @api_bp.route("/api/quote/<symbol>")
 @login_required
+@read_replica
 def api_quote(symbol):
     """Get stock quote via API endpoint"""
     try:
@@ -76,10 +88,103 @@ def api_quote(symbol):
 
 @api_bp.route("/api/market-data")
 @login_required
+@read_replica
 def market_data():
     """Get market data for dashboard"""
     try:
-        data = get_market_data()
+        _, data = market_snapshot()
         return jsonify(data)
     except Exception:
         return jsonify({"error": "Unable to fetch market data"})
+
+
+@api_bp.route("/api/analytics")
+@login_required
+@read_replica
+def analytics_summary():
+    """Get performance analytics for the current user"""
+    try:
+        return jsonify(portfolio_analytics(session["user_id"], fetch_prices))
+    except Exception:
+        logger.exception("Analytics computation failed for user %s", session["user_id"])
+        return jsonify({"error": "Unable to compute analytics"}), 500
+
+
+def _epoch_day(value):
+    if not value:
+        return None
+    return int(datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+
+
+@api_bp.route("/api/history/<symbol>")
+@login_required
+def price_history(symbol):
+    """Get daily OHLCV bars for charts from the local price store"""
+    try:
+        start = _epoch_day(request.args.get("start"))
+        end = _epoch_day(request.args.get("end"))
+    except ValueError:
+        return jsonify({"error": "Dates must look like YYYY-MM-DD", "success": False}), 400
+
+    try:
+        bars = get_price_store().range(symbol, start=start, end=end)
+        backfilling = should_backfill(symbol)
+    except ValueError:
+        return jsonify({"error": "Invalid symbol", "success": False}), 400
+    if backfilling:
+        # Serve what is stored now; a worker fetches the missing bars.
+        enqueue("backfill_prices", {"symbols": [symbol.upper()]}, priority=10)
+
+    return jsonify(
+        {
+            "symbol": symbol.upper(),
+            "t": bars["ts"].tolist(),
+            "o": bars["open"].tolist(),
+            "h": bars["high"].tolist(),
+            "l": bars["low"].tolist(),
+            "c": bars["close"].tolist(),
+            "v": bars["volume"].tolist(),
+            "backfilling": backfilling,
+            "success": True,
+        }
+    )
+
+
+@api_bp.route("/api/gains")
+@login_required
+@read_replica
+def gains():
+    """Get realized and unrealized gains by tax lot"""
+    try:
+        ensure_lots_populated(session["user_id"])
+        realized = realized_gains(session["user_id"])
+        lots = open_lot_rows(session["user_id"])
+        prices = fetch_prices(sorted({lot.symbol for lot in lots}))
+
+        open_lots = []
+        for lot in lots:
+            price = prices.get(lot.symbol)
+            open_lots.append(
+                {
+                    "id": lot.id,
+                    "symbol": lot.symbol,
+                    "shares": lot.remaining_shares,
+                    "cost_per_share": lot.price,
+                    "opened_at": lot.opened_at.isoformat() if lot.opened_at else None,
+                    "unrealized_pnl": round((price - lot.price) * lot.remaining_shares, 2) if price else None,
+                }
+            )
+
+        return jsonify(
+            {
+                "realized": {symbol: round(value, 2) for symbol, value in realized.items()},
+                "realized_total": round(sum(realized.values()), 2),
+                "open_lots": open_lots,
+                "unrealized_total": round(
+                    sum(lot["unrealized_pnl"] for lot in open_lots if lot["unrealized_pnl"] is not None), 2
+                ),
+            }
+        )
+    except Exception:
+        logger.exception("Gains report failed for user %s", session["user_id"])
+        return jsonify({"error": "Unable to compute gains"}), 500
@@ -3,13 +3,32 @@ import logging
 
 from dotenv import load_dotenv # type: ignore
 from flask import Flask # type: ignore
+from jinja2 import FileSystemBytecodeCache
 
+from admin.routes import admin_bp
 from api.routes import api_bp
 from auth.routes import auth_bp
-from extensions import db, migrate, moment, sess
+from compression import init_compression
+from database import (
+    build_engine_options,
+    build_replica_binds,
+    init_engine_tuning,
+    init_read_replica,
+    resolve_database_uri,
+)
+from deadlines import init_deadlines
+from extensions import db, init_migrate, moment
 from helpers import usd
+from jobs import enqueue_command, worker_command
+from metrics import init_metrics
 from models import Portfolio, Trade, User
+from orders import init_orders
 from portfolio.routes import portfolio_bp
+from price_store import backfill_prices_command
+from profiling import init_profiling
+from quote_cache import init_quote_cache
+from session_backends import init_session_backend
+from valuation import snapshot_values_command
 
 
 logging.basicConfig(
@@ -23,29 +42,46 @@ logger.info("Application startup initiated")
 load_dotenv()
 
 
+def init_template_cache(app):
+    """Keep compiled templates on disk so new workers skip Jinja compilation."""
+    cache_dir = os.getenv("JINJA_CACHE_DIR") or os.path.join(app.instance_path, "jinja_cache")
+    if cache_dir.lower() == "off":
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+
 def create_app():
     app = Flask(__name__)
     app.config["SECRET_KEY"] = os.environ["SECRET_KEY"]
     logger.info("Flask app created")
 
     app.config["SESSION_PERMANENT"] = False
-    app.config["SESSION_TYPE"] = "filesystem"
 
     if os.environ.get("DATABASE_URL"):
-        uri = os.environ.get("DATABASE_URL")
-        if uri.startswith("postgres://"):
-            uri = uri.replace("postgres://", "postgresql://", 1)
+        uri = resolve_database_uri(os.environ.get("DATABASE_URL"))
     else:
         uri = "sqlite:///finance.db"
 
     app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = build_engine_options(uri)
+    app.config["SQLALCHEMY_BINDS"] = build_replica_binds(os.environ.get("DATABASE_READ_URL"))
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
     moment.init_app(app)
-    sess.init_app(app)
     db.init_app(app)
-    migrate.init_app(app, db)
+    init_session_backend(app)
+    init_engine_tuning(app, db)
+    init_metrics(app, db)
+    init_profiling(app)
+    init_read_replica(app)
+    init_deadlines(app)
+    init_quote_cache(app)
+    init_orders(app)
+    init_migrate(app)
     app.jinja_env.filters["usd"] = usd
+    init_template_cache(app)
+    init_compression(app)
 
     @app.after_request
     def after_request(response):
@@ -58,6 +94,11 @@ def create_app():
     app.register_blueprint(auth_bp)
     app.register_blueprint(portfolio_bp)
     app.register_blueprint(api_bp)
+    app.register_blueprint(admin_bp)
+    app.cli.add_command(snapshot_values_command)
+    app.cli.add_command(backfill_prices_command)
+    app.cli.add_command(worker_command)
+    app.cli.add_command(enqueue_command)
 
     logger.info("Application configured and blueprints registered")
     return app
@@ -65,4 +106,4 @@ def create_app():
 
 app = create_app()
 
-__all__ = ["app", "db", "migrate", "Portfolio", "Trade", "User", "create_app"]
+__all__ = ["app", "db", "Portfolio", "Trade", "User", "create_app"]
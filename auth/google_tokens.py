@@ -0,0 +1,113 @@
+import logging
+import os
+import re
+import threading
+import time
+
+from metrics import upstream_timer
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ISSUERS = ("https://accounts.google.com", "accounts.google.com")
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+class InvalidIdToken(Exception):
+    """The id_token could not be verified."""
+
+
+def google_auth_url():
+    return os.getenv("GOOGLE_AUTH_URL", "https://accounts.google.com/o/oauth2/v2/auth")
+
+
+def google_token_url():
+    return os.getenv("GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token")
+
+
+def google_jwks_url():
+    return os.getenv("GOOGLE_JWKS_URL", "https://www.googleapis.com/oauth2/v3/certs")
+
+
+def google_issuers():
+    issuer = os.getenv("GOOGLE_ISSUER")
+    return (issuer,) if issuer else DEFAULT_ISSUERS
+
+
+class JWKSCache:
+    """Signing keys by ``kid``, kept for the ``max-age`` the JWKS response allows.
+
+    An unknown ``kid`` means the keys were rotated, so it triggers a refetch,
+    but no more than once per ``min_refresh_seconds`` so forged kids cannot
+    turn every callback into a fetch.
+    """
+
+    def __init__(self, url_source, default_ttl=3600, min_refresh_seconds=60):
+        self._url_source = url_source
+        self.default_ttl = default_ttl
+        self.min_refresh_seconds = min_refresh_seconds
+        self._keys = {}
+        self._expires_at = 0.0
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        import jwt
+        import requests
+
+        with upstream_timer("google"):
+            response = requests.get(self._url_source(), timeout=10)
+        response.raise_for_status()
+        keys = {}
+        for jwk in response.json().get("keys", []):
+            try:
+                keys[jwk["kid"]] = jwt.PyJWK(jwk).key
+            except (KeyError, jwt.PyJWTError):
+                logger.warning("Skipping unusable JWKS entry %r", jwk.get("kid"))
+
+        match = MAX_AGE_PATTERN.search(response.headers.get("Cache-Control", ""))
+        ttl = int(match.group(1)) if match else self.default_ttl
+        now = time.monotonic()
+        self._keys = keys
+        self._fetched_at = now
+        self._expires_at = now + ttl
+        logger.info("Loaded %s signing keys, cached for %ss", len(keys), ttl)
+
+    def get(self, kid):
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._expires_at:
+                self._refresh()
+            elif kid not in self._keys and now - self._fetched_at >= self.min_refresh_seconds:
+                self._refresh()
+            return self._keys.get(kid)
+
+
+jwks_cache = JWKSCache(google_jwks_url)
+
+
+def verify_id_token(token, audience, nonce=None):
+    """Return the claims of a Google ``id_token`` after checking its signature locally."""
+    import jwt
+    import requests
+
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = jwks_cache.get(kid)
+        if key is None:
+            raise InvalidIdToken(f"unknown signing key {kid!r}")
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=["RS256"],
+            audience=audience,
+            issuer=google_issuers(),
+            leeway=60,
+            options={"require": ["exp", "iat", "iss", "aud", "sub"]},
+        )
+    except (jwt.PyJWTError, requests.RequestException) as exc:
+        raise InvalidIdToken(str(exc)) from exc
+
+    if nonce is not None and claims.get("nonce") != nonce:
+        raise InvalidIdToken("nonce mismatch")
+    return claims
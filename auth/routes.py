@@ -1,17 +1,24 @@
+import logging
 import os
 import re
 import secrets
+from urllib.parse import quote
 
-import requests
 from flask import Blueprint, flash, redirect, render_template, request, session, url_for
-from werkzeug.security import check_password_hash, generate_password_hash
 
+from auth.google_tokens import InvalidIdToken, google_auth_url, google_token_url, verify_id_token
 from extensions import db
+from metrics import upstream_timer
 from models import User
+from passwords import UNUSABLE_PASSWORD, PasswordHashingBusy, hash_password, needs_rehash, verify_password
 
 
+logger = logging.getLogger(__name__)
+
 auth_bp = Blueprint("auth", __name__)
 
+SERVER_BUSY_MESSAGE = "We're handling a lot of sign-ins right now. Please try again in a moment."
+
 PASSWORD_REQUIREMENTS = (
     "Use at least 8 characters and include uppercase, lowercase, a number, "
     "and a special character."
@@ -72,8 +79,15 @@ def login():
 
         user = User.query.filter_by(username=username).first()
 
-        if user is None or not check_password_hash(user.hash, password):
-            return render_template("login.html", **build_login_context("Invalid username or password."))
+        try:
+            if user is None or not verify_password(user.hash, password):
+                return render_template("login.html", **build_login_context("Invalid username or password."))
+
+            if needs_rehash(user.hash):
+                user.hash = hash_password(password)
+                db.session.commit()
+        except PasswordHashingBusy:
+            return render_template("login.html", **build_login_context(SERVER_BUSY_MESSAGE)), 503
 
         session["user_id"] = user.id
         return redirect("/")
@@ -115,9 +129,14 @@ def register():
         if user:
             return render_template("register.html", **build_register_context("That username is already taken."))
 
+        try:
+            password_hash = hash_password(password)
+        except PasswordHashingBusy:
+            return render_template("register.html", **build_register_context(SERVER_BUSY_MESSAGE)), 503
+
         new_user = User(
             username=username,
-            hash=generate_password_hash(password, method="pbkdf2:sha256"),
+            hash=password_hash,
         )
 
         db.session.add(new_user)
@@ -137,7 +156,9 @@ def google_register():
         return redirect(url_for("auth.register"))
 
     state = secrets.token_urlsafe(24)
+    nonce = secrets.token_urlsafe(24)
     session["google_oauth_state"] = state
+    session["google_oauth_nonce"] = nonce
 
     params = {
         "client_id": os.getenv("GOOGLE_CLIENT_ID"),
@@ -145,17 +166,19 @@ def google_register():
         "response_type": "code",
         "scope": "openid email profile",
         "state": state,
+        "nonce": nonce,
         "access_type": "offline",
         "prompt": "select_account",
     }
 
-    query = "&".join(f"{key}={requests.utils.quote(str(value), safe='')}" for key, value in params.items())
-    return redirect(f"https://accounts.google.com/o/oauth2/v2/auth?{query}")
+    query = "&".join(f"{key}={quote(str(value), safe='')}" for key, value in params.items())
+    return redirect(f"{google_auth_url()}?{query}")
 
 
 @auth_bp.route("/auth/google/callback")
 def google_callback():
     expected_state = session.pop("google_oauth_state", None)
+    expected_nonce = session.pop("google_oauth_nonce", None)
     incoming_state = request.args.get("state")
 
     if not expected_state or expected_state != incoming_state:
@@ -167,48 +190,47 @@ def google_callback():
         flash("Google did not return an authorization code.")
         return redirect(url_for("auth.register"))
 
-    token_response = requests.post(
-        "https://oauth2.googleapis.com/token",
-        data={
-            "client_id": os.getenv("GOOGLE_CLIENT_ID"),
-            "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
-            "code": code,
-            "grant_type": "authorization_code",
-            "redirect_uri": url_for("auth.google_callback", _external=True),
-        },
-        timeout=10,
-    )
+    import requests
+
+    with upstream_timer("google"):
+        token_response = requests.post(
+            google_token_url(),
+            data={
+                "client_id": os.getenv("GOOGLE_CLIENT_ID"),
+                "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
+                "code": code,
+                "grant_type": "authorization_code",
+                "redirect_uri": url_for("auth.google_callback", _external=True),
+            },
+            timeout=10,
+        )
 
     if token_response.status_code != 200:
         flash("Google sign-up could not be completed. Please try again.")
         return redirect(url_for("auth.register"))
 
-    access_token = token_response.json().get("access_token")
-    if not access_token:
+    id_token = token_response.json().get("id_token")
+    if not id_token:
         flash("Google sign-up could not be completed. Please try again.")
         return redirect(url_for("auth.register"))
 
-    profile_response = requests.get(
-        "https://www.googleapis.com/oauth2/v3/userinfo",
-        headers={"Authorization": f"Bearer {access_token}"},
-        timeout=10,
-    )
-
-    if profile_response.status_code != 200:
-        flash("We couldn't fetch your Google profile. Please try again.")
+    try:
+        profile = verify_id_token(id_token, os.getenv("GOOGLE_CLIENT_ID"), nonce=expected_nonce)
+    except InvalidIdToken as exc:
+        logger.warning("Rejected Google id_token: %s", exc)
+        flash("We couldn't verify your Google sign-in. Please try again.")
         return redirect(url_for("auth.register"))
 
-    profile = profile_response.json()
     email = (profile.get("email") or "").strip().lower()
-    if not email:
-        flash("Your Google account did not provide an email address.")
+    if not email or profile.get("email_verified") is False:
+        flash("Your Google account did not provide a verified email address.")
         return redirect(url_for("auth.register"))
 
     user = User.query.filter_by(username=email).first()
     if user is None:
         user = User(
             username=email,
-            hash=generate_password_hash(secrets.token_urlsafe(32), method="pbkdf2:sha256"),
+            hash=UNUSABLE_PASSWORD,
         )
         db.session.add(user)
         db.session.commit()
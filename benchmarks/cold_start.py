@@ -0,0 +1,80 @@
+"""Profile cold-start imports and check worker boot time against a budget.
+
+Usage: python benchmarks/cold_start.py [--runs 5] [--top 15] [--budget-ms 1500]
+
+Each run starts a fresh interpreter with ``-X importtime`` and imports
+``app`` the way a gunicorn worker does. The report lists the top-level
+packages with the largest self import time, summed over their submodules,
+from the median run. The script exits with status 1 when the median wall
+time of ``import app`` exceeds the budget (``BOOT_BUDGET_MS`` or
+``--budget-ms``), so CI can run it as a boot-time regression check.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_once(module):
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "benchmark")
+    env.setdefault("LOG_LEVEL", "WARNING")
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+
+    by_package = defaultdict(int)
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        by_package[name.strip().split(".")[0]] += int(self_us)
+    return wall_ms, by_package
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("BOOT_BUDGET_MS", "1500")))
+    parser.add_argument("--json", action="store_true", help="emit machine-readable output")
+    args = parser.parse_args()
+
+    runs = sorted((import_once(args.module) for _ in range(args.runs)), key=lambda run: run[0])
+    wall_ms, by_package = runs[len(runs) // 2]
+    top = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[: args.top]
+    result = {
+        "module": args.module,
+        "median_ms": round(statistics.median(run[0] for run in runs), 1),
+        "budget_ms": args.budget_ms,
+        "packages_ms": {name: round(us / 1000, 1) for name, us in top},
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"import {args.module}: median {result['median_ms']} ms over {args.runs} runs (budget {args.budget_ms} ms)")
+        for name, ms in result["packages_ms"].items():
+            print(f"  {name:<24} {ms:>8.1f} ms")
+
+    if result["median_ms"] > args.budget_ms:
+        print(f"Boot time over budget by {result['median_ms'] - args.budget_ms:.1f} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Record bytes saved and CPU spent by response compression.
+
+Usage: python benchmarks/compression.py [--holdings 40] [--iterations 50]
+
+Renders the dashboard (seeded user, stubbed quotes) and fetches
+``styles.css`` uncompressed through the test client, and builds a JSON body
+shaped like ``/api/history`` for five years of bars. Each body is then
+compressed with the per-request settings (gzip 6, brotli 4) and, for the
+stylesheet, the one-off static settings (gzip 9, brotli 11). The report
+gives raw and encoded sizes and the CPU time of one compression.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def measure(name, data, encoding, level, iterations):
+    from compression import compress
+
+    started = time.process_time()
+    for _ in range(iterations):
+        encoded = compress(data, encoding, level)
+    cpu_us = (time.process_time() - started) / iterations * 1e6
+    return {
+        "body": name,
+        "encoding": f"{encoding}-{level}",
+        "raw_bytes": len(data),
+        "encoded_bytes": len(encoded),
+        "ratio": round(len(encoded) / len(data), 3),
+        "cpu_us": round(cpu_us, 1),
+    }
+
+
+def history_payload(days=1260):
+    start = 1_600_000_000
+    closes = [100 + (index % 37) * 0.73 + index * 0.01 for index in range(days)]
+    return json.dumps(
+        {
+            "symbol": "AAPL",
+            "t": [start + index * 86400 for index in range(days)],
+            "o": [round(close - 0.4, 4) for close in closes],
+            "h": [round(close + 1.1, 4) for close in closes],
+            "l": [round(close - 1.3, 4) for close in closes],
+            "c": [round(close, 4) for close in closes],
+            "v": [1_000_000 + index * 17 for index in range(days)],
+        }
+    ).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--holdings", type=int, default=40)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="emit machine-readable output")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["STATIC_PRECOMPRESS"] = "0"
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ["JINJA_CACHE_DIR"] = os.path.join(tmp, "jinja")
+
+        import helpers
+        import portfolio.routes
+        import valuation
+        from app import create_app
+        from compression import supported_encodings
+        from extensions import db
+        from models import Portfolio, User
+
+        def quote(symbol):
+            return {"name": f"{symbol} Corp", "price": 100.0 + len(symbol), "symbol": symbol}
+
+        for module in (helpers, portfolio.routes, valuation):
+            module.lookup = quote
+        helpers.get_market_data = lambda: {"S&P 500": {"price": 5000.0, "change": 10.0, "change_percent": 0.2}}
+
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            user = User(username="bench", hash="!", cash=100000)
+            db.session.add(user)
+            db.session.flush()
+            for index in range(args.holdings):
+                db.session.add(Portfolio(user_id=user.id, symbol=f"S{index:03d}", shares=10, total_cost_basis=900.0))
+            db.session.commit()
+            user_id = user.id
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["user_id"] = user_id
+        identity = {"Accept-Encoding": "identity"}
+        dashboard = client.get("/", headers=identity).get_data()
+        stylesheet = client.get("/static/styles.css", headers=identity).get_data()
+
+    bodies = [("dashboard", dashboard), ("styles.css", stylesheet), ("history.json", history_payload())]
+    dynamic_levels = {"gzip": 6, "br": 4}
+    static_levels = {"gzip": 9, "br": 11}
+    results = []
+    for name, data in bodies:
+        for encoding in supported_encodings():
+            results.append(measure(name, data, encoding, dynamic_levels[encoding], args.iterations))
+            if name == "styles.css":
+                results.append(measure(name, data, encoding, static_levels[encoding], max(args.iterations // 10, 1)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print(
+            f"{result['body']:>13} {result['encoding']:>8}: {result['raw_bytes']:>7} -> "
+            f"{result['encoded_bytes']:>6} bytes ({result['ratio']:.1%}), {result['cpu_us']} us CPU"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Measure repeat dashboard views with and without the fragment cache.
+
+Usage: python benchmarks/dashboard_render.py [--holdings 40] [--requests 300]
+
+Seeds one user with ``--holdings`` positions on a throwaway SQLite database,
+stubs quote and market lookups with fixed prices, then times ``GET /``
+repeatedly. The first run sets ``FRAGMENT_CACHE_SIZE=0``; the second uses
+the cache, so every view after the first serves the market strip and the
+holdings table from it.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def benchmark(client, cache, count):
+    from fragment_cache import fragment_cache
+
+    fragment_cache.max_entries = cache
+    fragment_cache.clear()
+    fragment_cache.hits = fragment_cache.misses = 0
+
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = client.get("/")
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.status_code
+
+    samples.sort()
+    return {
+        "fragment_cache": cache > 0,
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+        **fragment_cache.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--holdings", type=int, default=40)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--json", action="store_true", help="emit machine-readable output")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ["JINJA_CACHE_DIR"] = os.path.join(tmp, "jinja")
+
+        import helpers
+        import portfolio.routes
+        import valuation
+        from app import create_app
+        from extensions import db
+        from models import Portfolio, User
+
+        def quote(symbol):
+            return {"name": f"{symbol} Corp", "price": 100.0 + len(symbol), "symbol": symbol}
+
+        for module in (helpers, portfolio.routes, valuation):
+            module.lookup = quote
+        helpers.get_market_data = lambda: {
+            "S&P 500": {"price": 5000.0, "change": 10.0, "change_percent": 0.2},
+            "NASDAQ": {"price": 16000.0, "change": -20.0, "change_percent": -0.1},
+            "DOW": {"price": 39000.0, "change": 0.0, "change_percent": 0.0},
+        }
+
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            user = User(username="bench", hash="!", cash=100000)
+            db.session.add(user)
+            db.session.flush()
+            for index in range(args.holdings):
+                db.session.add(
+                    Portfolio(user_id=user.id, symbol=f"S{index:03d}", shares=10, total_cost_basis=900.0)
+                )
+            db.session.commit()
+            user_id = user.id
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["user_id"] = user_id
+
+        results = [benchmark(client, cache, args.requests) for cache in (0, 2048)]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        label = "cached" if result["fragment_cache"] else "uncached"
+        print(
+            f"{label:>9}: median {result['median_ms']} ms, p95 {result['p95_ms']} ms "
+            f"(hits {result['hits']}, misses {result['misses']})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Compare ORM instances with column-only row tuples for a deep history page.
+
+Usage: python benchmarks/history_rows.py [--trades 10000] [--repeat 20]
+
+Seeds a throwaway SQLite database with one user and N trades, then measures
+median latency for loading the trades and for the full ``history.html`` render,
+plus peak allocations in a separate traced pass, for ``Trade.query`` (the
+previous path) and for ``models.trade_history_rows``.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _setup(tmp, trade_count):
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    from app import create_app
+    from extensions import db
+    from models import Trade, User
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user = User(username="bench", hash="x")
+        db.session.add(user)
+        db.session.flush()
+        start = datetime(2020, 1, 1)
+        db.session.bulk_insert_mappings(
+            Trade,
+            [
+                {
+                    "user_id": user.id,
+                    "symbol": f"SYM{i % 40}",
+                    "shares": (i % 9 + 1) * (1 if i % 3 else -1),
+                    "price": 50.0 + (i % 200) / 4,
+                    "timestamp": start + timedelta(minutes=i),
+                }
+                for i in range(trade_count)
+            ],
+        )
+        db.session.commit()
+        user_id = user.id
+    return app, user_id
+
+
+def _measure(app, user_id, load, repeat):
+    from flask import render_template, session
+
+    from extensions import db
+
+    load_ms = []
+    total_ms = []
+    peaks = []
+    for iteration in range(repeat + 1):
+        with app.test_request_context("/history"):
+            session["user_id"] = user_id
+            traced = iteration == repeat
+            if traced:
+                tracemalloc.start()
+            started = time.perf_counter()
+            transactions = load(user_id)
+            loaded = time.perf_counter()
+            render_template("history.html", transactions=transactions)
+            finished = time.perf_counter()
+            if traced:
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            else:
+                load_ms.append((loaded - started) * 1000)
+                total_ms.append((finished - started) * 1000)
+            db.session.remove()
+
+    return {
+        "load_median_ms": round(statistics.median(load_ms), 2),
+        "page_median_ms": round(statistics.median(total_ms), 2),
+        "peak_alloc_kb": round(peaks[0] / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trades", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="emit machine-readable output")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, user_id = _setup(tmp, args.trades)
+
+        from models import Trade, trade_history_rows
+
+        def orm_path(uid):
+            return Trade.query.filter_by(user_id=uid).order_by(Trade.timestamp.desc()).all()
+
+        results = {
+            "trades": args.trades,
+            "orm": _measure(app, user_id, orm_path, args.repeat),
+            "rows": _measure(app, user_id, trade_history_rows, args.repeat),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"history page with {args.trades} trades")
+    for label in ("orm", "rows"):
+        result = results[label]
+        print(
+            f"{label:>5}: load {result['load_median_ms']} ms, page {result['page_median_ms']} ms, "
+            f"peak alloc {result['peak_alloc_kb']} KiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
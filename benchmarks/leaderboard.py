@@ -0,0 +1,91 @@
+"""Time leaderboard revaluation, incremental trades and page reads.
+
+Usage: python benchmarks/leaderboard.py [--users 100000] [--symbols 2000] [--positions 8]
+
+Builds an in-memory ``Leaderboard`` with synthetic holdings (no database),
+then times a full revaluation after every price moves, single-symbol price
+ticks, individual trades, top-K reads and rank lookups.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leaderboard import Leaderboard  # noqa: E402
+
+
+def _timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--symbols", type=int, default=2000)
+    parser.add_argument("--positions", type=int, default=8, help="open positions per user")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="emit machine-readable output")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    symbols = [f"S{i:04d}" for i in range(args.symbols)]
+    holdings = [
+        (user_id, symbols[column], int(shares), float(shares) * 50.0)
+        for user_id in range(1, args.users + 1)
+        for column, shares in zip(
+            rng.choice(args.symbols, size=args.positions, replace=False),
+            rng.integers(1, 200, size=args.positions),
+        )
+    ]
+    cash = {user_id: float(rng.uniform(0, 10000)) for user_id in range(1, args.users + 1)}
+    prices = dict(zip(symbols, rng.uniform(5, 500, size=args.symbols).tolist()))
+
+    board = Leaderboard()
+    started = time.perf_counter()
+    board.load(holdings, cash, prices)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    def full_revaluation():
+        moves = rng.normal(1.0, 0.01, size=args.symbols)
+        board.update_prices(dict(zip(symbols, (np.array(list(prices.values())) * moves).tolist())))
+
+    def single_tick():
+        symbol = symbols[int(rng.integers(args.symbols))]
+        board.update_prices({symbol: float(rng.uniform(5, 500))})
+
+    def trade():
+        user_id = int(rng.integers(1, args.users + 1))
+        board.apply_trade(user_id, symbols[0], 1, 100.0, cash[user_id], prices[symbols[0]])
+
+    results = {
+        "users": args.users,
+        "positions": len(holdings),
+        "load_ms": round(load_ms, 1),
+        "full_revaluation_ms": _timed(full_revaluation, 5),
+        "single_symbol_tick_ms": _timed(single_tick, 20),
+        "trade_ms": _timed(trade, 200),
+        "top_k_ms": _timed(lambda: board.top(args.top), 1000),
+        "rank_ms": _timed(lambda: board.rank(int(rng.integers(1, args.users + 1))), 1000),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, value in results.items():
+        print(f"{name:>22}: {value}")
+
+
+if __name__ == "__main__":
+    main()
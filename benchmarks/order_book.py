@@ -0,0 +1,96 @@
+"""Time price-tick evaluation against many resting orders, heaps vs a full scan.
+
+Usage: python benchmarks/order_book.py [--orders 100000] [--symbols 1000] [--ticks 20000]
+
+Loads ``--orders`` random limit/stop orders spread over ``--symbols``
+symbols into ``orders.OrderBook``, then feeds a random walk of price ticks
+and records the time per tick and the orders each tick triggers. The
+baseline checks every resting order on the ticked symbol, which is what
+querying ``orders`` per tick amounts to.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--symbols", type=int, default=1000)
+    parser.add_argument("--ticks", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="emit machine-readable output")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from orders import BUY, LIMIT, SELL, STOP, OrderBook, fills_on_fall
+
+    rng = random.Random(args.seed)
+    symbols = [f"S{index:04d}" for index in range(args.symbols)]
+    prices = {symbol: 100.0 for symbol in symbols}
+    rows = [
+        (order_id, rng.choice(symbols), rng.choice((BUY, SELL)), rng.choice((LIMIT, STOP)), round(rng.uniform(50, 150), 2))
+        for order_id in range(1, args.orders + 1)
+    ]
+    ticks = []
+    for _ in range(args.ticks):
+        symbol = rng.choice(symbols)
+        prices[symbol] *= 1 + rng.gauss(0, 0.02)
+        ticks.append((symbol, prices[symbol]))
+
+    book = OrderBook()
+    started = time.perf_counter()
+    book.load(rows)
+    load_ms = (time.perf_counter() - started) * 1000
+    heap_samples, triggered = [], 0
+    for symbol, price in ticks:
+        started = time.perf_counter()
+        triggered += len(book.crossed(symbol, price))
+        heap_samples.append((time.perf_counter() - started) * 1_000_000)
+
+    resting = {}
+    for row in rows:
+        resting.setdefault(row[1], []).append(row)
+    scan_samples, scanned = [], 0
+    for symbol, price in ticks:
+        started = time.perf_counter()
+        keep, hits = [], 0
+        for row in resting.get(symbol, ()):
+            falling = fills_on_fall(row[2], row[3])
+            if (falling and price <= row[4]) or (not falling and price >= row[4]):
+                hits += 1
+            else:
+                keep.append(row)
+        resting[symbol] = keep
+        scanned += hits
+        scan_samples.append((time.perf_counter() - started) * 1_000_000)
+
+    result = {
+        "orders": args.orders,
+        "symbols": args.symbols,
+        "ticks": args.ticks,
+        "triggered": triggered,
+        "load_ms": round(load_ms, 1),
+        "heap_us_per_tick": round(statistics.fmean(heap_samples), 2),
+        "scan_us_per_tick": round(statistics.fmean(scan_samples), 2),
+    }
+    assert triggered == scanned, (triggered, scanned)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(
+        f"{args.orders} orders on {args.symbols} symbols, {args.ticks} ticks triggering {triggered}: "
+        f"heaps {result['heap_us_per_tick']} us/tick, scan {result['scan_us_per_tick']} us/tick "
+        f"(book loaded in {result['load_ms']} ms)"
+    )
+
+
+if __name__ == "__main__":
+    main()
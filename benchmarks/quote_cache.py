@@ -0,0 +1,106 @@
+"""Count upstream quote calls as worker processes are added, with and without the shared cache.
+
+Usage: python benchmarks/quote_cache.py [--workers 1,2,4,8] [--symbols 20] [--rounds 5] [--latency-ms 20]
+
+Each worker is a separate process importing the app, like a gunicorn
+worker. All of them start together and look up the same ``--symbols``
+``--rounds`` times against the market simulator with ``--latency-ms`` of
+provider latency. With ``QUOTE_CACHE_PATH=off`` every worker fetches every
+symbol itself. With the shared cache, one worker per symbol fetches and the
+rest read its result.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def worker(barrier, results, symbols, rounds):
+    from app import app
+    from helpers import lookup
+    from providers import market_providers
+
+    market = market_providers()[0]
+    calls = []
+    quote = market.quote
+
+    def counted_quote(symbol):
+        calls.append(symbol)
+        return quote(symbol)
+
+    market.quote = counted_quote
+    with app.app_context():
+        barrier.wait()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for symbol in symbols:
+                assert lookup(symbol) is not None, symbol
+        results.put((len(calls), time.perf_counter() - started))
+
+
+def run(workers, cache_path, args):
+    os.environ["QUOTE_CACHE_PATH"] = cache_path
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    from providers.simulator import SimulatedMarket
+
+    symbols = SimulatedMarket().symbols[: args.symbols]
+    processes = [
+        context.Process(target=worker, args=(barrier, results, symbols, args.rounds)) for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return {
+        "workers": workers,
+        "shared_cache": cache_path != "off",
+        "upstream_calls": sum(calls for calls, _ in outcomes),
+        "lookups": workers * args.rounds * len(symbols),
+        "slowest_worker_s": round(max(elapsed for _, elapsed in outcomes), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--symbols", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--json", action="store_true", help="emit machine-readable output")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["MARKET_DATA_PROVIDER"] = "simulator"
+    os.environ["SIMULATOR_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["QUOTE_TTL"] = "3600"
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ["JINJA_CACHE_DIR"] = os.path.join(tmp, "jinja")
+        for count in [int(value) for value in args.workers.split(",")]:
+            results.append(run(count, "off", args))
+            results.append(run(count, os.path.join(tmp, f"quotes-{count}.db"), args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        label = "shared" if result["shared_cache"] else "per-worker"
+        print(
+            f"{result['workers']} workers, {label:>10}: {result['upstream_calls']} upstream calls "
+            f"for {result['lookups']} lookups, slowest worker {result['slowest_worker_s']} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Measure ``login_required`` request overhead for each session backend.
+
+Usage: python benchmarks/session_backends.py [--requests 2000]
+
+For every ``SESSION_BACKEND`` this builds a fresh app on a throwaway SQLite
+database, logs a user in, and times authenticated requests to a trivial
+``@login_required`` view through the test client. Full round-trip time is
+reported, so the backend's load/save cost is what differs between rows.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def benchmark(backend, tmp, count):
+    os.environ["SESSION_BACKEND"] = backend
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, backend + '.db')}"
+
+    from app import create_app
+    from extensions import db
+    from helpers import login_required
+
+    app = create_app()
+
+    @app.route("/_bench")
+    @login_required
+    def bench():
+        return "ok"
+
+    with app.app_context():
+        db.create_all()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = client.get("/_bench")
+        samples.append((time.perf_counter() - started) * 1e6)
+        assert response.status_code == 200, response.status_code
+
+    samples.sort()
+    return {
+        "backend": backend,
+        "median_us": round(statistics.median(samples), 1),
+        "p95_us": round(samples[int(len(samples) * 0.95) - 1], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--json", action="store_true", help="emit machine-readable output")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    with tempfile.TemporaryDirectory() as tmp:
+        # Flask-Session's filesystem store writes under the working directory.
+        os.chdir(tmp)
+        results = [benchmark(backend, tmp, args.requests) for backend in ("cookie", "sqlalchemy", "filesystem")]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print(f"{result['backend']:>10}: median {result['median_us']} us, p95 {result['p95_us']} us")
+
+
+if __name__ == "__main__":
+    main()
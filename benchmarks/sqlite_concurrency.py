@@ -0,0 +1,127 @@
+"""Compare SQLite read/write concurrency with default and tuned pragmas.
+
+Usage: python benchmarks/sqlite_concurrency.py [--seconds 5] [--readers 4] [--writers 2]
+
+Each run creates a throwaway database, then hammers it with reader threads
+(aggregate queries over ``trades``) and writer threads (single-row inserts,
+one commit each) for a fixed wall-clock window. It reports throughput and the
+number of ``database is locked`` failures for the stock configuration and for
+the pragmas installed by ``database.register_engine_hooks``. Both runs wait
+the same ``SQLITE_BUSY_TIMEOUT_MS`` for locks, so the comparison isolates
+the journal, sync and cache settings.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import register_engine_hooks, sqlite_pragmas  # noqa: E402
+
+
+def _seed(engine, rows):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE trades (id INTEGER PRIMARY KEY, user_id INTEGER, symbol TEXT, "
+            "shares INTEGER, price REAL)"
+        ))
+        conn.execute(
+            text("INSERT INTO trades (user_id, symbol, shares, price) VALUES (:u, :s, :n, :p)"),
+            [{"u": i % 100, "s": f"SYM{i % 50}", "n": 1 + i % 20, "p": 100.0 + i % 7} for i in range(rows)],
+        )
+
+
+def _run(engine, seconds, readers, writers):
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0, "read_errors": 0, "write_errors": 0}
+    lock = threading.Lock()
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def reader():
+        while not stop.is_set():
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text(
+                        "SELECT symbol, SUM(shares), SUM(shares * price) FROM trades "
+                        "WHERE user_id = :u GROUP BY symbol"
+                    ), {"u": counts["reads"] % 100}).all()
+                bump("reads")
+            except OperationalError:
+                bump("read_errors")
+
+    def writer():
+        while not stop.is_set():
+            try:
+                with engine.begin() as conn:
+                    conn.execute(
+                        text("INSERT INTO trades (user_id, symbol, shares, price) VALUES (1, 'AAPL', 1, 190.0)")
+                    )
+                bump("writes")
+            except OperationalError:
+                bump("write_errors")
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    counts["reads_per_sec"] = round(counts["reads"] / seconds, 1)
+    counts["writes_per_sec"] = round(counts["writes"] / seconds, 1)
+    return counts
+
+
+def benchmark(label, tuned, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(
+            f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            connect_args={"timeout": sqlite_pragmas()["busy_timeout"] / 1000},
+            pool_size=args.readers + args.writers,
+        )
+        if tuned:
+            register_engine_hooks(engine)
+        _seed(engine, args.rows)
+        result = _run(engine, args.seconds, args.readers, args.writers)
+        engine.dispose()
+    result["config"] = label
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--json", action="store_true", help="emit machine-readable output")
+    args = parser.parse_args()
+
+    results = [benchmark("default", False, args), benchmark("tuned", True, args)]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(
+            f"{result['config']:>8}: {result['reads_per_sec']:>9} reads/s "
+            f"{result['writes_per_sec']:>8} writes/s  "
+            f"locked errors: {result['read_errors']} read / {result['write_errors']} write"
+        )
+
+
+if __name__ == "__main__":
+    main()
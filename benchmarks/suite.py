@@ -0,0 +1,356 @@
+"""Benchmark the app's hot paths on a seeded database and a simulated market.
+
+Usage: python benchmarks/suite.py [--users 1000] [--trades 1000000]
+           [--only index,history,rebuild,trading,quote] [--db PATH] [--output results.json]
+
+Seeds SQLite with synthetic users and trades (deterministic for a given
+``--seed``), plus dedicated users for each scenario, then measures:
+
+- ``index``: ``GET /`` for users holding 5/50/200 positions
+- ``history``: ``GET /history`` for users with 100/1000/10000 trades
+- ``rebuild``: ``rebuild_lots`` plus ``rebuild_portfolios`` for one deep user and for everyone
+- ``trading``: buy/sell round trips from concurrent clients
+- ``quote``: ``GET /api/quote/<symbol>``, first (cold) and repeated (warm)
+
+Quotes come from the built-in market simulator, so nothing leaves the
+machine and prices are the same on every run. ``--provider-latency-ms``
+and ``--provider-error-rate`` inject slowness and failures into every
+provider call. Seeding 1M trades takes a while; ``--db`` keeps the seeded
+file so several commits can be compared on the same data. Results are
+written as JSON.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def summarize(samples_ms):
+    samples_ms = sorted(samples_ms)
+    return {
+        "n": len(samples_ms),
+        "median_ms": round(statistics.median(samples_ms), 3),
+        "p95_ms": round(samples_ms[max(int(len(samples_ms) * 0.95) - 1, 0)], 3),
+        "mean_ms": round(statistics.fmean(samples_ms), 3),
+    }
+
+
+def timed_requests(client, path, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path)
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, (path, response.status_code)
+    return summarize(samples)
+
+
+def logged_in_client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = user_id
+    return client
+
+
+def seed(args, pool):
+    from extensions import db
+    from lots import rebuild_lots
+    from models import Trade, User, rebuild_portfolios
+
+    rng = random.Random(args.seed)
+    users = User.__table__
+    trades = Trade.__table__
+    start = datetime(2020, 1, 1)
+
+    def add_user(username, cash=1_000_000_000.0):
+        return db.session.execute(users.insert().values(username=username, hash="!", cash=cash)).inserted_primary_key[0]
+
+    def insert_trades(rows):
+        for offset in range(0, len(rows), 50_000):
+            db.session.execute(trades.insert(), rows[offset:offset + 50_000])
+
+    per_user = max(args.trades // max(args.users, 1), 1)
+    rows = []
+    for number in range(args.users):
+        user_id = add_user(f"user{number:05d}")
+        universe = rng.sample(pool, 20)
+        held = {}
+        moment = start + timedelta(minutes=number)
+        for _ in range(per_user):
+            symbol = rng.choice(universe)
+            moment += timedelta(minutes=rng.randint(1, 240))
+            price = round(20 + sum(map(ord, symbol)) % 400 + rng.uniform(-5, 5), 2)
+            if held.get(symbol, 0) > 0 and rng.random() < 0.3:
+                shares = -rng.randint(1, held[symbol])
+            else:
+                shares = rng.randint(1, 20)
+            held[symbol] = held.get(symbol, 0) + shares
+            rows.append({"user_id": user_id, "symbol": symbol, "shares": shares, "price": price, "timestamp": moment})
+        if len(rows) >= 200_000:
+            insert_trades(rows)
+            rows = []
+
+    for count in args.holdings:
+        user_id = add_user(f"holdings{count}")
+        for index, symbol in enumerate(pool[:count]):
+            rows.append({"user_id": user_id, "symbol": symbol, "shares": 10, "price": 50.0, "timestamp": start + timedelta(hours=index)})
+    for depth in args.history_depths:
+        user_id = add_user(f"history{depth}")
+        for index in range(depth):
+            symbol = pool[index % 40]
+            shares = 5 if index % 3 else -1
+            rows.append({"user_id": user_id, "symbol": symbol, "shares": shares, "price": 40.0 + index % 50, "timestamp": start + timedelta(minutes=index)})
+    for number in range(args.clients):
+        user_id = add_user(f"trader{number}")
+        rows.append({"user_id": user_id, "symbol": pool[number], "shares": 1000, "price": 50.0, "timestamp": start})
+    add_user("quoter")
+    insert_trades(rows)
+
+    rebuild_lots()
+    rebuild_portfolios()
+    db.session.commit()
+
+
+def user_id_for(username):
+    from models import User
+
+    return User.query.filter_by(username=username).one().id
+
+
+def bench_index(app, args, market):
+    results = {}
+    for count in args.holdings:
+        with app.app_context():
+            user_id = user_id_for(f"holdings{count}")
+        client = logged_in_client(app, user_id)
+        client.get("/")
+        results[f"holdings_{count}"] = timed_requests(client, "/", args.repeat)
+    return results
+
+
+def bench_history(app, args, market):
+    results = {}
+    for depth in args.history_depths:
+        with app.app_context():
+            user_id = user_id_for(f"history{depth}")
+        client = logged_in_client(app, user_id)
+        results[f"trades_{depth}"] = timed_requests(client, "/history", args.repeat)
+    return results
+
+
+def bench_rebuild(app, args, market):
+    from extensions import db
+    from lots import rebuild_lots
+    from models import rebuild_portfolios
+
+    results = {}
+    with app.app_context():
+        deep_user = user_id_for(f"history{max(args.history_depths)}")
+        for label, user_id, repeat in (("single_user", deep_user, args.repeat), ("all_users", None, args.rebuild_all_repeat)):
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                rebuild_lots(user_id=user_id)
+                rebuild_portfolios(user_id=user_id)
+                db.session.flush()
+                samples.append((time.perf_counter() - started) * 1000)
+                db.session.rollback()
+            results[label] = summarize(samples)
+    return results
+
+
+def bench_trading(app, args, market):
+    with app.app_context():
+        clients = [
+            (logged_in_client(app, user_id_for(f"trader{number}")), market.symbols[number]) for number in range(args.clients)
+        ]
+    for client, symbol in clients:
+        client.post("/buy", data={"symbol": symbol, "shares": "1"})
+
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    def trade(client, symbol):
+        local = []
+        for operation in range(args.ops):
+            path = "/buy" if operation % 2 == 0 else "/sell"
+            started = time.perf_counter()
+            response = client.post(path, data={"symbol": symbol, "shares": "1"})
+            local.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 302:
+                failures.append((path, response.status_code))
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=trade, args=pair) for pair in clients]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "clients": args.clients,
+        "operations": len(latencies),
+        "failures": len(failures),
+        "ops_per_second": round(len(latencies) / elapsed, 1),
+        **summarize(latencies),
+    }
+
+
+def bench_quote(app, args, market):
+    with app.app_context():
+        client = logged_in_client(app, user_id_for("quoter"))
+    # Symbols nobody holds, so earlier scenarios have not looked them up.
+    symbols = market.symbols[-args.quote_symbols:]
+    calls = []
+    quote = market.quote
+
+    def counted_quote(symbol):
+        calls.append(symbol)
+        return quote(symbol)
+
+    market.quote = counted_quote
+    latency, market.latency = market.latency, args.quote_latency_ms / 1000
+    try:
+        results = {}
+        for label in ("cold", "warm"):
+            calls_before = len(calls)
+            samples = []
+            failures = 0
+            for symbol in symbols:
+                started = time.perf_counter()
+                response = client.get(f"/api/quote/{symbol}")
+                samples.append((time.perf_counter() - started) * 1000)
+                failures += response.status_code != 200
+            results[label] = {
+                **summarize(samples),
+                "failures": failures,
+                "provider_calls": len(calls) - calls_before,
+            }
+    finally:
+        del market.quote
+        market.latency = latency
+    return results
+
+
+SCENARIOS = {
+    "index": bench_index,
+    "history": bench_history,
+    "rebuild": bench_rebuild,
+    "trading": bench_trading,
+    "quote": bench_quote,
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def int_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--trades", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--holdings", type=int_list, default=[5, 50, 200])
+    parser.add_argument("--history-depths", type=int_list, default=[100, 1000, 10000])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=50, help="buy/sell requests per client")
+    parser.add_argument("--quote-symbols", type=int, default=50)
+    parser.add_argument("--quote-latency-ms", type=float, default=25.0)
+    parser.add_argument("--provider-latency-ms", type=float, default=0.0)
+    parser.add_argument("--provider-error-rate", type=float, default=0.0)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--rebuild-all-repeat", type=int, default=1)
+    parser.add_argument("--only", default=",".join(SCENARIOS), help="comma-separated scenarios")
+    parser.add_argument("--db", help="SQLite file to seed once and reuse across runs")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    scenarios = [name for name in args.only.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    os.environ["MARKET_DATA_PROVIDER"] = "simulator"
+    os.environ["SIMULATOR_SEED"] = str(args.seed)
+    os.environ["SIMULATOR_LATENCY_MS"] = str(args.provider_latency_ms)
+    os.environ["SIMULATOR_ERROR_RATE"] = str(args.provider_error_rate)
+    os.environ["GROQ_API_KEY"] = ""
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["PASSWORD_HASH_WORKERS"] = "0"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.abspath(args.db) if args.db else os.path.join(tmp, "suite.db")
+        fresh = not os.path.exists(db_path)
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ.setdefault("JINJA_CACHE_DIR", os.path.join(tmp, "jinja"))
+        os.environ.setdefault("PRICE_STORE_DIR", os.path.join(tmp, "prices"))
+        os.environ.setdefault("QUOTE_CACHE_PATH", os.path.join(tmp, "quotes.db"))
+
+        from app import create_app
+        from extensions import db
+        from providers import market_providers
+
+        app = create_app()
+        market = market_providers()[0]
+        pool = market.symbols[:500]
+        seed_seconds = None
+        if fresh:
+            started = time.perf_counter()
+            with app.app_context():
+                db.create_all()
+                seed(args, pool)
+            seed_seconds = round(time.perf_counter() - started, 2)
+
+        results = {}
+        for name in scenarios:
+            started = time.perf_counter()
+            results[name] = SCENARIOS[name](app, args, market)
+            print(f"{name}: done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "users": args.users,
+            "trades": args.trades,
+            "seed": args.seed,
+            "seed_seconds": seed_seconds,
+            "provider_latency_ms": args.provider_latency_ms,
+            "provider_error_rate": args.provider_error_rate,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
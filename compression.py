@@ -0,0 +1,167 @@
+import gzip
+import logging
+import mimetypes
+import os
+
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import with_appcontext
+from werkzeug.utils import safe_join
+
+try:
+    import brotli
+except ImportError:  # gzip still works; brotli is only preferred when installed
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = {
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+    "text/css",
+    "text/html",
+    "text/javascript",
+    "text/plain",
+}
+STATIC_SUFFIXES = (".css", ".js", ".svg", ".json", ".html", ".txt")
+ENCODED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def supported_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encodings):
+    """Pick ``br`` or ``gzip`` from an ``Accept-Encoding`` header, or None."""
+    best, best_quality = None, 0
+    for encoding in supported_encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding, level):
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def compress_response(response):
+    """Compress a buffered, compressible response for clients that accept it."""
+    config = current_app.config
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_TYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < config["COMPRESS_MIN_BYTES"]:
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    level = config["COMPRESS_BR_QUALITY"] if encoding == "br" else config["COMPRESS_GZIP_LEVEL"]
+    response.set_data(compress(data, encoding, level))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def precompress_static(static_folder):
+    """Write ``.br``/``.gz`` siblings for text assets that lack fresh ones.
+
+    Uses the highest levels since this runs once per deploy, not per request.
+    Returns the number of files written.
+    """
+    written = 0
+    for directory, _, names in os.walk(static_folder):
+        for name in names:
+            if not name.endswith(STATIC_SUFFIXES):
+                continue
+            path = os.path.join(directory, name)
+            data = None
+            for encoding in supported_encodings():
+                target = path + ENCODED_SUFFIXES[encoding]
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                    continue
+                if data is None:
+                    with open(path, "rb") as source:
+                        data = source.read()
+                # Workers booting together may race here; replace atomically so
+                # nobody serves a half-written file.
+                partial = f"{target}.{os.getpid()}.tmp"
+                with open(partial, "wb") as output:
+                    output.write(compress(data, encoding, 11 if encoding == "br" else 9))
+                os.replace(partial, target)
+                written += 1
+    return written
+
+
+def serve_static(filename):
+    """Static files, answered from a precompressed sibling when one is fresh."""
+    static_folder = current_app.static_folder
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is not None and filename.endswith(STATIC_SUFFIXES):
+        encoded = filename + ENCODED_SUFFIXES[encoding]
+        source = safe_join(static_folder, filename)
+        target = safe_join(static_folder, encoded)
+        if (
+            source is not None
+            and target is not None
+            and os.path.isfile(source)
+            and os.path.isfile(target)
+            and os.path.getmtime(target) >= os.path.getmtime(source)
+        ):
+            response = send_from_directory(
+                static_folder, encoded, mimetype=mimetypes.guess_type(filename)[0]
+            )
+            response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept-Encoding")
+            return response
+
+    response = current_app.send_static_file(filename)
+    if filename.endswith(STATIC_SUFFIXES):
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+def init_compression(app):
+    """Compress dynamic responses and serve precompressed static assets.
+
+    ``COMPRESS_MIN_BYTES`` (default 1024) skips bodies too small to benefit.
+    Dynamic responses use cheap levels (gzip 6, brotli 4) to keep CPU per
+    request low; static assets are compressed once at the highest levels,
+    at startup unless ``STATIC_PRECOMPRESS=0`` and by ``flask precompress-static``.
+    """
+    app.config["COMPRESS_MIN_BYTES"] = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+    app.config["COMPRESS_GZIP_LEVEL"] = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+    app.config["COMPRESS_BR_QUALITY"] = int(os.getenv("COMPRESS_BR_QUALITY", "4"))
+
+    app.after_request(compress_response)
+    app.view_functions["static"] = serve_static
+    app.cli.add_command(precompress_static_command)
+
+    if os.getenv("STATIC_PRECOMPRESS", "1") != "0":
+        try:
+            written = precompress_static(app.static_folder)
+        except OSError:
+            logger.warning("Could not precompress static files in %s", app.static_folder, exc_info=True)
+        else:
+            if written:
+                logger.info("Precompressed %s static files", written)
+
+
+@click.command("precompress-static")
+@with_appcontext
+def precompress_static_command():
+    """Write .br/.gz variants of static text assets."""
+    click.echo(f"Wrote {precompress_static(current_app.static_folder)} compressed files.")
@@ -0,0 +1,204 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+logger = logging.getLogger(__name__)
+
+SQLITE_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SQLITE_SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+REPLICA_BIND_KEY = "replica"
+PRIMARY_PIN_SESSION_KEY = "db_primary_until"
+
+
+def _env_int(name, default):
+    value = os.getenv(name, "").strip()
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning("Ignoring non-integer %s=%r, using %s", name, value, default)
+        return default
+
+
+def _env_choice(name, default, choices):
+    value = os.getenv(name, "").strip().upper()
+    if not value:
+        return default
+    if value not in choices:
+        logger.warning("Ignoring unsupported %s=%r, using %s", name, value, default)
+        return default
+    return value
+
+
+def resolve_database_uri(uri):
+    """Normalise a DATABASE_URL-style value for SQLAlchemy."""
+    if uri.startswith("postgres://"):
+        uri = uri.replace("postgres://", "postgresql://", 1)
+    return uri
+
+
+def sqlite_pragmas():
+    """PRAGMA values applied to every new SQLite connection.
+
+    WAL lets readers proceed while a writer holds the lock, busy_timeout makes
+    writers wait instead of failing with ``database is locked``, and
+    synchronous=NORMAL is durable under WAL without an fsync per commit.
+    A negative cache_size is in KiB, as SQLite expects.
+    """
+    return {
+        "journal_mode": _env_choice("SQLITE_JOURNAL_MODE", "WAL", SQLITE_JOURNAL_MODES),
+        "busy_timeout": _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000),
+        "synchronous": _env_choice("SQLITE_SYNCHRONOUS", "NORMAL", SQLITE_SYNCHRONOUS_MODES),
+        "cache_size": -_env_int("SQLITE_CACHE_SIZE_KB", 20000),
+    }
+
+
+def build_engine_options(uri):
+    """Return ``SQLALCHEMY_ENGINE_OPTIONS`` for the configured backend."""
+    backend = make_url(uri).get_backend_name()
+
+    if backend == "sqlite":
+        # SQLite tuning is per-connection PRAGMAs, see register_engine_hooks().
+        return {}
+
+    if backend == "postgresql":
+        options = {
+            "pool_size": _env_int("DB_POOL_SIZE", 5),
+            "max_overflow": _env_int("DB_MAX_OVERFLOW", 10),
+            "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+            "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+            "pool_pre_ping": True,
+        }
+        statement_timeout = _env_int("DB_STATEMENT_TIMEOUT_MS", 15000)
+        lock_timeout = _env_int("DB_LOCK_TIMEOUT_MS", 5000)
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={statement_timeout} -c lock_timeout={lock_timeout}",
+        }
+        return options
+
+    return {"pool_pre_ping": True}
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def register_engine_hooks(engine):
+    """Attach connect-time tuning to a freshly created engine."""
+    if engine.dialect.name == "sqlite" and engine.url.database not in (None, "", ":memory:"):
+        event.listen(engine, "connect", _apply_sqlite_pragmas)
+        logger.info("SQLite engine tuned with %s", sqlite_pragmas())
+
+
+def init_engine_tuning(app, db):
+    with app.app_context():
+        for engine in db.engines.values():
+            register_engine_hooks(engine)
+
+
+def build_replica_binds(read_uri):
+    """Return ``SQLALCHEMY_BINDS`` registering the read replica, if configured."""
+    if not read_uri:
+        return {}
+    read_uri = resolve_database_uri(read_uri)
+    return {REPLICA_BIND_KEY: {"url": read_uri, **build_engine_options(read_uri)}}
+
+
+def read_your_writes_window():
+    return _env_int("DB_READ_YOUR_WRITES_SECONDS", 10)
+
+
+class RoutingSession(Session):
+    """Session that sends reads from replica-routed requests to the read replica.
+
+    Everything else, including flushes, DML and any read issued after this
+    request has written, goes to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._routes_to_replica(clause):
+            replica = self._db.engines.get(REPLICA_BIND_KEY)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _routes_to_replica(self, clause):
+        if self._flushing or not has_request_context():
+            return False
+        if not g.get("db_read_replica") or g.get("db_wrote") or g.get("db_primary_reads"):
+            return False
+        return clause is not None and getattr(clause, "is_select", False)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_request_wrote(db_session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, even in a replica-routed view.
+
+    For code that reads rows and then rewrites them from what it read: a
+    lagging replica must never be the source of a write to the primary.
+    """
+    if not has_request_context():
+        yield
+        return
+    previous = g.get("db_primary_reads", False)
+    g.db_primary_reads = True
+    try:
+        yield
+    finally:
+        g.db_primary_reads = previous
+
+
+def read_replica(f=None, *, methods=None):
+    """Route the view's queries to the read replica.
+
+    ``methods`` limits routing to the given HTTP methods, so views that write
+    on POST can still read from the replica on GET. Users who wrote within
+    the last ``DB_READ_YOUR_WRITES_SECONDS`` stay on the primary.
+    """
+    def decorator(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            if methods is None or request.method in methods:
+                pinned_until = session.get(PRIMARY_PIN_SESSION_KEY, 0)
+                g.db_read_replica = pinned_until <= time.time()
+            return view(*args, **kwargs)
+
+        return decorated_function
+
+    if f is not None:
+        return decorator(f)
+    return decorator
+
+
+def pin_writers_to_primary(response):
+    """Keep a user on the primary for a short window after their own write."""
+    if g.get("db_wrote") and session.get("user_id") is not None:
+        session[PRIMARY_PIN_SESSION_KEY] = time.time() + read_your_writes_window()
+    return response
+
+
+def init_read_replica(app):
+    if REPLICA_BIND_KEY not in app.config.get("SQLALCHEMY_BINDS", {}):
+        return
+    app.after_request(pin_writers_to_primary)
+    logger.info("Read replica configured; read-only views will query it")
@@ -0,0 +1,71 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g
+
+
+_deadline = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The time budget ran out before an upstream call could answer."""
+
+
+def remaining():
+    """Seconds left in the current budget, or None when nothing is bounding this call."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired():
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def bounded(timeout):
+    """``timeout`` cut down to the budget left; raises ``DeadlineExceeded`` when none is."""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("request deadline passed")
+    return left if timeout is None else min(timeout, left)
+
+
+@contextmanager
+def deadline(seconds):
+    """Bound upstream calls in the block to ``seconds``, or less if an outer budget ends sooner."""
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    if outer is not None:
+        at = min(at, outer)
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def init_deadlines(app):
+    """Give every request ``REQUEST_DEADLINE_SECONDS`` (default 10) for its upstream calls.
+
+    Provider HTTP timeouts, rate-limit waits and shared-cache waits are all
+    cut to what is left, so one slow provider cannot hold a worker for
+    longer than that. ``0`` turns the budget off.
+    """
+    seconds = float(os.getenv("REQUEST_DEADLINE_SECONDS", "10"))
+    if seconds <= 0:
+        return
+
+    @app.before_request
+    def start_deadline():
+        g.deadline_token = _deadline.set(time.monotonic() + seconds)
+
+    @app.teardown_request
+    def clear_deadline(exc):
+        if g.pop("deadline_token", None) is not None:
+            _deadline.set(None)
@@ -1,10 +1,24 @@
-from flask_migrate import Migrate
+import click
 from flask_moment import Moment
 from flask_session import Session
 from flask_sqlalchemy import SQLAlchemy
 
+from database import RoutingSession
 
-db = SQLAlchemy()
-migrate = Migrate(compare_type=True)
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 moment = Moment()
 sess = Session()
+
+
+def init_migrate(app):
+    """Attach Flask-Migrate when running under the ``flask`` CLI.
+
+    Flask-Migrate imports alembic (and mako) up front, about a sixth of boot
+    time, and only ``flask db ...`` needs it, so web workers skip it.
+    """
+    if click.get_current_context(silent=True) is None:
+        return None
+    from flask_migrate import Migrate
+
+    return Migrate(app, db, compare_type=True)
@@ -0,0 +1,74 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from flask import render_template
+from markupsafe import Markup
+
+from metrics import register_collector
+
+
+logger = logging.getLogger(__name__)
+
+
+class FragmentCache:
+    """Rendered template fragments in an LRU keyed by the version of their data.
+
+    Keys must change whenever the fragment's inputs change (a snapshot
+    timestamp, a digest of the rows shown), so entries never need
+    invalidating; stale ones simply age out. ``max_entries=0`` disables it.
+    """
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, key, template_name, **context):
+        cache_key = (template_name, key)
+        with self._lock:
+            html = self._entries.get(cache_key)
+            if html is not None:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        html = Markup(render_template(template_name, **context))
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[cache_key] = html
+                self._entries.move_to_end(cache_key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return html
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+fragment_cache = FragmentCache(int(os.getenv("FRAGMENT_CACHE_SIZE", "2048")))
+
+
+def _expose_stats():
+    stats = fragment_cache.stats()
+    return [
+        "# HELP fragment_cache_requests_total Dashboard fragment lookups by result.",
+        "# TYPE fragment_cache_requests_total counter",
+        f'fragment_cache_requests_total{{result="hit"}} {stats["hits"]}',
+        f'fragment_cache_requests_total{{result="miss"}} {stats["misses"]}',
+        "# HELP fragment_cache_entries Rendered fragments currently cached.",
+        "# TYPE fragment_cache_entries gauge",
+        f"fragment_cache_entries {stats['entries']}",
+    ]
+
+
+register_collector(_expose_stats)
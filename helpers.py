@@ -1,13 +1,19 @@
 import os
 import logging
 import re
-import requests
+import time
 from functools import wraps
-from flask import render_template, session, redirect, flash
+from flask import abort, render_template, session, redirect, flash, has_request_context
 
 from dotenv import load_dotenv
 import json
 
+from deadlines import DeadlineExceeded, bounded, expired, remaining
+from metrics import upstream_timer
+from providers import ProviderError, market_providers
+from quote_cache import quote_cache
+from rate_limits import ProviderBusy, current_priority, scheduler
+
 # Load environment variables from the .env file
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -18,6 +24,34 @@ def _env(name):
     return value.strip()
 
 
+def _http(provider, method, url, **kwargs):
+    """Make an outbound call within ``provider``'s rate limit, timed for /metrics.
+
+    Raises ``ProviderBusy`` when no quota frees up in time, so callers can
+    fall through to the next provider, and ``DeadlineExceeded`` when the
+    request's budget runs out first; the HTTP timeout never outlasts it.
+    """
+    # Imported here so workers and CLI commands that never call out don't
+    # pay for requests (and urllib3) at boot.
+    import requests
+
+    if expired():
+        raise DeadlineExceeded(f"no time left to call {provider}")
+    if not scheduler.acquire(provider, current_priority(), max_wait=remaining()):
+        raise ProviderBusy(provider)
+    kwargs["timeout"] = bounded(kwargs.get("timeout"))
+    with upstream_timer(provider):
+        try:
+            response = requests.request(method, url, **kwargs)
+        except requests.Timeout:
+            if expired():
+                raise DeadlineExceeded(f"{provider} did not answer within the request deadline") from None
+            raise
+    if response.status_code == 429:
+        scheduler.exhausted(provider)
+    return response
+
+
 def apology(message, code=400):
     """Render message as an apology to user."""
     def escape(s):
@@ -50,108 +84,126 @@ def login_required(f):
     return decorated_function
 
 
-def lookup(symbol):
+def admin_usernames():
+    return {name.strip().lower() for name in _env("ADMIN_USERNAMES").split(",") if name.strip()}
+
+
+def is_admin():
+    """True when the signed-in user is listed in ``ADMIN_USERNAMES``."""
+    user_id = session.get("user_id")
+    admins = admin_usernames()
+    if user_id is None or not admins:
+        return False
+    from extensions import db
+    from models import User
+
+    user = db.session.get(User, user_id)
+    return user is not None and user.username.lower() in admins
+
+
+def admin_required(f):
+    """Decorate internal routes; anyone else gets a 404."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not is_admin():
+            abort(404)
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
+_price_listeners = []
 
-    """Lookup stock symbol using multiple free APIs as fallbacks."""
-    
-    # Try Finnhub API first (best free API for stocks)
-    finnhub_key = _env("FINNHUB_API_KEY")
-    if finnhub_key:
+
+def add_price_listener(listener):
+    """Call ``listener(symbol, price)`` with every quote ``lookup()`` returns."""
+    _price_listeners.append(listener)
+
+
+def _ask_providers(method, *args, describe):
+    """Return the first non-empty answer from the configured market-data backends."""
+    for provider in market_providers():
         try:
-            # Get current price
-            price_url = f"https://finnhub.io/api/v1/quote?symbol={symbol}&token={finnhub_key}"
-            price_response = requests.get(price_url, timeout=10).json()
-            
-            # Get company profile for name
-            profile_url = f"https://finnhub.io/api/v1/stock/profile2?symbol={symbol}&token={finnhub_key}"
-            profile_response = requests.get(profile_url, timeout=10).json()
-            
-            if price_response.get("c") and price_response.get("c") > 0:  # 'c' is current price
-                return {
-                    "symbol": symbol.upper(),
-                    "name": profile_response.get("name", symbol.upper()),
-                    "price": float(price_response["c"])
-                }
+            answer = getattr(provider, method)(*args)
+        except DeadlineExceeded:
+            logger.info("%s %s for %s ran out of time", provider.name, method, describe)
+            return None
+        except (ProviderError, ProviderBusy) as exc:
+            logger.warning("%s %s failed for %s: %s", provider.name, method, describe, exc)
+            continue
         except Exception:
-            logger.exception("Finnhub API lookup failed for symbol %s", symbol)
+            logger.exception("%s %s failed for %s", provider.name, method, describe)
+            continue
+        if answer:
+            return answer
+    return None
+
+
+def _quote_key(symbol):
+    return f"quote:{symbol.upper()}"
+
+
+def _cached_quote(symbol):
+    ttl = float(os.getenv("QUOTE_TTL", "15"))
+    _, quote = quote_cache.get(_quote_key(symbol), ttl, lambda: _ask_providers("quote", symbol, describe=symbol))
+    return quote
+
 
-    # Try Alpha Vantage API as fallback
-    alpha_vantage_key = _env("ALPHA_VANTAGE_API_KEY")
-    if alpha_vantage_key:
+def _publish_price(quote):
+    for listener in _price_listeners:
         try:
-            url = f"https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey={alpha_vantage_key}"
-            response = requests.get(url, timeout=10).json()
-            
-            if "Global Quote" in response and response["Global Quote"]:
-                quote = response["Global Quote"]
-                price = float(quote["05. price"])
-                
-                return {
-                    "symbol": symbol.upper(),
-                    "name": symbol.upper(),  # Alpha Vantage doesn't provide company name in this endpoint
-                    "price": price
-                }
+            listener(quote["symbol"], quote["price"])
         except Exception:
-            logger.exception("Alpha Vantage lookup failed for symbol %s", symbol)
-    
-    # Try Yahoo Finance alternative (via yfinance-like API)
-    try:
-        # Using a free Yahoo Finance API alternative
-        url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10).json()
-        
-        if response.get("chart") and response["chart"]["result"]:
-            result = response["chart"]["result"][0]
-            price = result["meta"]["regularMarketPrice"]
-            name = result["meta"].get("longName", symbol.upper())
-            
-            return {
-                "symbol": symbol.upper(),
-                "name": name,
-                "price": float(price)
-            }
-    except Exception:
-        logger.exception("Yahoo Finance lookup failed for symbol %s", symbol)
+            logger.exception("Price listener failed for %s", quote["symbol"])
 
-    # If all APIs fail, return None
-    flash(f"Unable to fetch data for symbol {symbol}. Please try again later.")
-    return None
+
+def lookup(symbol):
+    """Lookup stock symbol using the configured market-data providers.
+
+    Quotes are shared by the workers on this host for ``QUOTE_TTL`` seconds
+    (default 15), so each symbol is fetched once per TTL, not once per worker.
+    """
+    quote = _cached_quote(symbol)
+    if quote is None:
+        if has_request_context():
+            flash(f"Unable to fetch data for symbol {symbol}. Please try again later.")
+        return None
+    _publish_price(quote)
+    return quote
+
+
+def lookup_within_deadline(symbols):
+    """Quote ``symbols`` while the deadline allows, then fall back to the last known prices.
+
+    Returns ``{symbol: (quote, stale_since)}``. ``stale_since`` is None for
+    a current quote and the epoch time the quote was fetched for a fallback
+    from the shared cache; symbols with neither map to ``(None, None)``.
+    Nothing is flashed, so callers decide how to show the gaps.
+    """
+    quotes = {}
+    for symbol in symbols:
+        quote = None if expired() else _cached_quote(symbol)
+        if quote is not None:
+            _publish_price(quote)
+            quotes[symbol] = (quote, None)
+            continue
+        fetched_at, quote = quote_cache.peek(_quote_key(symbol))
+        quotes[symbol] = (quote, fetched_at if quote is not None else None)
+    return quotes
+
+
+def get_price_history(symbol, start=None):
+    """Get daily OHLCV bars since ``start`` (epoch seconds).
+
+    Returns a list of ``(ts, open, high, low, close, volume)`` tuples with
+    ``ts`` at the start of each bar's UTC day; bars with gaps are skipped.
+    """
+    return _ask_providers("history", symbol, start, describe=symbol) or []
 
 
 def get_stock_suggestions(query):
-    """Get stock symbol suggestions using multiple APIs."""
-    suggestions = []
-    
-    # Try Finnhub symbol search first
-    finnhub_key = _env("FINNHUB_API_KEY")
-    if finnhub_key:
-        try:
-            url = f"https://finnhub.io/api/v1/search?q={query}&token={finnhub_key}"
-            response = requests.get(url, timeout=5).json()
-            
-            if response.get("result"):
-                suggestions = [item["symbol"] for item in response["result"][:10]]
-                return suggestions
-        except Exception:
-            logger.exception("Finnhub symbol search failed for query %s", query)
-    
-    # Try Alpha Vantage as fallback
-    alpha_vantage_key = _env("ALPHA_VANTAGE_API_KEY")
-    if alpha_vantage_key:
-        try:
-            url = f"https://www.alphavantage.co/query?function=SYMBOL_SEARCH&keywords={query}&apikey={alpha_vantage_key}"
-            response = requests.get(url, timeout=5).json()
-            
-            if "bestMatches" in response:
-                suggestions = [match['1. symbol'] for match in response['bestMatches'][:10]]
-                return suggestions
-        except Exception:
-            logger.exception("Alpha Vantage symbol search failed for query %s", query)
-    
-    return suggestions
+    """Get stock symbol suggestions using the configured providers."""
+    return _ask_providers("search", query, describe=query) or []
 
 
 def _format_market_context(market_context):
@@ -268,7 +320,6 @@ def _rule_based_finance_response(message, portfolio_context=None, market_context
 
 def get_finance_response(message, portfolio_context=None, market_context=None):
     """Generate finance-related responses using AI with a strong local fallback."""
-
     groq_key = _env("GROQ_API_KEY")
     if groq_key:
         try:
@@ -304,7 +355,9 @@ def get_finance_response(message, portfolio_context=None, market_context=None):
                 "temperature": 0.4,
             }
 
-            response = requests.post(
+            response = _http(
+                "groq",
+                "POST",
                 "https://api.groq.com/openai/v1/chat/completions",
                 headers=headers,
                 json=payload,
@@ -329,38 +382,28 @@ def usd(value):
 
 def get_market_data():
     """Get basic market data for major indices."""
-    try:
-        # Using a free financial API for market data
-        indices = ["^GSPC", "^IXIC", "^DJI"]  # S&P 500, NASDAQ, DOW
-        market_data = {}
-        
-        for index in indices:
-            try:
-                url = f"https://query1.finance.yahoo.com/v8/finance/chart/{index}"
-                headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-                response = requests.get(url, headers=headers, timeout=5).json()
-                
-                if response.get("chart") and response["chart"]["result"]:
-                    result = response["chart"]["result"][0]
-                    current_price = result["meta"]["regularMarketPrice"]
-                    previous_close = result["meta"]["previousClose"]
-                    change = current_price - previous_close
-                    change_percent = (change / previous_close) * 100
-                    
-                    name_map = {
-                        "^GSPC": "S&P 500",
-                        "^IXIC": "NASDAQ",
-                        "^DJI": "DOW"
-                    }
-                    
-                    market_data[name_map[index]] = {
-                        "price": current_price,
-                        "change": change,
-                        "change_percent": change_percent
-                    }
-            except:
-                continue
-                
-        return market_data
-    except:
-        return {}
+    return _ask_providers("indices", describe="market indices") or {}
+
+
+_market_snapshot = (None, {})
+
+
+def market_snapshot():
+    """Return ``(fetched_at, data)`` for the index strip, shared by every user.
+
+    Index quotes are refetched at most every ``MARKET_DATA_TTL`` seconds
+    (default 60) by one worker on the host and shared through the quote cache;
+    ``fetched_at`` identifies the snapshot, so it also works as the version
+    key for anything rendered from it, in every worker.
+    """
+    global _market_snapshot
+    fetched_at, data = _market_snapshot
+    ttl = float(os.getenv("MARKET_DATA_TTL", "60"))
+    if fetched_at is None or time.time() - fetched_at >= ttl:
+        shared_at, fresh = quote_cache.get("market:indices", ttl, lambda: get_market_data() or None)
+        if fresh:
+            _market_snapshot = (shared_at, fresh)
+        elif fetched_at is None:
+            _market_snapshot = (time.time(), {})
+        fetched_at, data = _market_snapshot
+    return fetched_at, data
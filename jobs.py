@@ -0,0 +1,425 @@
+import hashlib
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from helpers import lookup
+from lots import rebuild_lots
+from models import Job, Portfolio, Trade, rebuild_portfolios
+from price_store import backfill
+from valuation import snapshot_portfolio_values
+
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+_handlers = {}
+
+
+class LeaseLost(Exception):
+    """Another worker took the job over after our lease expired; stop working on it."""
+
+
+def visibility_timeout():
+    return float(os.getenv("JOB_VISIBILITY_SECONDS", "300"))
+
+
+def retry_delay(attempts):
+    """Exponential backoff from ``JOB_RETRY_SECONDS`` (default 30) after each failed attempt."""
+    return float(os.getenv("JOB_RETRY_SECONDS", "30")) * 2 ** max(attempts - 1, 0)
+
+
+def job(kind):
+    """Register the decorated function as the handler for jobs of ``kind``.
+
+    Handlers are called as ``handler(context, **payload)`` and return a
+    JSON-serialisable result. Work should be committed in chunks with
+    ``context.progress()`` between them, since a job can be retried.
+    """
+
+    def register(handler):
+        _handlers[kind] = handler
+        return handler
+
+    return register
+
+
+def _dedupe_key(kind, payload):
+    canonical = json.dumps([kind, payload], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def enqueue(kind, payload=None, priority=0, delay=0, max_attempts=None):
+    """Queue a ``kind`` job with ``payload`` and return its id; commits.
+
+    A job of the same kind and payload that is still waiting is returned
+    instead of a duplicate, raised to ``priority`` if that is higher.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind {kind!r}")
+    payload = payload or {}
+    key = _dedupe_key(kind, payload)
+    jobs = Job.__table__
+
+    def waiting():
+        return db.session.execute(
+            select(jobs.c.id, jobs.c.priority).where(jobs.c.dedupe_key == key, jobs.c.status == QUEUED)
+        ).first()
+
+    existing = waiting()
+    if existing is None:
+        new_job = Job(
+            kind=kind,
+            payload=json.dumps(payload, sort_keys=True, default=str),
+            dedupe_key=key,
+            priority=priority,
+            status=QUEUED,
+            max_attempts=max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+            run_at=datetime.utcnow() + timedelta(seconds=delay),
+        )
+        db.session.add(new_job)
+        try:
+            db.session.commit()
+            logger.info("Queued job %s: %s %s", new_job.id, kind, payload)
+            return new_job.id
+        except IntegrityError:
+            # Another process queued the same job between our read and insert.
+            db.session.rollback()
+            existing = waiting()
+            if existing is None:
+                raise
+    if priority > existing.priority:
+        db.session.execute(update(jobs).where(jobs.c.id == existing.id).values(priority=priority))
+    db.session.commit()
+    return existing.id
+
+
+def job_status(job):
+    """A job as a plain dict for JSON responses and the CLI."""
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "payload": json.loads(job.payload),
+        "status": job.status,
+        "priority": job.priority,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "progress": round(job.progress, 4),
+        "progress_note": job.progress_note,
+        "result": json.loads(job.result) if job.result else None,
+        "last_error": job.last_error,
+        "created_at": job.created_at.isoformat(),
+        "run_at": job.run_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def recent_jobs(status=None, limit=50):
+    query = Job.query
+    if status:
+        query = query.filter_by(status=status)
+    return query.order_by(Job.id.desc()).limit(limit).all()
+
+
+def claim(owner, kinds=None):
+    """Lease the most urgent runnable job to ``owner`` and return it, or None.
+
+    Runnable means queued and due, or running on a lease that expired
+    (its worker died) with attempts left. The lease is a conditional
+    ``UPDATE``, so when workers race for the same row only one wins and the
+    others move on to the next candidate.
+    """
+    jobs = Job.__table__
+    now = datetime.utcnow()
+    runnable = or_(
+        and_(jobs.c.status == QUEUED, jobs.c.run_at <= now),
+        and_(jobs.c.status == RUNNING, jobs.c.lease_expires_at < now, jobs.c.attempts < jobs.c.max_attempts),
+    )
+    query = select(jobs.c.id).where(runnable)
+    if kinds:
+        query = query.where(jobs.c.kind.in_(kinds))
+    candidates = db.session.execute(
+        query.order_by(jobs.c.priority.desc(), jobs.c.run_at.asc(), jobs.c.id.asc()).limit(5)
+    ).scalars().all()
+    for job_id in candidates:
+        claimed = db.session.execute(
+            update(jobs)
+            .where(jobs.c.id == job_id, runnable)
+            .values(
+                status=RUNNING,
+                lease_owner=owner,
+                lease_expires_at=now + timedelta(seconds=visibility_timeout()),
+                attempts=jobs.c.attempts + 1,
+                started_at=now,
+                progress=0.0,
+                progress_note=None,
+            )
+        ).rowcount
+        db.session.commit()
+        if claimed == 1:
+            return db.session.get(Job, job_id)
+    return None
+
+
+def reap_expired():
+    """Fail running jobs whose lease expired on their last attempt."""
+    jobs = Job.__table__
+    now = datetime.utcnow()
+    failed = db.session.execute(
+        update(jobs)
+        .where(jobs.c.status == RUNNING, jobs.c.lease_expires_at < now, jobs.c.attempts >= jobs.c.max_attempts)
+        .values(
+            status=FAILED,
+            finished_at=now,
+            lease_owner=None,
+            lease_expires_at=None,
+            last_error="Worker lease expired on the last attempt",
+        )
+    ).rowcount
+    db.session.commit()
+    if failed:
+        logger.warning("Failed %s jobs whose workers stopped responding", failed)
+    return failed
+
+
+def _touch(engine, job_id, owner, **values):
+    # Written on a connection of its own so progress is visible while the
+    # handler's transaction is still open.
+    jobs = Job.__table__
+    values["lease_expires_at"] = datetime.utcnow() + timedelta(seconds=visibility_timeout())
+    with engine.begin() as connection:
+        touched = connection.execute(
+            update(jobs).where(jobs.c.id == job_id, jobs.c.lease_owner == owner, jobs.c.status == RUNNING).values(**values)
+        ).rowcount
+    if touched != 1:
+        raise LeaseLost(f"job {job_id} is no longer leased to {owner}")
+
+
+class JobContext:
+    """What a handler gets besides its payload: the job id and progress reporting."""
+
+    def __init__(self, job_id, owner, attempt, engine):
+        self.job_id = job_id
+        self.owner = owner
+        self.attempt = attempt
+        self._engine = engine
+
+    def progress(self, done, total=None, note=None):
+        """Record ``done / total`` (or ``done`` as a fraction) and extend the lease.
+
+        Raises ``LeaseLost`` when the job was handed to another worker.
+        """
+        fraction = done / total if total else done
+        self._touch(progress=min(max(float(fraction), 0.0), 1.0), progress_note=note[:200] if note else None)
+
+    def _touch(self, **values):
+        _touch(self._engine, self.job_id, self.owner, **values)
+
+
+def _heartbeat(context, stop):
+    interval = visibility_timeout() / 3
+    while not stop.wait(interval):
+        try:
+            context._touch()
+        except LeaseLost:
+            return
+        except Exception:
+            logger.warning("Could not extend the lease on job %s", context.job_id, exc_info=True)
+
+
+def _finish(job_id, owner, **values):
+    jobs = Job.__table__
+    values.setdefault("finished_at", datetime.utcnow())
+    finished = db.session.execute(
+        update(jobs)
+        .where(jobs.c.id == job_id, jobs.c.lease_owner == owner, jobs.c.status == RUNNING)
+        .values(lease_owner=None, lease_expires_at=None, **values)
+    ).rowcount
+    db.session.commit()
+    return finished == 1
+
+
+def run_job(job, owner):
+    """Run one claimed job to completion, a scheduled retry, or failure."""
+    handler = _handlers.get(job.kind)
+    job_id, kind, attempts, max_attempts = job.id, job.kind, job.attempts, job.max_attempts
+    if handler is None:
+        _finish(job_id, owner, status=FAILED, last_error=f"No handler for job kind {kind!r}")
+        logger.error("Job %s has unknown kind %s", job_id, kind)
+        return
+
+    context = JobContext(job_id, owner, attempts, db.engine)
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(context, stop), name=f"job-{job_id}-lease", daemon=True)
+    heartbeat.start()
+    logger.info("Running job %s (%s), attempt %s of %s", job_id, kind, attempts, max_attempts)
+    try:
+        result = handler(context, **json.loads(job.payload))
+    except LeaseLost:
+        db.session.rollback()
+        logger.warning("Abandoning job %s: its lease moved to another worker", job_id)
+        return
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc(limit=20)
+        if attempts < max_attempts:
+            delay = retry_delay(attempts)
+            try:
+                _finish(
+                    job_id,
+                    owner,
+                    status=QUEUED,
+                    finished_at=None,
+                    run_at=datetime.utcnow() + timedelta(seconds=delay),
+                    last_error=error,
+                )
+            except IntegrityError:
+                # An identical job was queued while this one ran; let that one cover it.
+                db.session.rollback()
+                _finish(job_id, owner, status=CANCELLED, last_error=error + "\nSuperseded by an identical queued job")
+            logger.warning("Job %s (%s) failed; retrying in %.0fs", job_id, kind, delay, exc_info=True)
+        else:
+            _finish(job_id, owner, status=FAILED, last_error=error)
+            logger.error("Job %s (%s) failed after %s attempts", job_id, kind, attempts, exc_info=True)
+        return
+    finally:
+        stop.set()
+
+    # Anything the handler left uncommitted lands together with the result.
+    if _finish(job_id, owner, status=DONE, progress=1.0, result=json.dumps(result, default=str)):
+        logger.info("Finished job %s (%s): %s", job_id, kind, result)
+    else:
+        logger.warning("Job %s finished after its lease moved to another worker", job_id)
+
+
+def run_worker(kinds=None, burst=False, poll=None):
+    """Claim and run jobs until SIGTERM/SIGINT, or until the queue is empty with ``burst``."""
+    owner = f"{socket.gethostname()}:{os.getpid()}"[:80]
+    poll = poll if poll is not None else float(os.getenv("JOB_POLL_SECONDS", "2"))
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        logger.info("Worker %s stopping after the current job", owner)
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info("Worker %s started for %s", owner, ", ".join(kinds) if kinds else "all job kinds")
+    processed = 0
+    while not stopping.is_set():
+        try:
+            reap_expired()
+            job = claim(owner, kinds)
+            if job is not None:
+                run_job(job, owner)
+                processed += 1
+        except Exception:
+            logger.exception("Worker %s could not reach the job queue", owner)
+            db.session.rollback()
+            job = None
+        finally:
+            db.session.remove()
+        if job is None:
+            if burst:
+                break
+            stopping.wait(poll)
+    return processed
+
+
+@job("rebuild_portfolios")
+def rebuild_portfolios_job(context, user_id=None):
+    """Replay trades into positions and lots, one user per transaction."""
+    if user_id is not None:
+        user_ids = [user_id]
+    else:
+        trades = Trade.__table__
+        user_ids = db.session.execute(select(trades.c.user_id).distinct().order_by(trades.c.user_id)).scalars().all()
+    for index, current in enumerate(user_ids, start=1):
+        rebuild_lots(user_id=current)
+        rebuild_portfolios(user_id=current)
+        db.session.commit()
+        context.progress(index, len(user_ids), note=f"user {current}")
+    return {"users": len(user_ids)}
+
+
+@job("snapshot_values")
+def snapshot_values_job(context):
+    count = snapshot_portfolio_values()
+    return {"valuations": count}
+
+
+def _held_symbols():
+    portfolios = Portfolio.__table__
+    return db.session.execute(select(portfolios.c.symbol).distinct().order_by(portfolios.c.symbol)).scalars().all()
+
+
+@job("backfill_prices")
+def backfill_prices_job(context, symbols=None):
+    symbols = symbols or _held_symbols()
+    total = 0
+    for index, symbol in enumerate(symbols, start=1):
+        total += backfill(symbol)
+        context.progress(index, len(symbols), note=symbol)
+    return {"symbols": len(symbols), "bars": total}
+
+
+@job("warm_quotes")
+def warm_quotes_job(context, symbols=None):
+    """Fetch every held symbol into the shared quote cache ahead of the day's traffic."""
+    symbols = symbols or _held_symbols()
+    quoted = 0
+    for index, symbol in enumerate(symbols, start=1):
+        if lookup(symbol) is not None:
+            quoted += 1
+        context.progress(index, len(symbols), note=symbol)
+    return {"symbols": len(symbols), "quoted": quoted}
+
+
+@click.command("worker")
+@click.option("--kind", "kinds", multiple=True, help="Only run jobs of this kind (repeatable).")
+@click.option("--burst", is_flag=True, help="Exit once no job is runnable instead of polling.")
+@with_appcontext
+def worker_command(kinds, burst):
+    """Run queued background jobs. Start one per process you want working."""
+    processed = run_worker(kinds=list(kinds) or None, burst=burst)
+    click.echo(f"Processed {processed} jobs.")
+
+
+@click.command("enqueue")
+@click.argument("kind")
+@click.argument("params", nargs=-1)
+@click.option("--priority", type=int, default=0, help="Higher runs first.")
+@with_appcontext
+def enqueue_command(kind, params, priority):
+    """Queue a KIND job with key=value PARAMS (values are read as JSON when they parse)."""
+    payload = {}
+    for param in params:
+        name, separator, value = param.partition("=")
+        if not separator:
+            raise click.BadParameter(f"expected key=value, got {param!r}")
+        try:
+            payload[name] = json.loads(value)
+        except ValueError:
+            payload[name] = value
+    try:
+        job_id = enqueue(kind, payload, priority=priority)
+    except ValueError as exc:
+        raise click.ClickException(f"{exc}; known kinds: {', '.join(sorted(_handlers))}")
+    click.echo(f"Queued job {job_id}.")
@@ -0,0 +1,302 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from sortedcontainers import SortedList
+from flask import current_app
+from sqlalchemy import func, select
+
+from extensions import db
+from models import Portfolio, Trade, User
+
+
+logger = logging.getLogger(__name__)
+
+INCREMENTAL_SYMBOL_LIMIT = 16
+
+
+class Leaderboard:
+    """Account values for every user, ranked, kept up to date incrementally.
+
+    Holdings form a sparse users x symbols matrix stored in coordinate form:
+    each open position owns a slot in parallel ``rows``/``cols``/``shares``/
+    ``cost`` arrays, and ``(row, col) -> slot`` finds it for updates. A price
+    change revalues every account with one ``np.bincount`` over the slots.
+    Positions without a known price count at cost basis. Ranks are kept in a
+    ``SortedList`` of ``(-value, user_id)``, so top-K reads cost O(K + log n)
+    and a single user's rank costs O(log n).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded_at = None
+        self._reset()
+
+    def _reset(self):
+        self._user_rows = {}
+        self._user_ids = np.zeros(0, dtype=np.int64)
+        self._cash = np.zeros(0)
+        self._values = np.zeros(0)
+        self._symbol_cols = {}
+        self._prices = np.zeros(0)
+        self._slots = {}
+        self._free_slots = []
+        self._slot_count = 0
+        self._rows = np.zeros(0, dtype=np.int64)
+        self._cols = np.zeros(0, dtype=np.int64)
+        self._shares = np.zeros(0)
+        self._cost = np.zeros(0)
+        self._live = np.zeros(0, dtype=bool)
+        self._ranking = SortedList()
+
+    @staticmethod
+    def _grow(array, size, fill=0):
+        if size <= len(array):
+            return array
+        grown = np.full(max(size, 2 * len(array), 16), fill, dtype=array.dtype)
+        grown[: len(array)] = array
+        return grown
+
+    def _row(self, user_id, cash=0.0):
+        row = self._user_rows.get(user_id)
+        if row is None:
+            row = len(self._user_rows)
+            self._user_rows[user_id] = row
+            self._user_ids = self._grow(self._user_ids, row + 1)
+            self._cash = self._grow(self._cash, row + 1)
+            self._values = self._grow(self._values, row + 1)
+            self._user_ids[row] = user_id
+            self._cash[row] = cash
+            self._values[row] = cash
+            self._ranking.add((-cash, user_id))
+        return row
+
+    def _col(self, symbol):
+        col = self._symbol_cols.get(symbol)
+        if col is None:
+            col = len(self._symbol_cols)
+            self._symbol_cols[symbol] = col
+            self._prices = self._grow(self._prices, col + 1, fill=np.nan)
+        return col
+
+    def _slot(self, row, col):
+        slot = self._slots.get((row, col))
+        if slot is None:
+            if self._free_slots:
+                slot = self._free_slots.pop()
+            else:
+                slot = self._slot_count
+                self._slot_count += 1
+                for name in ("_rows", "_cols", "_shares", "_cost", "_live"):
+                    setattr(self, name, self._grow(getattr(self, name), self._slot_count))
+            self._slots[(row, col)] = slot
+            self._live[slot] = True
+            self._rows[slot] = row
+            self._cols[slot] = col
+            self._shares[slot] = 0
+            self._cost[slot] = 0.0
+        return slot
+
+    def _position_value(self, slot):
+        price = self._prices[self._cols[slot]]
+        return self._cost[slot] if np.isnan(price) else self._shares[slot] * price
+
+    def _set_value(self, row, value):
+        user_id = int(self._user_ids[row])
+        self._ranking.discard((-self._values[row], user_id))
+        self._values[row] = value
+        self._ranking.add((-value, user_id))
+
+    def load(self, holdings, cash_by_user, prices):
+        """Replace the state with ``(user_id, symbol, shares, cost)`` holdings."""
+        with self._lock:
+            self._reset()
+            for user_id, cash in cash_by_user.items():
+                self._row(user_id, cash or 0.0)
+            for user_id, symbol, shares, cost in holdings:
+                slot = self._slot(self._row(user_id), self._col(symbol))
+                self._shares[slot] = shares
+                self._cost[slot] = cost
+            self.update_prices(prices, full=True)
+            self.loaded_at = time.monotonic()
+
+    def adopt(self, other):
+        """Take over ``other``'s state in one step, so readers never see a half-loaded board."""
+        with self._lock:
+            state = dict(vars(other))
+            del state["_lock"]
+            self.__dict__.update(state)
+
+    def apply_trade(self, user_id, symbol, shares_delta, cost_delta, cash, price):
+        """Apply one executed trade to the user's position, cash and rank."""
+        with self._lock:
+            row = self._row(user_id, cash)
+            col = self._col(symbol)
+            slot = self._slot(row, col)
+            old_value = self._position_value(slot)
+            self._shares[slot] += shares_delta
+            self._cost[slot] = max(self._cost[slot] + cost_delta, 0.0)
+            if self._shares[slot] <= 0:
+                self._shares[slot] = 0
+                self._cost[slot] = 0.0
+                del self._slots[(row, col)]
+                self._live[slot] = False
+                self._free_slots.append(slot)
+            new_value = 0.0 if self._shares[slot] <= 0 else self._position_value(slot)
+            value = self._values[row] - self._cash[row] + cash + new_value - old_value
+            self._cash[row] = cash
+            self._set_value(row, value)
+            self.update_prices({symbol: price})
+
+    def update_prices(self, prices, full=False):
+        """Move the shared price vector and revalue the affected accounts.
+
+        A handful of changed symbols only revalues the slots in those columns;
+        larger moves (or ``full``) revalue every account in one pass.
+        """
+        with self._lock:
+            changed = {}
+            for symbol, price in prices.items():
+                col = self._col(symbol)
+                if self._prices[col] != price:
+                    changed[col] = self._prices[col]
+                    self._prices[col] = price
+            if not changed and not full:
+                return
+
+            users = len(self._user_rows)
+            live = self._live[: self._slot_count]
+            rows = self._rows[: self._slot_count]
+            cols = self._cols[: self._slot_count]
+
+            if not full and len(changed) <= INCREMENTAL_SYMBOL_LIMIT:
+                mask = live & np.isin(cols, list(changed))
+                old_prices = self._prices.copy()
+                old_prices[list(changed)] = list(changed.values())
+                new_values = self._slot_values(mask, self._prices)
+                old_values = self._slot_values(mask, old_prices)
+                delta = np.bincount(rows[mask], weights=new_values - old_values, minlength=users)
+                for row in np.nonzero(delta)[0].tolist():
+                    self._set_value(row, self._values[row] + delta[row])
+                return
+
+            values = self._cash[:users] + np.bincount(
+                rows[live], weights=self._slot_values(live, self._prices), minlength=users
+            )
+            self._values[:users] = values
+            keys = zip((-values).tolist(), self._user_ids[:users].tolist())
+            self._ranking = SortedList(keys)
+
+    def _slot_values(self, mask, prices):
+        shares = self._shares[: self._slot_count][mask]
+        cost = self._cost[: self._slot_count][mask]
+        position_values = shares * prices[self._cols[: self._slot_count][mask]]
+        return np.where(np.isnan(position_values), cost, position_values)
+
+    def top(self, k=10):
+        """Return ``[(user_id, value)]`` for the K most valuable accounts."""
+        with self._lock:
+            return [(user_id, -float(negative_value)) for negative_value, user_id in self._ranking.islice(0, k)]
+
+    def rank(self, user_id):
+        """Return ``(rank, value, total_users)`` for one user, or ``None``."""
+        with self._lock:
+            row = self._user_rows.get(user_id)
+            if row is None:
+                return None
+            value = self._values[row]
+            return self._ranking.index((-value, user_id)) + 1, float(value), len(self._ranking)
+
+    def __len__(self):
+        return len(self._user_rows)
+
+
+leaderboard = Leaderboard()
+_reloading = threading.Lock()
+
+
+def reload_interval():
+    return int(os.getenv("LEADERBOARD_RELOAD_SECONDS", "300"))
+
+
+def load_from_database(board=None):
+    """Rebuild ``board`` from ``portfolios``/``users``, marked at last trade prices.
+
+    The new state is built on the side and swapped in, so ``board`` keeps
+    answering with its old state until the load is done.
+    """
+    board = board or leaderboard
+    users = User.__table__
+    portfolios = Portfolio.__table__
+    trades = Trade.__table__
+
+    cash_by_user = dict(db.session.execute(select(users.c.id, users.c.cash)).all())
+    holdings = db.session.execute(
+        select(portfolios.c.user_id, portfolios.c.symbol, portfolios.c.shares, portfolios.c.total_cost_basis)
+        .where(portfolios.c.shares > 0)
+    ).all()
+    latest = select(func.max(trades.c.id)).group_by(trades.c.symbol)
+    prices = dict(db.session.execute(select(trades.c.symbol, trades.c.price).where(trades.c.id.in_(latest))).all())
+
+    fresh = Leaderboard()
+    fresh.load(holdings, cash_by_user, prices)
+    board.adopt(fresh)
+    logger.info("Leaderboard loaded with %s users and %s symbols", len(cash_by_user), len(prices))
+    return board
+
+
+def _reload_in_background(app):
+    try:
+        with app.app_context():
+            try:
+                load_from_database()
+            except Exception:
+                logger.exception("Leaderboard reload failed; serving the previous board")
+                db.session.rollback()
+    finally:
+        _reloading.release()
+
+
+def current_leaderboard():
+    """Return the process leaderboard, loading it on first use and refreshing it when stale.
+
+    Each worker keeps its own copy; the periodic reload picks up trades that
+    other workers applied. Only the first load happens in the request. After
+    that a stale board is still served while one background thread reloads it.
+    """
+    if leaderboard.loaded_at is None:
+        with _reloading:
+            if leaderboard.loaded_at is None:
+                load_from_database()
+    elif time.monotonic() - leaderboard.loaded_at > reload_interval() and _reloading.acquire(blocking=False):
+        try:
+            threading.Thread(
+                target=_reload_in_background,
+                args=(current_app._get_current_object(),),
+                name="leaderboard-reload",
+                daemon=True,
+            ).start()
+        except Exception:
+            _reloading.release()
+            raise
+    return leaderboard
+
+
+def record_prices(prices):
+    """Share freshly looked-up prices with the leaderboard if it is loaded."""
+    if leaderboard.loaded_at is None or not prices:
+        return
+    leaderboard.update_prices(prices)
+
+
+def record_trade(user_id, symbol, shares_delta, cost_delta, cash, price):
+    """Feed an executed trade into the leaderboard if this worker has one loaded."""
+    if leaderboard.loaded_at is None:
+        return
+    try:
+        leaderboard.apply_trade(user_id, symbol, shares_delta, cost_delta, cash, price)
+    except Exception:
+        logger.exception("Leaderboard update failed; forcing a reload")
+        leaderboard.loaded_at = None
@@ -0,0 +1,260 @@
+import logging
+from collections import deque
+
+from sqlalchemy import func, select
+
+from database import primary_reads
+from extensions import db
+from models import Lot, LotClosure, Trade
+
+
+logger = logging.getLogger(__name__)
+
+
+class OpenLot:
+    __slots__ = ("id", "remaining", "price", "trade_id")
+
+    def __init__(self, lot_id, remaining, price, trade_id=None):
+        self.id = lot_id
+        self.remaining = remaining
+        self.price = price
+        self.trade_id = lot_id if trade_id is None else trade_id
+
+
+class LotQueue:
+    """Open lots of one position: a FIFO deque plus an id index.
+
+    FIFO sells pop from the left; specific-lot sells go through the index.
+    Lots drained out of order stay in the deque with ``remaining == 0`` and
+    are skipped when they reach the front.
+    """
+
+    def __init__(self, lots=()):
+        self._fifo = deque()
+        self._by_id = {}
+        self._changed = {}
+        self._closed = []
+        for lot in lots:
+            self.push(lot)
+
+    def push(self, lot):
+        self._fifo.append(lot)
+        self._by_id[lot.id] = lot
+
+    @property
+    def shares(self):
+        return sum(lot.remaining for lot in self._by_id.values())
+
+    def open_lots(self):
+        return list(self._by_id.values())
+
+    def _take(self, lot, quantity):
+        taken = min(lot.remaining, quantity)
+        lot.remaining -= taken
+        self._changed[lot.id] = lot
+        if taken:
+            self._closed.append((lot.trade_id, taken))
+        if lot.remaining == 0:
+            del self._by_id[lot.id]
+        return taken, taken * lot.price
+
+    def consume(self, quantity, lot_ids=()):
+        """Remove ``quantity`` shares, named lots first, then FIFO.
+
+        Returns the cost basis of the shares removed.
+        """
+        cost = 0.0
+        for lot_id in lot_ids:
+            lot = self._by_id.get(lot_id)
+            if lot is None or quantity == 0:
+                continue
+            taken, taken_cost = self._take(lot, quantity)
+            quantity -= taken
+            cost += taken_cost
+
+        while quantity > 0 and self._fifo:
+            lot = self._fifo[0]
+            if lot.remaining == 0:
+                self._fifo.popleft()
+                continue
+            taken, taken_cost = self._take(lot, quantity)
+            quantity -= taken
+            cost += taken_cost
+
+        if quantity > 0:
+            raise ValueError("not enough shares in open lots")
+        return cost
+
+    def replay(self, quantity, closures):
+        """Remove ``quantity`` shares as recorded in ``(lot_id, shares)`` closures, FIFO for any rest.
+
+        Returns the cost basis of the shares removed.
+        """
+        cost = 0.0
+        for lot_id, shares in closures:
+            lot = self._by_id.get(lot_id)
+            if lot is None or quantity == 0:
+                continue
+            taken, taken_cost = self._take(lot, min(shares, quantity))
+            quantity -= taken
+            cost += taken_cost
+        return cost + (self.consume(quantity) if quantity else 0.0)
+
+    def changed_lots(self):
+        return list(self._changed.values())
+
+    def closures(self):
+        """``(buy trade id, shares)`` for every lot drawn down, in order."""
+        return list(self._closed)
+
+
+def load_lot_queue(user_id, symbol):
+    lots = Lot.__table__
+    rows = db.session.execute(
+        select(lots.c.id, lots.c.remaining_shares, lots.c.price, lots.c.trade_id)
+        .where(lots.c.user_id == user_id, lots.c.symbol == symbol, lots.c.remaining_shares > 0)
+        .order_by(lots.c.opened_at.asc(), lots.c.id.asc())
+    ).all()
+    return LotQueue(OpenLot(row.id, row.remaining_shares, row.price, row.trade_id) for row in rows)
+
+
+def open_lot(trade):
+    """Record a buy trade as a new lot; ``trade`` must already have an id."""
+    db.session.add(
+        Lot(
+            user_id=trade.user_id,
+            symbol=trade.symbol,
+            trade_id=trade.id,
+            shares=trade.shares,
+            remaining_shares=trade.shares,
+            price=trade.price,
+            opened_at=trade.timestamp,
+        )
+    )
+
+
+def close_lots(user_id, symbol, shares, sell_trade_id, lot_ids=()):
+    """Sell ``shares`` out of the position's lots and return what the closed shares cost.
+
+    Which lots the sell drew from is recorded against ``sell_trade_id`` so
+    ``rebuild_lots`` can replay it. Raises ``ValueError`` when the open lots
+    cannot cover ``shares``.
+    """
+    queue = load_lot_queue(user_id, symbol)
+    loaded = {lot.id: lot.remaining for lot in queue.open_lots()}
+    cost = queue.consume(shares, lot_ids=lot_ids)
+    lots = Lot.__table__
+    for lot in queue.changed_lots():
+        taken = loaded[lot.id] - lot.remaining
+        # Decrement rather than overwrite, and only if the shares are still there.
+        updated = db.session.execute(
+            lots.update()
+            .where(lots.c.id == lot.id, lots.c.remaining_shares >= taken)
+            .values(remaining_shares=lots.c.remaining_shares - taken)
+        ).rowcount
+        if updated != 1:
+            raise ValueError(f"lot {lot.id} changed while closing it")
+    closed = [
+        {"sell_trade_id": sell_trade_id, "buy_trade_id": buy_trade_id, "shares": taken}
+        for buy_trade_id, taken in queue.closures()
+    ]
+    if closed:
+        db.session.execute(LotClosure.__table__.insert(), closed)
+    return cost
+
+
+def _recorded_closures(user_id=None):
+    closures = LotClosure.__table__
+    trades = Trade.__table__
+    query = select(closures.c.sell_trade_id, closures.c.buy_trade_id, closures.c.shares).order_by(closures.c.id.asc())
+    if user_id is not None:
+        query = query.join(trades, trades.c.id == closures.c.sell_trade_id).where(trades.c.user_id == user_id)
+    recorded = {}
+    for sell_trade_id, buy_trade_id, shares in db.session.execute(query):
+        recorded.setdefault(sell_trade_id, []).append((buy_trade_id, shares))
+    return recorded
+
+
+def rebuild_lots(user_id=None):
+    """Replay trades to recreate lots and realized P&L from scratch.
+
+    Sells follow their recorded lot closures; older sells without any are replayed FIFO.
+    """
+    trades = Trade.__table__
+    query = select(trades.c.id, trades.c.user_id, trades.c.symbol, trades.c.shares, trades.c.price, trades.c.timestamp)
+    if user_id is not None:
+        query = query.where(trades.c.user_id == user_id)
+    rows = db.session.execute(
+        query.order_by(trades.c.user_id.asc(), trades.c.symbol.asc(), trades.c.timestamp.asc(), trades.c.id.asc())
+    ).all()
+
+    lot_query = Lot.query
+    if user_id is not None:
+        lot_query = lot_query.filter_by(user_id=user_id)
+    lot_query.delete(synchronize_session=False)
+    recorded = _recorded_closures(user_id)
+
+    queues = {}
+    buys = []
+    realized = []
+    for row in rows:
+        key = (row.user_id, row.symbol)
+        queue = queues.setdefault(key, LotQueue())
+        if row.shares > 0:
+            lot = OpenLot(row.id, row.shares, row.price)
+            queue.push(lot)
+            buys.append(row)
+            continue
+        quantity = min(-row.shares, queue.shares)
+        cost = queue.replay(quantity, recorded.get(row.id, ())) if quantity else 0.0
+        realized.append({"trade_id": row.id, "pnl": quantity * row.price - cost})
+
+    remaining = {lot.id: lot.remaining for queue in queues.values() for lot in queue.open_lots()}
+    lot_rows = [
+        {
+            "user_id": row.user_id,
+            "symbol": row.symbol,
+            "trade_id": row.id,
+            "shares": row.shares,
+            "remaining_shares": remaining.get(row.id, 0),
+            "price": row.price,
+            "opened_at": row.timestamp,
+        }
+        for row in buys
+    ]
+    if lot_rows:
+        db.session.execute(Lot.__table__.insert(), lot_rows)
+    for item in realized:
+        db.session.execute(trades.update().where(trades.c.id == item["trade_id"]).values(realized_pnl=item["pnl"]))
+
+
+def ensure_lots_populated(user_id):
+    # The rebuild rewrites primary rows from what it reads, so never read a replica here.
+    with primary_reads():
+        has_lots = Lot.query.filter_by(user_id=user_id).first() is not None
+        has_trades = Trade.query.filter_by(user_id=user_id).first() is not None
+
+        if not has_lots and has_trades:
+            rebuild_lots(user_id=user_id)
+            db.session.commit()
+
+
+def realized_gains(user_id):
+    """Return ``{symbol: realized P&L}`` summed over the user's sell trades."""
+    trades = Trade.__table__
+    rows = db.session.execute(
+        select(trades.c.symbol, func.sum(trades.c.realized_pnl))
+        .where(trades.c.user_id == user_id, trades.c.realized_pnl.isnot(None))
+        .group_by(trades.c.symbol)
+    ).all()
+    return {symbol: float(total or 0.0) for symbol, total in rows}
+
+
+def open_lot_rows(user_id):
+    """Return ``(id, symbol, remaining_shares, price, opened_at)`` rows for open lots."""
+    lots = Lot.__table__
+    return db.session.execute(
+        select(lots.c.id, lots.c.symbol, lots.c.remaining_shares, lots.c.price, lots.c.opened_at)
+        .where(lots.c.user_id == user_id, lots.c.remaining_shares > 0)
+        .order_by(lots.c.symbol.asc(), lots.c.opened_at.asc(), lots.c.id.asc())
+    ).all()
@@ -0,0 +1,248 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, abort, current_app, g, has_request_context, request
+from flask.signals import before_render_template, template_rendered
+from sqlalchemy import event
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+KNOWN_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+UNMATCHED_ENDPOINT = "<unmatched>"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a fixed tuple of label values."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    bucket_labels = _format_labels(self.labelnames, labels, (("le", repr(bound)),))
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                inf_labels = _format_labels(self.labelnames, labels, (("le", "+Inf"),))
+                lines.append(f"{self.name}_bucket{inf_labels} {count}")
+                plain = _format_labels(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{plain} {total}")
+                lines.append(f"{self.name}_count{plain} {count}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by endpoint.", ("endpoint", "method", "status")
+)
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "SQL time spent per request.", ("endpoint",))
+REQUEST_TEMPLATE_SECONDS = Histogram(
+    "http_request_template_seconds", "Template rendering time per request.", ("endpoint",)
+)
+REQUEST_UPSTREAM_SECONDS = Histogram(
+    "http_request_upstream_seconds", "Time waiting on market data and AI providers per request.", ("endpoint",)
+)
+UPSTREAM_SECONDS = Histogram("upstream_request_duration_seconds", "Outbound call latency.", ("provider",))
+UPSTREAM_CALLS = Counter("upstream_requests_total", "Outbound calls by provider and outcome.", ("provider", "outcome"))
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed.")
+
+REGISTRY = [
+    REQUEST_SECONDS,
+    REQUEST_DB_SECONDS,
+    REQUEST_TEMPLATE_SECONDS,
+    REQUEST_UPSTREAM_SECONDS,
+    UPSTREAM_SECONDS,
+    UPSTREAM_CALLS,
+    DB_QUERIES,
+]
+_collectors = []
+
+
+def register_collector(collect):
+    """Add a callable returning extra exposition lines, read at scrape time."""
+    _collectors.append(collect)
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    for collect in _collectors:
+        lines.extend(collect())
+    return "\n".join(lines) + "\n"
+
+
+def _timings():
+    """Per-request accumulators, or None outside a request."""
+    if not has_request_context():
+        return None
+    timings = g.get("_metrics")
+    if timings is None:
+        timings = g._metrics = {"db": 0.0, "template": 0.0, "upstream": {}, "started": time.perf_counter()}
+    return timings
+
+
+@contextmanager
+def upstream_timer(provider):
+    """Time one outbound call to ``provider`` (a fixed name such as ``finnhub``)."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - started
+        UPSTREAM_SECONDS.observe(elapsed, provider)
+        UPSTREAM_CALLS.inc(provider, outcome)
+        timings = _timings()
+        if timings is not None:
+            timings["upstream"][provider] = timings["upstream"].get(provider, 0.0) + elapsed
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_started")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    DB_QUERIES.inc()
+    timings = _timings()
+    if timings is not None:
+        timings["db"] += elapsed
+
+
+def _before_render(sender, template, context, **extra):
+    timings = _timings()
+    if timings is not None:
+        timings.setdefault("template_started", []).append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    timings = _timings()
+    if timings is not None and timings.get("template_started"):
+        timings["template"] += time.perf_counter() - timings["template_started"].pop()
+
+
+def _finish_request(response):
+    timings = g.get("_metrics")
+    if timings is None:
+        return response
+
+    total = time.perf_counter() - timings["started"]
+    endpoint = request.url_rule.endpoint if request.url_rule is not None else UNMATCHED_ENDPOINT
+    method = request.method if request.method in KNOWN_METHODS else "OTHER"
+    upstream = sum(timings["upstream"].values())
+    REQUEST_SECONDS.observe(total, endpoint, method, f"{response.status_code // 100}xx")
+    REQUEST_DB_SECONDS.observe(timings["db"], endpoint)
+    REQUEST_TEMPLATE_SECONDS.observe(timings["template"], endpoint)
+    REQUEST_UPSTREAM_SECONDS.observe(upstream, endpoint)
+
+    if g.get("_metrics_server_timing"):
+        entries = [
+            f"db;dur={timings['db'] * 1000:.1f}",
+            f"tpl;dur={timings['template'] * 1000:.1f}",
+        ]
+        entries.extend(
+            f"up-{provider};dur={seconds * 1000:.1f}" for provider, seconds in sorted(timings["upstream"].items())
+        )
+        entries.append(f"total;dur={total * 1000:.1f}")
+        response.headers["Server-Timing"] = ", ".join(entries)
+    return response
+
+
+def metrics_view():
+    token = os.getenv("METRICS_TOKEN")
+    if token:
+        if request.headers.get("Authorization") != f"Bearer {token}":
+            return Response("unauthorized\n", status=401, mimetype="text/plain")
+    elif not current_app.debug:
+        # helpers imports this module, so is_admin is looked up late.
+        from helpers import is_admin
+
+        if not is_admin():
+            abort(404)
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+def init_metrics(app, db):
+    """Record per-request DB, template and upstream time and serve ``/metrics``.
+
+    Endpoint labels come from the URL rule, so cardinality is bounded by the
+    route table. ``METRICS_SERVER_TIMING=1`` also adds a ``Server-Timing``
+    header. ``/metrics`` takes a bearer token when ``METRICS_TOKEN`` is set;
+    without one it is served only to admins, or to anyone in debug mode.
+    Counters are per process; with several gunicorn workers each scrape sees
+    the worker that answered it.
+    """
+    server_timing = os.getenv("METRICS_SERVER_TIMING", "0") == "1"
+
+    @app.before_request
+    def start_request_metrics():
+        _timings()
+        g._metrics_server_timing = server_timing
+
+    app.after_request(_finish_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
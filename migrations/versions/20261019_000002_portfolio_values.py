@@ -0,0 +1,34 @@
+"""Daily portfolio valuation snapshots
+
+Revision ID: 20261019_000002
+Revises: 20260415_000001
+Create Date: 2026-10-19 00:00:02
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261019_000002"
+down_revision = "20260415_000001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "portfolio_values",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("as_of", sa.Date(), nullable=False),
+        sa.Column("cash", sa.Float(), nullable=False),
+        sa.Column("invested_cost", sa.Float(), nullable=False),
+        sa.Column("market_value", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id", "as_of", name="uq_portfolio_values_user_as_of"),
+    )
+
+
+def downgrade():
+    op.drop_table("portfolio_values")
@@ -0,0 +1,44 @@
+"""Tax lots and realized P&L per trade
+
+Revision ID: 20261019_000003
+Revises: 20261019_000002
+Create Date: 2026-10-19 00:00:03
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261019_000003"
+down_revision = "20261019_000002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "lots",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("symbol", sa.String(length=10), nullable=False),
+        sa.Column("trade_id", sa.Integer(), nullable=False),
+        sa.Column("shares", sa.Integer(), nullable=False),
+        sa.Column("remaining_shares", sa.Integer(), nullable=False),
+        sa.Column("price", sa.Float(), nullable=False),
+        sa.Column("opened_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["trade_id"], ["trades.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_lots_user_symbol_open", "lots", ["user_id", "symbol", "remaining_shares"])
+
+    with op.batch_alter_table("trades") as batch_op:
+        batch_op.add_column(sa.Column("realized_pnl", sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("trades") as batch_op:
+        batch_op.drop_column("realized_pnl")
+
+    op.drop_index("ix_lots_user_symbol_open", table_name="lots")
+    op.drop_table("lots")
@@ -0,0 +1,31 @@
+"""Server-side session table
+
+Revision ID: 20261019_000004
+Revises: 20261019_000003
+Create Date: 2026-10-19 00:00:04
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261019_000004"
+down_revision = "20261019_000003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "sessions",
+        sa.Column("id", sa.String(length=64), nullable=False),
+        sa.Column("data", sa.Text(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_sessions_expires_at", "sessions", ["expires_at"])
+
+
+def downgrade():
+    op.drop_index("ix_sessions_expires_at", table_name="sessions")
+    op.drop_table("sessions")
@@ -0,0 +1,45 @@
+"""Resting limit and stop orders
+
+Revision ID: 20261019_000005
+Revises: 20261019_000004
+Create Date: 2026-10-19 00:00:05
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261019_000005"
+down_revision = "20261019_000004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "orders",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("symbol", sa.String(length=10), nullable=False),
+        sa.Column("side", sa.String(length=4), nullable=False),
+        sa.Column("kind", sa.String(length=5), nullable=False),
+        sa.Column("shares", sa.Integer(), nullable=False),
+        sa.Column("trigger_price", sa.Float(), nullable=False),
+        sa.Column("status", sa.String(length=10), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("filled_at", sa.DateTime(), nullable=True),
+        sa.Column("fill_price", sa.Float(), nullable=True),
+        sa.Column("trade_id", sa.Integer(), nullable=True),
+        sa.Column("note", sa.String(length=120), nullable=True),
+        sa.ForeignKeyConstraint(["trade_id"], ["trades.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_orders_status_symbol", "orders", ["status", "symbol"])
+    op.create_index("ix_orders_user_id", "orders", ["user_id"])
+
+
+def downgrade():
+    op.drop_index("ix_orders_user_id", table_name="orders")
+    op.drop_index("ix_orders_status_symbol", table_name="orders")
+    op.drop_table("orders")
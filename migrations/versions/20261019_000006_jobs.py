@@ -0,0 +1,55 @@
+"""Durable background job queue
+
+Revision ID: 20261019_000006
+Revises: 20261019_000005
+Create Date: 2026-10-19 00:00:06
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261019_000006"
+down_revision = "20261019_000005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=40), nullable=False),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column("dedupe_key", sa.String(length=64), nullable=False),
+        sa.Column("priority", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(length=10), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("max_attempts", sa.Integer(), nullable=False),
+        sa.Column("run_at", sa.DateTime(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("lease_owner", sa.String(length=80), nullable=True),
+        sa.Column("lease_expires_at", sa.DateTime(), nullable=True),
+        sa.Column("progress", sa.Float(), nullable=False),
+        sa.Column("progress_note", sa.String(length=200), nullable=True),
+        sa.Column("result", sa.Text(), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_jobs_status_priority", "jobs", ["status", "priority", "run_at"])
+    op.create_index(
+        "uq_jobs_queued_dedupe",
+        "jobs",
+        ["dedupe_key"],
+        unique=True,
+        sqlite_where=sa.text("status = 'queued'"),
+        postgresql_where=sa.text("status = 'queued'"),
+    )
+
+
+def downgrade():
+    op.drop_index("uq_jobs_queued_dedupe", table_name="jobs")
+    op.drop_index("ix_jobs_status_priority", table_name="jobs")
+    op.drop_table("jobs")
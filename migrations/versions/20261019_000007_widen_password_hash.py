@@ -0,0 +1,26 @@
+"""Widen users.hash for scrypt hashes
+
+Revision ID: 20261019_000007
+Revises: 20261019_000006
+Create Date: 2026-10-19 00:00:07
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261019_000007"
+down_revision = "20261019_000006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # werkzeug's scrypt hashes are 162 characters; batch mode keeps SQLite working.
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.alter_column("hash", existing_type=sa.String(length=120), type_=sa.String(length=255), existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.alter_column("hash", existing_type=sa.String(length=255), type_=sa.String(length=120), existing_nullable=False)
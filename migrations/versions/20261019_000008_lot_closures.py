@@ -0,0 +1,34 @@
+"""Record which lots each sell closed
+
+Revision ID: 20261019_000008
+Revises: 20261019_000007
+Create Date: 2026-10-19 00:00:08
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261019_000008"
+down_revision = "20261019_000007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "lot_closures",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("sell_trade_id", sa.Integer(), nullable=False),
+        sa.Column("buy_trade_id", sa.Integer(), nullable=False),
+        sa.Column("shares", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["buy_trade_id"], ["trades.id"]),
+        sa.ForeignKeyConstraint(["sell_trade_id"], ["trades.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_lot_closures_sell_trade_id", "lot_closures", ["sell_trade_id"])
+
+
+def downgrade():
+    op.drop_index("ix_lot_closures_sell_trade_id", table_name="lot_closures")
+    op.drop_table("lot_closures")
@@ -1,5 +1,8 @@
 from datetime import datetime
 
+from sqlalchemy import func, select
+
+from database import primary_reads
 from extensions import db
 
 
@@ -8,12 +11,12 @@ class User(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
-    hash = db.Column(db.String(120), nullable=False)
+    hash = db.Column(db.String(255), nullable=False)
     cash = db.Column(db.Float, default=10000)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    trades = db.relationship("Trade", backref="user", lazy=True)
+    trades = db.relationship("Trade", backref="user", lazy="dynamic")
     portfolios = db.relationship("Portfolio", backref="user", lazy=True, cascade="all, delete-orphan")
 
     def __repr__(self):
@@ -29,6 +32,7 @@ class Trade(db.Model):
     shares = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    realized_pnl = db.Column(db.Float, nullable=True)
 
     def __repr__(self):
         return f"<Trade {self.symbol} {self.shares} shares at {self.price}>"
@@ -46,68 +50,214 @@ class Portfolio(db.Model):
 
     @property
     def avg_purchase_price(self):
-        return self.total_cost_basis / self.shares if self.shares > 0 else 0.0
+        return average_cost(self.total_cost_basis, self.shares)
 
     def __repr__(self):
         return f"<Portfolio {self.symbol} {self.shares} shares>"
 
 
-def rebuild_portfolios(user_id=None):
-    query = Trade.query.order_by(Trade.user_id.asc(), Trade.symbol.asc(), Trade.timestamp.asc(), Trade.id.asc())
-    if user_id is not None:
-        query = query.filter_by(user_id=user_id)
-
-    portfolios = {}
-
-    for trade in query.all():
-        key = (trade.user_id, trade.symbol)
-        holding = portfolios.setdefault(
-            key,
-            {
-                "shares": 0,
-                "total_cost_basis": 0.0,
-            },
-        )
+class Lot(db.Model):
+    __tablename__ = "lots"
+    __table_args__ = (db.Index("ix_lots_user_symbol_open", "user_id", "symbol", "remaining_shares"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    symbol = db.Column(db.String(10), nullable=False)
+    trade_id = db.Column(db.Integer, db.ForeignKey("trades.id"), nullable=False)
+    shares = db.Column(db.Integer, nullable=False)
+    remaining_shares = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    opened_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Lot {self.symbol} {self.remaining_shares}/{self.shares} at {self.price}>"
+
+
+class LotClosure(db.Model):
+    """Shares a sell took from one buy's lot, so rebuilds replay specific-lot sells exactly.
+
+    Both sides point at trades, which survive ``rebuild_lots``; lot ids do not.
+    """
+
+    __tablename__ = "lot_closures"
+
+    id = db.Column(db.Integer, primary_key=True)
+    sell_trade_id = db.Column(db.Integer, db.ForeignKey("trades.id"), nullable=False, index=True)
+    buy_trade_id = db.Column(db.Integer, db.ForeignKey("trades.id"), nullable=False)
+    shares = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<LotClosure sell {self.sell_trade_id} took {self.shares} from buy {self.buy_trade_id}>"
+
+
+class Order(db.Model):
+    """A resting limit or stop order, filled by ``orders.OrderBook`` when its price is crossed."""
+
+    __tablename__ = "orders"
+    __table_args__ = (db.Index("ix_orders_status_symbol", "status", "symbol"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
+    symbol = db.Column(db.String(10), nullable=False)
+    side = db.Column(db.String(4), nullable=False)
+    kind = db.Column(db.String(5), nullable=False)
+    shares = db.Column(db.Integer, nullable=False)
+    trigger_price = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default="open")
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    filled_at = db.Column(db.DateTime, nullable=True)
+    fill_price = db.Column(db.Float, nullable=True)
+    trade_id = db.Column(db.Integer, db.ForeignKey("trades.id"), nullable=True)
+    note = db.Column(db.String(120), nullable=True)
+
+    def __repr__(self):
+        return f"<Order {self.side} {self.kind} {self.shares} {self.symbol} at {self.trigger_price} {self.status}>"
+
 
-        if trade.shares > 0:
-            holding["shares"] += trade.shares
-            holding["total_cost_basis"] += trade.shares * trade.price
-            continue
+class Job(db.Model):
+    """A unit of background work, leased and run by ``flask worker`` (see ``jobs``)."""
 
-        shares_to_sell = abs(trade.shares)
-        if holding["shares"] <= 0:
-            continue
+    __tablename__ = "jobs"
+    __table_args__ = (
+        db.Index("ix_jobs_status_priority", "status", "priority", "run_at"),
+        db.Index(
+            "uq_jobs_queued_dedupe",
+            "dedupe_key",
+            unique=True,
+            sqlite_where=db.text("status = 'queued'"),
+            postgresql_where=db.text("status = 'queued'"),
+        ),
+    )
 
-        avg_cost = holding["total_cost_basis"] / holding["shares"] if holding["shares"] > 0 else 0.0
-        holding["shares"] -= shares_to_sell
-        holding["total_cost_basis"] -= avg_cost * shares_to_sell
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default="{}")
+    dedupe_key = db.Column(db.String(64), nullable=False)
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(10), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    lease_owner = db.Column(db.String(80), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    progress = db.Column(db.Float, nullable=False, default=0.0)
+    progress_note = db.Column(db.String(200), nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.kind} {self.status} {self.progress:.0%}>"
+
+
+class PortfolioValue(db.Model):
+    __tablename__ = "portfolio_values"
+    __table_args__ = (db.UniqueConstraint("user_id", "as_of", name="uq_portfolio_values_user_as_of"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    as_of = db.Column(db.Date, nullable=False)
+    cash = db.Column(db.Float, nullable=False)
+    invested_cost = db.Column(db.Float, nullable=False)
+    market_value = db.Column(db.Float, nullable=False)
+
+    @property
+    def total_value(self):
+        return self.cash + self.market_value
+
+    def __repr__(self):
+        return f"<PortfolioValue {self.user_id} {self.as_of} {self.total_value:.2f}>"
+
+
+class ServerSession(db.Model):
+    __tablename__ = "sessions"
+
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<ServerSession {self.id[:8]} until {self.expires_at}>"
+
+
+def average_cost(total_cost_basis, shares):
+    return total_cost_basis / shares if shares > 0 else 0.0
+
+
+def user_cash(user_id):
+    users = User.__table__
+    return db.session.execute(select(users.c.cash).where(users.c.id == user_id)).scalar()
+
+
+def holding_rows(user_id):
+    """Return ``(symbol, shares, total_cost_basis)`` rows for a user's open positions."""
+    portfolios = Portfolio.__table__
+    stmt = (
+        select(portfolios.c.symbol, portfolios.c.shares, portfolios.c.total_cost_basis)
+        .where(portfolios.c.user_id == user_id)
+        .order_by(portfolios.c.symbol.asc())
+    )
+    return db.session.execute(stmt).all()
 
-        if holding["shares"] <= 0:
-            holding["shares"] = 0
-            holding["total_cost_basis"] = 0.0
+
+def trade_history_rows(user_id):
+    """Return ``(symbol, shares, price, timestamp)`` rows, newest first."""
+    trades = Trade.__table__
+    stmt = (
+        select(trades.c.symbol, trades.c.shares, trades.c.price, trades.c.timestamp)
+        .where(trades.c.user_id == user_id)
+        .order_by(trades.c.timestamp.desc())
+    )
+    return db.session.execute(stmt).all()
+
+
+def rebuild_portfolios(user_id=None):
+    """Recreate positions from the open lots, so each basis is what its remaining lots cost.
+
+    Lots must be current; run ``lots.rebuild_lots`` first when rebuilding from trades.
+    """
+    lots = Lot.__table__
+    query = (
+        select(
+            lots.c.user_id,
+            lots.c.symbol,
+            func.sum(lots.c.remaining_shares),
+            func.sum(lots.c.remaining_shares * lots.c.price),
+        )
+        .where(lots.c.remaining_shares > 0)
+        .group_by(lots.c.user_id, lots.c.symbol)
+    )
+    if user_id is not None:
+        query = query.where(lots.c.user_id == user_id)
+    positions = db.session.execute(query).all()
 
     portfolio_query = Portfolio.query
     if user_id is not None:
         portfolio_query = portfolio_query.filter_by(user_id=user_id)
     portfolio_query.delete(synchronize_session=False)
 
-    for (portfolio_user_id, symbol), holding in portfolios.items():
-        if holding["shares"] <= 0:
-            continue
-        db.session.add(
-            Portfolio(
-                user_id=portfolio_user_id,
-                symbol=symbol,
-                shares=holding["shares"],
-                total_cost_basis=holding["total_cost_basis"],
-            )
+    if positions:
+        db.session.execute(
+            Portfolio.__table__.insert(),
+            [
+                {"user_id": position_user_id, "symbol": symbol, "shares": int(shares), "total_cost_basis": float(cost)}
+                for position_user_id, symbol, shares, cost in positions
+            ],
         )
 
 
 def ensure_portfolios_populated(user_id):
-    has_portfolios = Portfolio.query.filter_by(user_id=user_id).first() is not None
-    has_trades = Trade.query.filter_by(user_id=user_id).first() is not None
+    # The rebuild rewrites primary rows from what it reads, so never read a replica here.
+    with primary_reads():
+        has_portfolios = Portfolio.query.filter_by(user_id=user_id).first() is not None
+        has_trades = Trade.query.filter_by(user_id=user_id).first() is not None
+
+        if not has_portfolios and has_trades:
+            # Imported here because lots imports this module.
+            from lots import ensure_lots_populated
 
-    if not has_portfolios and has_trades:
-        rebuild_portfolios(user_id=user_id)
-        db.session.commit()
+            ensure_lots_populated(user_id)
+            rebuild_portfolios(user_id=user_id)
+            db.session.commit()
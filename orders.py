@@ -0,0 +1,268 @@
+import heapq
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from extensions import db
+from helpers import add_price_listener
+from lots import ensure_lots_populated
+from models import Order, ensure_portfolios_populated
+from trading import TradeRejected, execute_buy, execute_sell
+
+
+logger = logging.getLogger(__name__)
+
+BUY = "buy"
+SELL = "sell"
+LIMIT = "limit"
+STOP = "stop"
+OPEN = "open"
+FILLED = "filled"
+CANCELLED = "cancelled"
+REJECTED = "rejected"
+
+
+def fills_on_fall(side, kind):
+    """Buy limits and sell stops trigger once the price is at or below the trigger."""
+    return (side, kind) in ((BUY, LIMIT), (SELL, STOP))
+
+
+class OrderBook:
+    """Open orders per symbol in two heaps keyed by trigger price.
+
+    Orders that fill on a falling price sit in a max-heap, the rest in a
+    min-heap, so a price update only looks at the top of each: popping the
+    ``k`` crossed orders costs O(k log n) however many others rest on the
+    symbol. Ties fill oldest first. Cancelled orders are dropped from
+    ``_live`` and skipped when they surface, rather than removed from the heap.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded_at = None
+        self._reset()
+
+    def _reset(self):
+        self._falling = {}
+        self._rising = {}
+        self._live = set()
+        self._last_prices = {}
+
+    def _push(self, order_id, symbol, side, kind, trigger_price):
+        if fills_on_fall(side, kind):
+            heapq.heappush(self._falling.setdefault(symbol, []), (-trigger_price, order_id))
+        else:
+            heapq.heappush(self._rising.setdefault(symbol, []), (trigger_price, order_id))
+        self._live.add(order_id)
+
+    def add(self, order_id, symbol, side, kind, trigger_price):
+        with self._lock:
+            self._push(order_id, symbol, side, kind, trigger_price)
+
+    def discard(self, order_id):
+        with self._lock:
+            self._live.discard(order_id)
+
+    def load(self, rows):
+        """Replace the book with ``(id, symbol, side, kind, trigger_price)`` rows.
+
+        Returns the last price seen for each symbol, to re-check against.
+        """
+        with self._lock:
+            last_prices = self._last_prices
+            self._reset()
+            self._last_prices = last_prices
+            for row in rows:
+                self._push(*row)
+            self.loaded_at = time.monotonic()
+            return dict(last_prices)
+
+    def crossed(self, symbol, price):
+        """Pop and return the ids of orders on ``symbol`` that ``price`` triggers."""
+        with self._lock:
+            self._last_prices[symbol] = price
+            order_ids = []
+            falling = self._falling.get(symbol)
+            while falling and -falling[0][0] >= price:
+                order_id = heapq.heappop(falling)[1]
+                if order_id in self._live:
+                    self._live.discard(order_id)
+                    order_ids.append(order_id)
+            rising = self._rising.get(symbol)
+            while rising and rising[0][0] <= price:
+                order_id = heapq.heappop(rising)[1]
+                if order_id in self._live:
+                    self._live.discard(order_id)
+                    order_ids.append(order_id)
+            return order_ids
+
+    def __len__(self):
+        return len(self._live)
+
+
+order_book = OrderBook()
+_fills = queue.Queue()
+_filler = {"app": None, "thread": None, "pid": None}
+_filler_lock = threading.Lock()
+
+
+def reload_interval():
+    return float(os.getenv("ORDER_BOOK_RELOAD_SECONDS", "30"))
+
+
+def open_order_rows():
+    orders = Order.__table__
+    return db.session.execute(
+        select(orders.c.id, orders.c.symbol, orders.c.side, orders.c.kind, orders.c.trigger_price).where(
+            orders.c.status == OPEN
+        )
+    ).all()
+
+
+def load_order_book():
+    """Rebuild the book from the open orders and re-check them at the last known prices."""
+    last_prices = order_book.load(open_order_rows())
+    logger.info("Order book loaded with %s open orders", len(order_book))
+    for symbol, price in last_prices.items():
+        on_price(symbol, price)
+
+
+def fill_order(order_id, price):
+    """Execute one triggered order at ``price`` in its own transaction.
+
+    The ``open -> filled`` update is conditional, so when two workers pop the
+    same order only one of them trades. Returns the trade, or None.
+    """
+    order = db.session.get(Order, order_id)
+    if order is None or order.status != OPEN:
+        db.session.rollback()
+        return None
+    user_id, symbol, side, shares = order.user_id, order.symbol, order.side, order.shares
+    ensure_portfolios_populated(user_id)
+    ensure_lots_populated(user_id)
+
+    orders = Order.__table__
+    claimed = db.session.execute(
+        update(orders)
+        .where(orders.c.id == order_id, orders.c.status == OPEN)
+        .values(status=FILLED, fill_price=price, filled_at=datetime.utcnow())
+    ).rowcount
+    if claimed != 1:
+        db.session.rollback()
+        return None
+
+    try:
+        if side == BUY:
+            execution = execute_buy(user_id, symbol, shares, price)
+        else:
+            execution = execute_sell(user_id, symbol, shares, price)
+    except TradeRejected as exc:
+        db.session.rollback()
+        db.session.execute(
+            update(orders).where(orders.c.id == order_id, orders.c.status == OPEN).values(status=REJECTED, note=str(exc))
+        )
+        db.session.commit()
+        logger.info("Order %s rejected at %s: %s", order_id, price, exc)
+        return None
+
+    db.session.execute(update(orders).where(orders.c.id == order_id).values(trade_id=execution.trade.id))
+    db.session.commit()
+    execution.publish()
+    logger.info("Filled order %s: %s %s %s at %s", order_id, side, shares, symbol, price)
+    return execution.trade
+
+
+def _run_filler(app):
+    next_reload = 0.0
+    while True:
+        order_id = None
+        wait = next_reload - time.monotonic()
+        if wait > 0:
+            try:
+                order_id, price = _fills.get(timeout=wait)
+            except queue.Empty:
+                pass
+        with app.app_context():
+            try:
+                if order_id is not None:
+                    fill_order(order_id, price)
+                if time.monotonic() >= next_reload:
+                    next_reload = time.monotonic() + reload_interval()
+                    load_order_book()
+            except Exception:
+                logger.exception("Order book maintenance failed")
+                db.session.rollback()
+
+
+def _ensure_filler():
+    # Started on first use rather than at import, so each forked gunicorn
+    # worker runs its own.
+    app = _filler["app"]
+    if app is None or (_filler["thread"] is not None and _filler["pid"] == os.getpid()):
+        return
+    with _filler_lock:
+        if _filler["thread"] is not None and _filler["pid"] == os.getpid():
+            return
+        _filler["pid"] = os.getpid()
+        _filler["thread"] = threading.Thread(target=_run_filler, args=(app,), name="order-filler", daemon=True)
+        _filler["thread"].start()
+
+
+def on_price(symbol, price):
+    """Price listener: queue every order that ``price`` triggers for filling."""
+    _ensure_filler()
+    for order_id in order_book.crossed(symbol, price):
+        _fills.put((order_id, price))
+
+
+def place_order(user_id, side, kind, symbol, shares, trigger_price, current_price=None):
+    """Store a resting order, add it to this worker's book and fill it now if already crossed."""
+    order = Order(
+        user_id=user_id, symbol=symbol, side=side, kind=kind, shares=shares, trigger_price=trigger_price, status=OPEN
+    )
+    db.session.add(order)
+    db.session.commit()
+    order_book.add(order.id, symbol, side, kind, trigger_price)
+    if current_price is not None:
+        on_price(symbol, current_price)
+    else:
+        _ensure_filler()
+    return order
+
+
+def cancel_order(user_id, order_id):
+    orders = Order.__table__
+    cancelled = db.session.execute(
+        update(orders)
+        .where(orders.c.id == order_id, orders.c.user_id == user_id, orders.c.status == OPEN)
+        .values(status=CANCELLED)
+    ).rowcount
+    db.session.commit()
+    order_book.discard(order_id)
+    return cancelled == 1
+
+
+def user_orders(user_id, limit=50):
+    """The user's open orders, then their most recent closed ones."""
+    return (
+        Order.query.filter_by(user_id=user_id)
+        .order_by((Order.status == OPEN).desc(), Order.created_at.desc(), Order.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def init_orders(app):
+    """Fill resting orders as prices arrive through ``lookup()``.
+
+    Each worker keeps its own book, reloaded every ``ORDER_BOOK_RELOAD_SECONDS``
+    to pick up orders placed on other workers, and fills on a background
+    thread so requests that happen to see a crossing price never wait on it.
+    """
+    _filler["app"] = app
+    add_price_listener(on_price)
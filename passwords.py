@@ -0,0 +1,122 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+logger = logging.getLogger(__name__)
+
+# Stored for accounts that can only sign in through an external provider.
+# It never matches, since no werkzeug hash starts with "!".
+UNUSABLE_PASSWORD = "!"
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when the hashing queue is full; the caller should ask the user to retry."""
+
+
+def hash_method():
+    """Fully qualified werkzeug method, e.g. ``pbkdf2:sha256:600000`` or ``scrypt:32768:8:1``."""
+    return os.getenv("PASSWORD_HASH_METHOD", "pbkdf2:sha256:600000").strip()
+
+
+def _default_workers():
+    # Every gunicorn worker starts its own pool, so split the host's CPUs
+    # between them rather than oversubscribing it.
+    web_workers = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+    return max(1, min(2, (os.cpu_count() or 1) // web_workers))
+
+
+def _settings():
+    """Pool settings; all of them apply per gunicorn worker process."""
+    workers = os.getenv("PASSWORD_HASH_WORKERS")
+    return {
+        "workers": int(workers) if workers else _default_workers(),
+        "queue": int(os.getenv("PASSWORD_HASH_QUEUE", "32")),
+        "queue_wait": float(os.getenv("PASSWORD_HASH_QUEUE_WAIT", "0")),
+        "timeout": float(os.getenv("PASSWORD_HASH_TIMEOUT", "10")),
+    }
+
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    """Create the pool on first use so each gunicorn worker owns one after fork."""
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            settings = _settings()
+            _slots = threading.BoundedSemaphore(settings["queue"])
+            if settings["workers"] > 0:
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings["workers"],
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                logger.info("Password hashing pool started with %s processes", settings["workers"])
+            else:
+                _pool = False
+        return _pool, _slots
+
+
+def _reset_pool(broken):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(fn, *args):
+    pool, slots = _executor()
+    settings = _settings()
+    timeout = settings["timeout"]
+    # A full queue sheds the request at once unless a short wait is configured.
+    wait = settings["queue_wait"]
+    if not (slots.acquire(timeout=wait) if wait > 0 else slots.acquire(blocking=False)):
+        raise PasswordHashingBusy()
+    try:
+        if pool is False:
+            return fn(*args)
+        return pool.submit(fn, *args).result(timeout=timeout)
+    except TimeoutError:
+        logger.warning("Password hashing took longer than %ss", timeout)
+        raise PasswordHashingBusy() from None
+    except BrokenProcessPool:
+        # A hashing process died; start a fresh pool on the next call.
+        logger.exception("Password hashing pool broke; restarting it")
+        _reset_pool(pool)
+        raise PasswordHashingBusy() from None
+    finally:
+        slots.release()
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, hash_method())
+
+
+def verify_password(pwhash, password):
+    if not pwhash or pwhash.startswith(UNUSABLE_PASSWORD):
+        return False
+    return _run(check_password_hash, pwhash, password)
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method):
+    # werkzeug fills in defaults, so "scrypt" is stored as "scrypt:32768:8:1";
+    # compare against what it actually writes.
+    return generate_password_hash("x", method).split("$", 1)[0]
+
+
+def needs_rehash(pwhash):
+    """True when a stored hash was made with different parameters than configured."""
+    if not pwhash or pwhash.startswith(UNUSABLE_PASSWORD):
+        return False
+    return pwhash.split("$", 1)[0] != _method_prefix(hash_method())
@@ -1,52 +1,102 @@
+import logging
+import math
+import os
+from datetime import datetime, timezone
+
 from flask import Blueprint, flash, jsonify, redirect, render_template, request, session
+from sqlalchemy import select
 
+from database import read_replica
+from deadlines import deadline
 from extensions import db
-from helpers import apology, get_market_data, get_stock_suggestions, login_required, lookup, usd
-from models import Portfolio, Trade, User, ensure_portfolios_populated
+from fragment_cache import fragment_cache
+from helpers import (
+    apology,
+    get_stock_suggestions,
+    login_required,
+    lookup,
+    lookup_within_deadline,
+    market_snapshot,
+    usd,
+)
+from leaderboard import current_leaderboard, record_prices
+from lots import ensure_lots_populated, open_lot_rows
+from models import (
+    Portfolio,
+    User,
+    average_cost,
+    ensure_portfolios_populated,
+    holding_rows,
+    trade_history_rows,
+    user_cash,
+)
+from orders import BUY, LIMIT, SELL, STOP, cancel_order, place_order, user_orders
+from trading import TradeRejected, execute_buy, execute_sell
+from valuation import value_history
 
 
 portfolio_bp = Blueprint("portfolio", __name__)
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_SIZE = 25
 
 
 @portfolio_bp.route("/")
 @login_required
+@read_replica
 def index():
     """Show portfolio of stocks"""
     ensure_portfolios_populated(session["user_id"])
-    stocks = Portfolio.query.filter_by(user_id=session["user_id"]).order_by(Portfolio.symbol.asc()).all()
+    stocks = holding_rows(session["user_id"])
 
-    user = User.query.get(session["user_id"])
-    cash = user.cash
+    cash = user_cash(session["user_id"])
     total_value = cash
     total_cost_basis = 0
     stocks_info = []
+    prices = {}
 
-    for stock in stocks:
-        quote = lookup(stock.symbol)
-        if not quote:
-            continue
+    # Quotes and the index strip share one budget; past it the page renders
+    # with what is already known rather than waiting on a slow provider.
+    with deadline(float(os.getenv("DASHBOARD_DEADLINE_SECONDS", "2"))):
+        quotes = lookup_within_deadline([stock.symbol for stock in stocks])
+        market_fetched_at, market_data = market_snapshot()
 
-        current_price = quote["price"]
+    for stock in stocks:
+        quote, stale_since = quotes[stock.symbol]
         total_shares = stock.shares
-        current_value = current_price * total_shares
-
         cost_basis = stock.total_cost_basis
         total_cost_basis += cost_basis
 
+        if quote is None:
+            # No price at all yet: carry the position at cost so totals stay whole.
+            price_state, current_price, current_value, name = "pending", None, cost_basis, stock.symbol
+        else:
+            price_state = "stale" if stale_since else "live"
+            current_price, name = quote["price"], quote["name"]
+            current_value = current_price * total_shares
+            if price_state == "live":
+                prices[stock.symbol] = current_price
+
         gain_loss = current_value - cost_basis
         gain_loss_percent = (gain_loss / cost_basis * 100) if cost_basis > 0 else 0
 
         stocks_info.append(
             {
                 "symbol": stock.symbol,
-                "name": quote["name"],
+                "name": name,
                 "price": current_price,
+                "price_state": price_state,
+                "priced_at": (
+                    datetime.fromtimestamp(stale_since, timezone.utc).strftime("%b %d, %H:%M UTC")
+                    if stale_since
+                    else None
+                ),
                 "total_shares": total_shares,
                 "value": current_value,
                 "cost_basis": cost_basis,
                 "gain_loss": gain_loss,
                 "gain_loss_percent": gain_loss_percent,
-                "avg_purchase_price": stock.avg_purchase_price,
+                "avg_purchase_price": average_cost(cost_basis, total_shares),
                 "allocation_percent": 0,
             }
         )
@@ -59,19 +109,35 @@ def index():
         total_gain_loss = 0
         total_return_percent = 0
 
-    market_data = get_market_data()
+    record_prices(prices)
     invested_value = max(total_value - cash, 0)
 
     stocks_info.sort(key=lambda item: item["value"], reverse=True)
     for stock_info in stocks_info:
         stock_info["allocation_percent"] = (stock_info["value"] / total_value * 100) if total_value > 0 else 0
 
-    best_position = max(stocks_info, key=lambda item: item["gain_loss_percent"], default=None)
-    worst_position = min(stocks_info, key=lambda item: item["gain_loss_percent"], default=None)
+    priced = [item for item in stocks_info if item["price_state"] != "pending"]
+    delayed_prices = len([item for item in stocks_info if item["price_state"] != "live"])
+    best_position = max(priced, key=lambda item: item["gain_loss_percent"], default=None)
+    worst_position = min(priced, key=lambda item: item["gain_loss_percent"], default=None)
     profitable_positions = len([item for item in stocks_info if item["gain_loss"] > 0])
     cash_ratio = (cash / total_value * 100) if total_value > 0 else 0
     invested_ratio = (invested_value / total_value * 100) if total_value > 0 else 0
     market_items = list(market_data.items())
+    market_strip = fragment_cache.render(market_fetched_at, "partials/market_strip.html", market_items=market_items)
+    holdings_version = (
+        session["user_id"],
+        cash,
+        tuple(
+            (item["symbol"], item["name"], item["price"], item["priced_at"], item["total_shares"], item["cost_basis"])
+            for item in stocks_info
+        ),
+    )
+    holdings_table = fragment_cache.render(holdings_version, "partials/holdings.html", stocks_info=stocks_info)
+    value_series = [
+        {"date": row.as_of.isoformat(), "value": row.total_value}
+        for row in value_history(session["user_id"])
+    ]
 
     return render_template(
         "index.html",
@@ -89,8 +155,11 @@ def index():
         invested_ratio=invested_ratio,
         best_position=best_position,
         worst_position=worst_position,
+        delayed_prices=delayed_prices,
         market_data=market_data,
-        market_items=market_items,
+        market_strip=market_strip,
+        holdings_table=holdings_table,
+        value_series=value_series,
     )
 
 
@@ -109,26 +178,19 @@ def buy():
         quote = lookup(symbol)
         if quote is None:
             return apology("Symbol not found", 400)
+        if request.form.get("order_type", "market") != "market":
+            return place_resting_order(BUY, symbol, int(shares), quote["price"])
 
         price = quote["price"]
         total_cost = int(shares) * price
-        user = User.query.get(session["user_id"])
-        portfolio = Portfolio.query.filter_by(user_id=session["user_id"], symbol=symbol).first()
-
-        if user.cash < total_cost:
-            return apology("Cannot afford to purchase", 400)
-
-        user.cash -= total_cost
-        if portfolio is None:
-            portfolio = Portfolio(user_id=session["user_id"], symbol=symbol, shares=0, total_cost_basis=0.0)
-            db.session.add(portfolio)
-
-        portfolio.shares += int(shares)
-        portfolio.total_cost_basis += total_cost
-
-        new_trade = Trade(user_id=session["user_id"], symbol=symbol, shares=int(shares), price=price)
-        db.session.add(new_trade)
+        ensure_lots_populated(session["user_id"])
+        try:
+            execution = execute_buy(session["user_id"], symbol, int(shares), price)
+        except TradeRejected as exc:
+            db.session.rollback()
+            return apology(str(exc), 400)
         db.session.commit()
+        execution.publish()
 
         flash(f"Successfully bought {shares} shares of {symbol} for {usd(total_cost)}!")
         return redirect("/")
@@ -143,12 +205,41 @@ def buy():
 
 @portfolio_bp.route("/history")
 @login_required
+@read_replica
 def history():
     """Show history of transactions"""
-    transactions = Trade.query.filter_by(user_id=session["user_id"]).order_by(Trade.timestamp.desc()).all()
+    transactions = trade_history_rows(session["user_id"])
     return render_template("history.html", transactions=transactions)
 
 
+@portfolio_bp.route("/leaderboard")
+@login_required
+@read_replica
+def leaderboard():
+    """Show the top accounts by total value"""
+    board = current_leaderboard()
+    top = board.top(LEADERBOARD_SIZE)
+    usernames = dict(
+        db.session.execute(
+            select(User.__table__.c.id, User.__table__.c.username).where(
+                User.__table__.c.id.in_([user_id for user_id, _ in top])
+            )
+        ).all()
+    )
+    leaders = [
+        {
+            "rank": position,
+            "username": usernames.get(user_id, "unknown").split("@")[0],
+            "value": value,
+            "is_you": user_id == session["user_id"],
+        }
+        for position, (user_id, value) in enumerate(top, start=1)
+    ]
+    standing = board.rank(session["user_id"])
+
+    return render_template("leaderboard.html", leaders=leaders, standing=standing)
+
+
 @portfolio_bp.route("/quote", methods=["GET", "POST"])
 @login_required
 def quote():
@@ -174,6 +265,7 @@ def quote():
 
 @portfolio_bp.route("/sell", methods=["GET", "POST"])
 @login_required
+@read_replica(methods=("GET",))
 def sell():
     """Sell shares of stock"""
     if request.method == "POST":
@@ -186,6 +278,7 @@ def sell():
             return apology("Must provide shares greater than 0", 400)
 
         ensure_portfolios_populated(session["user_id"])
+        ensure_lots_populated(session["user_id"])
         stock = Portfolio.query.filter_by(user_id=session["user_id"], symbol=symbol).first()
 
         total_shares = stock.shares if stock else None
@@ -195,30 +288,61 @@ def sell():
         quote_data = lookup(symbol)
         if quote_data is None:
             return apology("Unable to fetch stock data. Please try again later.", 400)
+        if request.form.get("order_type", "market") != "market":
+            return place_resting_order(SELL, symbol, int(shares), quote_data["price"])
 
         price = quote_data["price"]
         total_revenue = int(shares) * price
-
-        user = User.query.get(session["user_id"])
-        user.cash += total_revenue
-
-        shares_to_sell = int(shares)
-        avg_cost = stock.avg_purchase_price
-        stock.shares -= shares_to_sell
-        stock.total_cost_basis -= avg_cost * shares_to_sell
-        if stock.shares <= 0:
-            db.session.delete(stock)
-        else:
-            stock.total_cost_basis = max(stock.total_cost_basis, 0.0)
-
-        new_trade = Trade(user_id=session["user_id"], symbol=symbol, shares=-shares_to_sell, price=price)
-        db.session.add(new_trade)
+        lot_ids = [int(lot_id) for lot_id in request.form.getlist("lot_id") if lot_id.isdigit()]
+        try:
+            execution = execute_sell(session["user_id"], symbol, int(shares), price, lot_ids=lot_ids)
+        except TradeRejected as exc:
+            db.session.rollback()
+            return apology(str(exc), 400)
         db.session.commit()
+        execution.publish()
 
         flash(f"Successfully sold {shares} shares of {symbol} for {usd(total_revenue)}!")
         return redirect("/")
 
     ensure_portfolios_populated(session["user_id"])
-    stocks = Portfolio.query.filter_by(user_id=session["user_id"]).order_by(Portfolio.symbol.asc()).all()
+    ensure_lots_populated(session["user_id"])
+    stocks = holding_rows(session["user_id"])
+
+    return render_template("sell.html", stocks=stocks, lots=open_lot_rows(session["user_id"]))
+
 
-    return render_template("sell.html", stocks=stocks)
+def place_resting_order(side, symbol, shares, current_price):
+    """Validate the limit/stop fields of a buy or sell form and store the order."""
+    kind = request.form.get("order_type")
+    if kind not in (LIMIT, STOP):
+        return apology("Unknown order type", 400)
+    try:
+        trigger_price = float(request.form.get("trigger_price", ""))
+    except ValueError:
+        trigger_price = 0.0
+    if not math.isfinite(trigger_price) or trigger_price <= 0:
+        return apology("Must provide a trigger price greater than 0", 400)
+    if side == BUY and user_cash(session["user_id"]) < shares * trigger_price:
+        return apology("Cannot afford to purchase", 400)
+
+    place_order(session["user_id"], side, kind, symbol, shares, trigger_price, current_price=current_price)
+    flash(f"{kind.capitalize()} order placed to {side} {shares} shares of {symbol} at {usd(trigger_price)}.")
+    return redirect("/orders")
+
+
+@portfolio_bp.route("/orders")
+@login_required
+def orders():
+    """Show open and recent limit/stop orders"""
+    return render_template("orders.html", orders=user_orders(session["user_id"]))
+
+
+@portfolio_bp.route("/orders/<int:order_id>/cancel", methods=["POST"])
+@login_required
+def cancel(order_id):
+    if cancel_order(session["user_id"], order_id):
+        flash("Order cancelled.")
+    else:
+        flash("That order is no longer open.")
+    return redirect("/orders")
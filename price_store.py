@@ -0,0 +1,207 @@
+import fcntl
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import click
+import numpy as np
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select
+
+from extensions import db
+from helpers import get_price_history, lookup_within_deadline
+from models import Portfolio
+
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = (
+    ("ts", np.int64),
+    ("open", np.float64),
+    ("high", np.float64),
+    ("low", np.float64),
+    ("close", np.float64),
+    ("volume", np.float64),
+)
+SYMBOL_PATTERN = re.compile(r"^[A-Z0-9.^=-]{1,15}$")
+BACKFILL_ATTEMPT_LIMIT = 10000
+
+
+class PriceStore:
+    """Append-only daily OHLCV bars, one directory per symbol.
+
+    Each column is a raw little-endian file (``ts`` holds epoch seconds at
+    the start of the bar's UTC day) read through ``np.memmap``, so a range
+    query is a ``searchsorted`` on ``ts`` plus slices that share the mapped
+    pages instead of copying them. Writers append to every column under an
+    exclusive ``flock``, ``ts`` last, and readers only trust as many rows as
+    every column holds.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def _symbol_dir(self, symbol):
+        symbol = symbol.upper()
+        if not SYMBOL_PATTERN.match(symbol):
+            raise ValueError(f"invalid symbol {symbol!r}")
+        return os.path.join(self.root, symbol)
+
+    def _row_count(self, path):
+        return min(
+            os.path.getsize(os.path.join(path, name)) // np.dtype(dtype).itemsize
+            if os.path.exists(os.path.join(path, name)) else 0
+            for name, dtype in COLUMNS
+        )
+
+    def columns(self, symbol):
+        """Return ``{column: memmap}`` for every stored bar of ``symbol``."""
+        symbol = symbol.upper()
+        path = self._symbol_dir(symbol)
+        rows = self._row_count(path) if os.path.isdir(path) else 0
+        if rows == 0:
+            return {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS}
+
+        with self._lock:
+            cached = self._maps.get(symbol)
+            if cached is None or cached[0] != rows:
+                cached = (
+                    rows,
+                    {
+                        name: np.memmap(os.path.join(path, name), dtype=dtype, mode="r", shape=(rows,))
+                        for name, dtype in COLUMNS
+                    },
+                )
+                self._maps[symbol] = cached
+        return cached[1]
+
+    def last_timestamp(self, symbol):
+        ts = self.columns(symbol)["ts"]
+        return int(ts[-1]) if len(ts) else None
+
+    def range(self, symbol, start=None, end=None):
+        """Return column views for bars with ``start <= ts <= end``."""
+        data = self.columns(symbol)
+        ts = data["ts"]
+        low = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+        high = len(ts) if end is None else int(np.searchsorted(ts, end, side="right"))
+        return {name: column[low:high] for name, column in data.items()}
+
+    def append(self, symbol, bars):
+        """Append ``(ts, open, high, low, close, volume)`` bars newer than the last one stored."""
+        path = self._symbol_dir(symbol)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            rows = self._row_count(path)
+            last = None
+            if rows:
+                with open(os.path.join(path, "ts"), "rb") as ts_file:
+                    ts_file.seek((rows - 1) * 8)
+                    last = int(np.frombuffer(ts_file.read(8), dtype=np.int64)[0])
+
+            fresh = sorted(bar for bar in bars if last is None or bar[0] > last)
+            if not fresh:
+                return 0
+            table = np.array(fresh, dtype=np.float64)
+            for position, (name, dtype) in reversed(list(enumerate(COLUMNS))):
+                column_path = os.path.join(path, name)
+                with open(column_path, "r+b" if os.path.exists(column_path) else "wb") as column:
+                    column.seek(rows * np.dtype(dtype).itemsize)
+                    column.write(table[:, position].astype(dtype).tobytes())
+        return len(fresh)
+
+
+_stores = {}
+_backfill_attempts = OrderedDict()
+_backfill_attempts_lock = threading.Lock()
+
+
+def price_store_root():
+    return os.getenv("PRICE_STORE_DIR") or os.path.join(current_app.instance_path, "prices")
+
+
+def get_price_store():
+    root = price_store_root()
+    store = _stores.get(root)
+    if store is None:
+        store = _stores.setdefault(root, PriceStore(root))
+    return store
+
+
+def _today_start():
+    now = datetime.now(timezone.utc)
+    return int(datetime(now.year, now.month, now.day, tzinfo=timezone.utc).timestamp())
+
+
+def _has_recent_bars(store, symbol):
+    last = store.last_timestamp(symbol)
+    return last is not None and last >= _today_start() - 86400
+
+
+def backfill(symbol, store=None, fetch=None):
+    """Fetch and store completed daily bars newer than the last stored one."""
+    store = store or get_price_store()
+    fetch = fetch or get_price_history
+    symbol = symbol.upper()
+    if _has_recent_bars(store, symbol):
+        return 0
+
+    last = store.last_timestamp(symbol)
+    today = _today_start()
+    bars = fetch(symbol, start=(last + 86400) if last is not None else None)
+    completed = [bar for bar in bars or [] if bar[0] < today]
+    added = store.append(symbol, completed)
+    logger.info("Backfilled %s bars for %s", added, symbol)
+    return added
+
+
+def should_backfill(symbol, store=None, retry_seconds=900):
+    """True when ``symbol`` lacks yesterday's bar, at most once per ``retry_seconds`` per symbol in this process.
+
+    Only symbols a provider can quote are remembered, and at most
+    ``BACKFILL_ATTEMPT_LIMIT`` of them, so made-up symbols cannot grow the
+    table.
+    """
+    symbol = symbol.upper()
+    now = time.monotonic()
+    with _backfill_attempts_lock:
+        # Oldest first, so expired attempts all sit at the front.
+        while _backfill_attempts and now - next(iter(_backfill_attempts.values())) >= retry_seconds:
+            _backfill_attempts.popitem(last=False)
+        if symbol in _backfill_attempts:
+            return False
+
+    if _has_recent_bars(store or get_price_store(), symbol):
+        return False
+    quote, _ = lookup_within_deadline([symbol])[symbol]
+    if quote is None:
+        return False
+
+    with _backfill_attempts_lock:
+        _backfill_attempts[symbol] = now
+        _backfill_attempts.move_to_end(symbol)
+        while len(_backfill_attempts) > BACKFILL_ATTEMPT_LIMIT:
+            _backfill_attempts.popitem(last=False)
+    return True
+
+
+@click.command("backfill-prices")
+@click.argument("symbols", nargs=-1)
+@with_appcontext
+def backfill_prices_command(symbols):
+    """Backfill daily bars for SYMBOLS (default: every held symbol)."""
+    if not symbols:
+        portfolios = Portfolio.__table__
+        symbols = db.session.execute(select(portfolios.c.symbol).distinct()).scalars().all()
+    total = 0
+    for symbol in symbols:
+        total += backfill(symbol)
+    click.echo(f"Stored {total} new bars for {len(symbols)} symbols.")
@@ -0,0 +1,185 @@
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from flask import current_app, g, request
+
+from helpers import is_admin
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PARAM = "_profile"
+WINDOW_FILE = "window.json"
+SAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def collapse(frame):
+    """Return a frame's stack as a root-first ``a;b;c`` string for flamegraph.pl."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """Samples the stacks of registered threads from one background thread.
+
+    The sampler thread only runs while at least one thread is registered, so
+    it costs nothing between profiles. Each sample is a dictionary lookup
+    in ``sys._current_frames()`` and a walk up the frame chain.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._samples[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._samples.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._samples:
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                for thread_id, samples in self._samples.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[collapse(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+class ProfilingWindow:
+    """A time window in which matching requests are profiled.
+
+    Kept as a small JSON file in the profile directory so every worker on
+    the host sees it; workers re-read it at most once per ``refresh`` seconds.
+    """
+
+    def __init__(self, directory, refresh=1.0):
+        self.path = os.path.join(directory, WINDOW_FILE)
+        self.refresh = refresh
+        self._state = None
+        self._checked_at = float("-inf")
+
+    def current(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.refresh:
+            self._checked_at = now
+            try:
+                with open(self.path) as handle:
+                    self._state = json.load(handle)
+            except (OSError, ValueError):
+                self._state = None
+        state = self._state
+        if state is None or state["until"] <= time.time():
+            return None
+        return state
+
+    def matches(self, path):
+        state = self.current()
+        return state is not None and path.startswith(state.get("path_prefix") or "/")
+
+    def open(self, seconds, path_prefix="/"):
+        state = {"until": time.time() + seconds, "path_prefix": path_prefix}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        partial = f"{self.path}.{os.getpid()}.tmp"
+        with open(partial, "w") as handle:
+            json.dump(state, handle)
+        os.replace(partial, self.path)
+        self._checked_at = float("-inf")
+        return state
+
+    def close(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self._checked_at = float("-inf")
+
+
+def profile_dir(app=None):
+    app = app or current_app
+    return os.getenv("PROFILE_DIR") or os.path.join(app.instance_path, "profiles")
+
+
+def list_profiles(directory):
+    profiles = []
+    for name in os.listdir(directory) if os.path.isdir(directory) else ():
+        if name.endswith(".folded"):
+            stat = os.stat(os.path.join(directory, name))
+            profiles.append({"name": name, "bytes": stat.st_size, "modified": stat.st_mtime})
+    return sorted(profiles, key=lambda item: item["modified"], reverse=True)
+
+
+def write_profile(directory, endpoint, samples, max_files):
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%f")
+    name = f"{stamp}-{SAFE_NAME.sub('_', endpoint)}-{os.getpid()}.folded"
+    with open(os.path.join(directory, name), "w") as handle:
+        for stack, count in samples.most_common():
+            handle.write(f"{stack} {count}\n")
+
+    for stale in list_profiles(directory)[max_files:]:
+        os.remove(os.path.join(directory, stale["name"]))
+    return name
+
+
+def init_profiling(app):
+    """Profile requests on demand and write collapsed stacks to ``PROFILE_DIR``.
+
+    A request is profiled when an admin adds ``?_profile=1`` or while a
+    window opened from ``/admin/profiling`` covers its path. With neither,
+    the hooks below return after a cached window check.
+    """
+    profiler = SamplingProfiler(interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000)
+    window = ProfilingWindow(profile_dir(app))
+    max_files = int(os.getenv("PROFILE_MAX_FILES", "200"))
+    app.extensions["profiling"] = {"profiler": profiler, "window": window}
+
+    @app.before_request
+    def start_profile():
+        if PROFILE_PARAM in request.args:
+            if not is_admin():
+                return
+        elif not window.matches(request.path):
+            return
+        g._profile_thread = threading.get_ident()
+        profiler.start(g._profile_thread)
+
+    @app.teardown_request
+    def finish_profile(exc):
+        thread_id = g.pop("_profile_thread", None)
+        if thread_id is None:
+            return
+        samples = profiler.stop(thread_id)
+        if not samples:
+            return
+        endpoint = request.url_rule.endpoint if request.url_rule is not None else "unmatched"
+        try:
+            name = write_profile(profile_dir(app), endpoint, samples, max_files)
+        except OSError:
+            logger.exception("Could not write profile for %s", request.path)
+        else:
+            logger.info("Wrote profile %s (%s samples)", name, sum(samples.values()))
@@ -0,0 +1,42 @@
+"""Market-data backends behind ``helpers.lookup`` and the other quote helpers.
+
+A backend is any object with a ``name`` and four methods:
+
+- ``quote(symbol)``: ``{"symbol", "name", "price"}`` or None if unknown
+- ``search(query)``: up to 10 matching symbols
+- ``indices()``: ``{"S&P 500": {"price", "change", "change_percent"}, ...}``
+- ``history(symbol, start=None)``: daily ``(ts, open, high, low, close, volume)`` bars
+
+``MARKET_DATA_PROVIDER`` names the backends to use, comma-separated and
+tried in order: ``live`` (the real APIs, the default) or ``simulator``.
+"""
+import os
+
+
+class ProviderError(Exception):
+    """A backend could not answer this call; the next configured one is tried."""
+
+
+def _build(name):
+    if name == "live":
+        from providers.live import LiveProvider
+
+        return LiveProvider()
+    if name == "simulator":
+        from providers.simulator import SimulatedMarket
+
+        return SimulatedMarket.from_env()
+    raise ValueError(f"Unknown MARKET_DATA_PROVIDER {name!r}")
+
+
+_configured = (None, ())
+
+
+def market_providers():
+    """The configured backends, built once and rebuilt if the setting changes."""
+    global _configured
+    spec = os.getenv("MARKET_DATA_PROVIDER", "live")
+    if _configured[0] != spec:
+        names = [name.strip().lower() for name in spec.split(",") if name.strip()]
+        _configured = (spec, tuple(_build(name) for name in names or ["live"]))
+    return _configured[1]
@@ -0,0 +1,168 @@
+import logging
+import time
+
+from deadlines import DeadlineExceeded
+from helpers import _env, _http
+from rate_limits import ProviderBusy
+
+
+logger = logging.getLogger(__name__)
+
+YAHOO_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+INDEX_NAMES = {
+    "^GSPC": "S&P 500",
+    "^IXIC": "NASDAQ",
+    "^DJI": "DOW",
+}
+
+
+class LiveProvider:
+    """Finnhub and Alpha Vantage when their keys are set, then Yahoo Finance."""
+
+    name = "live"
+
+    def quote(self, symbol):
+        # Try Finnhub API first (best free API for stocks)
+        finnhub_key = _env("FINNHUB_API_KEY")
+        if finnhub_key:
+            try:
+                # Get current price
+                price_url = f"https://finnhub.io/api/v1/quote?symbol={symbol}&token={finnhub_key}"
+                price_response = _http("finnhub", "GET", price_url, timeout=10).json()
+
+                # Get company profile for name
+                profile_url = f"https://finnhub.io/api/v1/stock/profile2?symbol={symbol}&token={finnhub_key}"
+                profile_response = _http("finnhub", "GET", profile_url, timeout=10).json()
+
+                if price_response.get("c") and price_response.get("c") > 0:  # 'c' is current price
+                    return {
+                        "symbol": symbol.upper(),
+                        "name": profile_response.get("name", symbol.upper()),
+                        "price": float(price_response["c"])
+                    }
+            except DeadlineExceeded:
+                raise
+            except ProviderBusy:
+                logger.info("Finnhub quota exhausted; trying the next provider for %s", symbol)
+            except Exception:
+                logger.exception("Finnhub API lookup failed for symbol %s", symbol)
+
+        # Try Alpha Vantage API as fallback
+        alpha_vantage_key = _env("ALPHA_VANTAGE_API_KEY")
+        if alpha_vantage_key:
+            try:
+                url = f"https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey={alpha_vantage_key}"
+                response = _http("alphavantage", "GET", url, timeout=10).json()
+
+                if "Global Quote" in response and response["Global Quote"]:
+                    quote = response["Global Quote"]
+                    price = float(quote["05. price"])
+
+                    return {
+                        "symbol": symbol.upper(),
+                        "name": symbol.upper(),  # Alpha Vantage doesn't provide company name in this endpoint
+                        "price": price
+                    }
+            except DeadlineExceeded:
+                raise
+            except ProviderBusy:
+                logger.info("Alpha Vantage quota exhausted; trying the next provider for %s", symbol)
+            except Exception:
+                logger.exception("Alpha Vantage lookup failed for symbol %s", symbol)
+
+        # Try Yahoo Finance alternative (via yfinance-like API)
+        try:
+            url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
+            response = _http("yahoo", "GET", url, headers=YAHOO_HEADERS, timeout=10).json()
+
+            if response.get("chart") and response["chart"]["result"]:
+                result = response["chart"]["result"][0]
+                price = result["meta"]["regularMarketPrice"]
+                name = result["meta"].get("longName", symbol.upper())
+
+                return {
+                    "symbol": symbol.upper(),
+                    "name": name,
+                    "price": float(price)
+                }
+        except DeadlineExceeded:
+            raise
+        except Exception:
+            logger.exception("Yahoo Finance lookup failed for symbol %s", symbol)
+        return None
+
+    def search(self, query):
+        # Try Finnhub symbol search first
+        finnhub_key = _env("FINNHUB_API_KEY")
+        if finnhub_key:
+            try:
+                url = f"https://finnhub.io/api/v1/search?q={query}&token={finnhub_key}"
+                response = _http("finnhub", "GET", url, timeout=5).json()
+
+                if response.get("result"):
+                    return [item["symbol"] for item in response["result"][:10]]
+            except DeadlineExceeded:
+                raise
+            except ProviderBusy:
+                logger.info("Finnhub quota exhausted; trying the next provider for %s", query)
+            except Exception:
+                logger.exception("Finnhub symbol search failed for query %s", query)
+
+        # Try Alpha Vantage as fallback
+        alpha_vantage_key = _env("ALPHA_VANTAGE_API_KEY")
+        if alpha_vantage_key:
+            try:
+                url = f"https://www.alphavantage.co/query?function=SYMBOL_SEARCH&keywords={query}&apikey={alpha_vantage_key}"
+                response = _http("alphavantage", "GET", url, timeout=5).json()
+
+                if "bestMatches" in response:
+                    return [match['1. symbol'] for match in response['bestMatches'][:10]]
+            except DeadlineExceeded:
+                raise
+            except ProviderBusy:
+                logger.info("Alpha Vantage quota exhausted; no suggestions for %s", query)
+            except Exception:
+                logger.exception("Alpha Vantage symbol search failed for query %s", query)
+        return []
+
+    def indices(self):
+        market_data = {}
+        for index, name in INDEX_NAMES.items():
+            try:
+                url = f"https://query1.finance.yahoo.com/v8/finance/chart/{index}"
+                response = _http("yahoo", "GET", url, headers=YAHOO_HEADERS, timeout=5).json()
+
+                if response.get("chart") and response["chart"]["result"]:
+                    result = response["chart"]["result"][0]
+                    current_price = result["meta"]["regularMarketPrice"]
+                    previous_close = result["meta"]["previousClose"]
+                    change = current_price - previous_close
+                    market_data[name] = {
+                        "price": current_price,
+                        "change": change,
+                        "change_percent": (change / previous_close) * 100
+                    }
+            except Exception:
+                logger.debug("Yahoo Finance index quote failed for %s", index, exc_info=True)
+        return market_data
+
+    def history(self, symbol, start=None):
+        url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
+        params = {
+            "period1": int(start or 0),
+            "period2": int(time.time()),
+            "interval": "1d",
+        }
+        response = _http("yahoo", "GET", url, headers=YAHOO_HEADERS, params=params, timeout=10).json()
+
+        result = response["chart"]["result"][0]
+        quote = result["indicators"]["quote"][0]
+        bars = []
+        for index, ts in enumerate(result.get("timestamp") or []):
+            values = [quote[name][index] for name in ("open", "high", "low", "close", "volume")]
+            if any(value is None for value in values):
+                continue
+            bars.append((ts - ts % 86400, *(float(value) for value in values)))
+        return bars
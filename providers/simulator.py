@@ -0,0 +1,241 @@
+import bisect
+import hashlib
+import logging
+import math
+import os
+import random
+import struct
+import time
+
+from deadlines import DeadlineExceeded, remaining
+from metrics import upstream_timer
+from providers import ProviderError
+
+
+logger = logging.getLogger(__name__)
+
+EPOCH = 946684800  # 2000-01-01T00:00:00Z, the first simulated step
+ANCHOR = 1735689600  # 2025-01-01T00:00:00Z, where each symbol sits at its base price
+LEVELS = 26  # 2**26 steps covers a century at one-minute steps
+SECONDS_PER_YEAR = 365 * 86400
+
+FAMILIAR = {
+    "AAPL": "Apple Inc",
+    "MSFT": "Microsoft Corporation",
+    "GOOGL": "Alphabet Inc",
+    "AMZN": "Amazon.com Inc",
+    "NVDA": "NVIDIA Corporation",
+    "META": "Meta Platforms Inc",
+    "TSLA": "Tesla Inc",
+    "JPM": "JPMorgan Chase & Co",
+    "V": "Visa Inc",
+    "KO": "Coca-Cola Company",
+    "DIS": "Walt Disney Company",
+    "NFLX": "Netflix Inc",
+}
+INDICES = {
+    "^GSPC": ("S&P 500", 5900.0),
+    "^IXIC": ("NASDAQ", 19300.0),
+    "^DJI": ("DOW", 42500.0),
+}
+NAME_WORDS = (
+    "Acme", "Apex", "Atlas", "Beacon", "Cedar", "Crescent", "Delta", "Ember", "Falcon", "Granite",
+    "Harbor", "Horizon", "Iron", "Juniper", "Keystone", "Lumen", "Maple", "Meridian", "Nova", "Orchid",
+    "Pioneer", "Quartz", "Summit", "Redwood", "Sterling", "Titan", "Union", "Vertex", "Willow", "Zenith",
+)
+NAME_KINDS = ("Holdings", "Systems", "Energy", "Therapeutics", "Financial", "Networks", "Foods", "Industries")
+
+
+class SimulatedMarket:
+    """Deterministic geometric-Brownian-motion prices for a synthetic universe.
+
+    Each symbol's path is a Brownian bridge built top-down from hashed
+    normals, so the price at any step costs ``LEVELS`` hashes, needs no
+    stored state, and is identical across workers and restarts for the same
+    ``seed``. ``latency`` (plus up to ``jitter``) seconds are slept and a
+    ``ProviderError`` raised with probability ``error_rate`` on every call,
+    to exercise timeouts, caching and fallbacks without a real provider.
+    """
+
+    name = "simulator"
+
+    def __init__(self, seed=0, symbols=5000, step_seconds=60, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.seed = seed
+        self.step_seconds = step_seconds
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._key = hashlib.blake2b(str(seed).encode(), digest_size=16).digest()
+        self._faults = random.Random(seed)
+        self._names = dict(FAMILIAR)
+        self._names.update(self._generate_universe(symbols - len(FAMILIAR)))
+        self._sorted = sorted(self._names)
+        self._params = {}
+        self._latest = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            seed=int(os.getenv("SIMULATOR_SEED", "0")),
+            symbols=int(os.getenv("SIMULATOR_SYMBOLS", "5000")),
+            step_seconds=float(os.getenv("SIMULATOR_STEP_SECONDS", "60")),
+            latency=float(os.getenv("SIMULATOR_LATENCY_MS", "0")) / 1000,
+            jitter=float(os.getenv("SIMULATOR_JITTER_MS", "0")) / 1000,
+            error_rate=float(os.getenv("SIMULATOR_ERROR_RATE", "0")),
+        )
+
+    @property
+    def symbols(self):
+        """Every quotable symbol except the indices, sorted."""
+        return list(self._sorted)
+
+    def _generate_universe(self, count):
+        rng = random.Random(f"universe:{self.seed}")
+        universe = {}
+        while len(universe) < count:
+            symbol = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(rng.randint(3, 4)))
+            if symbol not in FAMILIAR and symbol not in universe:
+                universe[symbol] = f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_WORDS)} {rng.choice(NAME_KINDS)}"
+        return universe
+
+    def _uniform_pair(self, label):
+        digest = hashlib.blake2b(label.encode(), digest_size=16, key=self._key).digest()
+        high, low = struct.unpack("<QQ", digest)
+        return ((high >> 11) + 1) * 2.0 ** -53, (low >> 11) * 2.0 ** -53
+
+    def _normal(self, label):
+        first, second = self._uniform_pair(label)
+        return math.sqrt(-2.0 * math.log(first)) * math.cos(2.0 * math.pi * second)
+
+    def _brownian(self, symbol, step):
+        """Standard Brownian motion (in step units) of ``symbol`` at ``step``."""
+        low, high = 0, 1 << LEVELS
+        w_low, w_high = 0.0, math.sqrt(high) * self._normal(f"{symbol}:end")
+        while high - low > 1:
+            middle = (low + high) // 2
+            spread = math.sqrt((high - low) / 4)
+            w_middle = (w_low + w_high) / 2 + spread * self._normal(f"{symbol}:{low}:{high}")
+            if step < middle:
+                high, w_high = middle, w_middle
+            else:
+                low, w_low = middle, w_middle
+        return w_low
+
+    def _parameters(self, symbol):
+        params = self._params.get(symbol)
+        if params is None:
+            if symbol in INDICES:
+                base, drift, volatility = INDICES[symbol][1], 0.07, 0.18
+            else:
+                spot, trend = self._uniform_pair(f"{symbol}:params")
+                base = math.exp(math.log(5) + spot * (math.log(800) - math.log(5)))
+                drift = -0.05 + 0.2 * trend
+                volatility = 0.15 + 0.35 * self._uniform_pair(f"{symbol}:vol")[0]
+            dt = self.step_seconds / SECONDS_PER_YEAR
+            anchor = self._step(ANCHOR)
+            params = self._params[symbol] = (
+                math.log(base),
+                (drift - volatility * volatility / 2) * dt,
+                volatility * math.sqrt(dt),
+                anchor,
+                self._brownian(symbol, anchor),
+            )
+        return params
+
+    def _step(self, at):
+        return min(max(int((at - EPOCH) // self.step_seconds), 0), (1 << LEVELS) - 1)
+
+    def price_at(self, symbol, at):
+        log_base, drift, scale, anchor, w_anchor = self._parameters(symbol)
+        step = self._step(at)
+        return math.exp(log_base + drift * (step - anchor) + scale * (self._brownian(symbol, step) - w_anchor))
+
+    def _current(self, symbol, now):
+        step = self._step(now)
+        latest = self._latest.get(symbol)
+        if latest is None or latest[0] != step:
+            latest = self._latest[symbol] = (step, self.price_at(symbol, now))
+        return latest[1]
+
+    def _respond(self):
+        """Apply the configured latency and fault injection to one call."""
+        delay = self.latency + (self._faults.random() * self.jitter if self.jitter else 0.0)
+        left = remaining()
+        if left is not None and delay >= left:
+            # A real client would time out here, so give up when the budget does.
+            time.sleep(max(left, 0.0))
+            raise DeadlineExceeded("simulated provider did not answer within the request deadline")
+        if delay:
+            time.sleep(delay)
+        if self.error_rate and self._faults.random() < self.error_rate:
+            raise ProviderError("simulated provider failure")
+
+    def quote(self, symbol):
+        with upstream_timer(self.name):
+            self._respond()
+        symbol = symbol.upper()
+        name = self._names.get(symbol) or INDICES.get(symbol, (None,))[0]
+        if name is None:
+            return None
+        return {"symbol": symbol, "name": name, "price": round(self._current(symbol, time.time()), 2)}
+
+    def search(self, query):
+        with upstream_timer(self.name):
+            self._respond()
+        query = query.strip().upper()
+        if not query:
+            return []
+        start = bisect.bisect_left(self._sorted, query)
+        matches = []
+        for symbol in self._sorted[start:start + 10]:
+            if not symbol.startswith(query):
+                break
+            matches.append(symbol)
+        if len(matches) < 10:
+            lowered = query.lower()
+            for symbol in self._sorted:
+                if symbol not in matches and lowered in self._names[symbol].lower():
+                    matches.append(symbol)
+                    if len(matches) == 10:
+                        break
+        return matches
+
+    def indices(self):
+        with upstream_timer(self.name):
+            self._respond()
+        now = time.time()
+        previous_close_at = now - now % 86400 - 1
+        market_data = {}
+        for symbol, (name, _) in INDICES.items():
+            price = self._current(symbol, now)
+            previous_close = self.price_at(symbol, previous_close_at)
+            change = price - previous_close
+            market_data[name] = {
+                "price": round(price, 2),
+                "change": round(change, 2),
+                "change_percent": change / previous_close * 100,
+            }
+        return market_data
+
+    def history(self, symbol, start=None):
+        with upstream_timer(self.name):
+            self._respond()
+        symbol = symbol.upper()
+        if symbol not in self._names and symbol not in INDICES:
+            return []
+        now = time.time()
+        day = max(int(start or 0), EPOCH)
+        day -= day % 86400
+        bars = []
+        open_price = self.price_at(symbol, day)
+        while day < now:
+            close_at = min(day + 86399, now)
+            close = self.price_at(symbol, close_at)
+            inside = [self.price_at(symbol, min(day + hours * 3600, now)) for hours in (6, 15)]
+            high = max(open_price, close, *inside)
+            low = min(open_price, close, *inside)
+            volume = float(int(100_000 + self._uniform_pair(f"{symbol}:volume:{day}")[0] * 5_000_000))
+            bars.append((day, round(open_price, 4), round(high, 4), round(low, 4), round(close, 4), volume))
+            open_price = close
+            day += 86400
+        return bars
@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from deadlines import remaining
+from metrics import Counter, register_collector
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    fetched_at REAL,
+    value TEXT,
+    lease_owner TEXT,
+    lease_until REAL
+) WITHOUT ROWID
+"""
+PRUNE_EVERY = 1000
+
+CACHE_REQUESTS = Counter(
+    "quote_cache_requests_total", "Shared quote cache lookups by result.", ("result",)
+)
+register_collector(CACHE_REQUESTS.expose)
+
+
+class SharedCache:
+    """A small key/value cache in a SQLite file shared by every worker on the host.
+
+    Values are compact JSON with the time they were fetched. In WAL mode
+    readers never wait on writers, so a fresh hit is one primary-key
+    ``SELECT`` on a per-thread connection. When an entry is missing or older
+    than ``ttl``, workers race for a lease with a conditional ``UPDATE``:
+    the single winner calls upstream and writes the result, while the rest
+    serve the stale value (up to ``max_stale`` seconds old) or, with nothing
+    to serve, poll for up to ``wait`` seconds before fetching themselves.
+    Upstream traffic per key therefore stays flat as workers are added.
+    """
+
+    def __init__(self, path=None, lease_seconds=10.0, wait=2.0, max_stale=300.0):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.wait = wait
+        self.max_stale = max_stale
+        self._local = threading.local()
+        self._writes = 0
+
+    def configure(self, path, **settings):
+        self.path = path
+        for name, value in settings.items():
+            setattr(self, name, value)
+        self._local = threading.local()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._connection().execute(SCHEMA)
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork so a preloading
+        # gunicorn master never shares its handle with the workers.
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+    def _read(self, key):
+        return self._connection().execute(
+            "SELECT fetched_at, value FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+
+    def _claim(self, key, owner, now, ttl):
+        # Only a still-stale entry can be leased, so a worker that read the
+        # row just before another refreshed it does not fetch it again.
+        connection = self._connection()
+        connection.execute("INSERT OR IGNORE INTO entries (key) VALUES (?)", (key,))
+        claimed = connection.execute(
+            "UPDATE entries SET lease_owner = ?, lease_until = ? "
+            "WHERE key = ? AND (lease_until IS NULL OR lease_until < ?) "
+            "AND (fetched_at IS NULL OR fetched_at <= ?)",
+            (owner, now + self.lease_seconds, key, now, now - ttl),
+        ).rowcount
+        return claimed == 1
+
+    def _store(self, key, owner, value):
+        connection = self._connection()
+        fetched_at = time.time()
+        if value is None:
+            # Nothing to keep: drop a row that never had a value, otherwise
+            # just give up the lease and keep serving the old one.
+            connection.execute(
+                "DELETE FROM entries WHERE key = ? AND lease_owner = ? AND value IS NULL", (key, owner)
+            )
+            connection.execute(
+                "UPDATE entries SET lease_owner = NULL, lease_until = NULL WHERE key = ? AND lease_owner = ?",
+                (key, owner),
+            )
+        else:
+            connection.execute(
+                "UPDATE entries SET fetched_at = ?, value = ?, lease_owner = NULL, lease_until = NULL WHERE key = ?",
+                (fetched_at, json.dumps(value, separators=(",", ":")), key),
+            )
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self.prune(fetched_at)
+        return fetched_at if value is not None else None
+
+    def prune(self, now=None):
+        """Delete entries older than a day and empty rows whose lease is gone."""
+        now = time.time() if now is None else now
+        self._connection().execute(
+            "DELETE FROM entries WHERE (fetched_at < ? AND lease_until IS NULL) "
+            "OR (fetched_at IS NULL AND (lease_until IS NULL OR lease_until < ?))",
+            (now - 86400, now),
+        )
+
+    def get(self, key, ttl, fetch):
+        """Return ``(fetched_at, value)`` for ``key``, refreshing it via ``fetch()`` when stale.
+
+        ``fetch`` returns None when upstream has nothing; that is not cached.
+        Returns ``(None, None)`` when neither the cache nor ``fetch`` has a value.
+        """
+        if not self.path:
+            value = fetch()
+            return (time.time() if value is not None else None), value
+
+        try:
+            row = self._read(key)
+        except sqlite3.Error:
+            logger.exception("Shared cache read failed for %s; calling upstream directly", key)
+            CACHE_REQUESTS.inc("error")
+            value = fetch()
+            return (time.time() if value is not None else None), value
+
+        now = time.time()
+        if row is not None and row[1] is not None and now - row[0] < ttl:
+            CACHE_REQUESTS.inc("hit")
+            return row[0], json.loads(row[1])
+
+        stale = row if row is not None and row[1] is not None and now - row[0] < self.max_stale else None
+        owner = f"{os.getpid()}:{threading.get_ident()}"
+        left = remaining()
+        deadline = now + (self.wait if left is None else max(min(self.wait, left), 0.0))
+        try:
+            while True:
+                if self._claim(key, owner, now, ttl):
+                    return self._refresh(key, owner, fetch, stale)
+                row = self._read(key)
+                now = time.time()
+                if row is not None and row[1] is not None and now - row[0] < ttl:
+                    CACHE_REQUESTS.inc("waited")
+                    return row[0], json.loads(row[1])
+                if stale is not None:
+                    CACHE_REQUESTS.inc("stale")
+                    return stale[0], json.loads(stale[1])
+                if now >= deadline:
+                    CACHE_REQUESTS.inc("wait_timeout")
+                    break
+                # Another worker is fetching a value we have never had; wait for it.
+                time.sleep(0.02)
+                now = time.time()
+        except sqlite3.Error:
+            logger.warning("Shared cache lease failed for %s; calling upstream directly", key, exc_info=True)
+            CACHE_REQUESTS.inc("error")
+            if stale is not None:
+                return stale[0], json.loads(stale[1])
+        value = fetch()
+        return (time.time() if value is not None else None), value
+
+    def peek(self, key):
+        """Return ``(fetched_at, value)`` for whatever is cached under ``key``, however old.
+
+        Never calls upstream; ``(None, None)`` when there is nothing.
+        """
+        if not self.path:
+            return None, None
+        try:
+            row = self._read(key)
+        except sqlite3.Error:
+            logger.warning("Shared cache read failed for %s", key, exc_info=True)
+            return None, None
+        if row is None or row[1] is None:
+            return None, None
+        return row[0], json.loads(row[1])
+
+    def _refresh(self, key, owner, fetch, stale):
+        CACHE_REQUESTS.inc("refresh")
+        value = None
+        try:
+            value = fetch()
+        finally:
+            try:
+                fetched_at = self._store(key, owner, value)
+            except sqlite3.Error:
+                logger.exception("Could not store %s in the shared cache", key)
+                fetched_at = time.time()
+        if value is None and stale is not None:
+            return stale[0], json.loads(stale[1])
+        return (fetched_at if value is not None else None), value
+
+
+quote_cache = SharedCache()
+
+
+def init_quote_cache(app):
+    """Share quotes and the index snapshot between the workers on this host.
+
+    The cache lives in ``QUOTE_CACHE_PATH`` (default
+    ``instance/quote_cache.db``; ``off`` makes every lookup go upstream).
+    """
+    path = os.getenv("QUOTE_CACHE_PATH") or os.path.join(app.instance_path, "quote_cache.db")
+    if path.lower() == "off":
+        quote_cache.configure(None)
+        return
+    quote_cache.configure(
+        path,
+        lease_seconds=float(os.getenv("QUOTE_CACHE_LEASE_SECONDS", "10")),
+        wait=float(os.getenv("QUOTE_CACHE_WAIT_SECONDS", "2")),
+        max_stale=float(os.getenv("QUOTE_CACHE_MAX_STALE", "300")),
+    )
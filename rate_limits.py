@@ -0,0 +1,195 @@
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import has_request_context
+
+from metrics import register_collector
+
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Default "calls/seconds" per provider, overridable with RATE_LIMIT_<PROVIDER>;
+# an empty limit means unlimited.
+DEFAULT_LIMITS = {
+    "alphavantage": "5/60",
+    "finnhub": "60/60",
+    "yahoo": "",
+    "groq": "",
+    "google": "",
+}
+
+_priority = ContextVar("provider_priority", default=None)
+
+
+class ProviderBusy(Exception):
+    """No token became available for ``provider`` in time; try the next provider."""
+
+    def __init__(self, provider):
+        super().__init__(f"{provider} rate limit reached")
+        self.provider = provider
+
+
+class TokenBucket:
+    def __init__(self, calls, period):
+        self.capacity = float(calls)
+        self.rate = calls / period
+        self.tokens = float(calls)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+def parse_limit(value):
+    """``"5/60"`` -> ``(5, 60.0)``; empty, ``0`` or ``off`` -> None."""
+    value = (value or "").strip().lower()
+    if value in ("", "0", "off", "none"):
+        return None
+    calls, _, period = value.partition("/")
+    return int(calls), float(period or 1)
+
+
+class ProviderScheduler:
+    """Token buckets per provider, shared by every thread in the process.
+
+    Interactive callers may spend the whole bucket and wait up to
+    ``max_wait[INTERACTIVE]`` seconds for a token. Background callers leave
+    ``reserve`` of the capacity untouched, step aside while an interactive
+    caller is waiting on the same provider, and may queue for longer. When
+    the wait runs out ``acquire`` returns False so the caller can reroute.
+    """
+
+    def __init__(self, limits, reserve=0.2, max_wait=None):
+        self.reserve = reserve
+        self.max_wait = max_wait or {INTERACTIVE: 0.25, BACKGROUND: 30.0}
+        self._buckets = {provider: TokenBucket(*limit) for provider, limit in limits.items()}
+        self._waiting_interactive = defaultdict(int)
+        self._outcomes = defaultdict(int)
+        self._cond = threading.Condition()
+
+    def acquire(self, provider, priority=INTERACTIVE, max_wait=None):
+        """Take a token, waiting up to ``max_wait`` seconds if that is less than the priority's cap."""
+        bucket = self._buckets.get(provider)
+        if bucket is None:
+            return True
+
+        interactive = priority == INTERACTIVE
+        floor = 0.0 if interactive else bucket.capacity * self.reserve
+        now = time.monotonic()
+        wait = self.max_wait[priority]
+        deadline = now + (wait if max_wait is None else max(min(wait, max_wait), 0.0))
+        with self._cond:
+            if interactive:
+                self._waiting_interactive[provider] += 1
+            try:
+                while True:
+                    bucket.refill(now)
+                    yielding = not interactive and self._waiting_interactive[provider] > 0
+                    if not yielding and bucket.tokens >= floor + 1:
+                        bucket.tokens -= 1
+                        self._outcomes[(provider, priority, "granted")] += 1
+                        return True
+                    if now >= deadline:
+                        self._outcomes[(provider, priority, "rejected")] += 1
+                        return False
+                    shortfall = max(floor + 1 - bucket.tokens, 0.0) / bucket.rate
+                    self._cond.wait(min(deadline - now, max(shortfall, 0.01)))
+                    now = time.monotonic()
+            finally:
+                if interactive:
+                    self._waiting_interactive[provider] -= 1
+                    self._cond.notify_all()
+
+    def exhausted(self, provider):
+        """The provider pushed back (HTTP 429): stop spending until the bucket refills."""
+        bucket = self._buckets.get(provider)
+        if bucket is not None:
+            with self._cond:
+                bucket.refill(time.monotonic())
+                bucket.tokens = 0.0
+            logger.warning("%s reported rate limiting; pausing calls until its bucket refills", provider)
+
+    def report(self):
+        """Return ``{provider: {...}}`` with remaining tokens and call outcomes."""
+        now = time.monotonic()
+        with self._cond:
+            report = {}
+            for provider, bucket in self._buckets.items():
+                bucket.refill(now)
+                report[provider] = {
+                    "remaining": round(bucket.tokens, 2),
+                    "capacity": bucket.capacity,
+                    "per_minute": round(bucket.rate * 60, 2),
+                }
+            for (provider, priority, result), count in self._outcomes.items():
+                report.setdefault(provider, {})[f"{priority}_{result}"] = count
+            return report
+
+    def expose(self):
+        lines = [
+            "# HELP provider_quota_remaining Tokens left in each provider's rate-limit bucket.",
+            "# TYPE provider_quota_remaining gauge",
+        ]
+        report = self.report()
+        for provider, values in sorted(report.items()):
+            if "remaining" in values:
+                lines.append(f'provider_quota_remaining{{provider="{provider}"}} {values["remaining"]}')
+        lines.extend(
+            [
+                "# HELP provider_quota_requests_total Rate-limit decisions by provider, priority and result.",
+                "# TYPE provider_quota_requests_total counter",
+            ]
+        )
+        with self._cond:
+            outcomes = sorted(self._outcomes.items())
+        for (provider, priority, result), count in outcomes:
+            lines.append(
+                f'provider_quota_requests_total{{provider="{provider}",priority="{priority}",result="{result}"}} {count}'
+            )
+        return lines
+
+
+def current_priority():
+    """Explicit priority if one is set, else interactive inside a request."""
+    priority = _priority.get()
+    if priority is not None:
+        return priority
+    return INTERACTIVE if has_request_context() else BACKGROUND
+
+
+@contextmanager
+def provider_priority(priority):
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def build_scheduler():
+    limits = {}
+    for provider, default in DEFAULT_LIMITS.items():
+        limit = parse_limit(os.getenv(f"RATE_LIMIT_{provider.upper()}", default))
+        if limit is not None:
+            limits[provider] = limit
+    return ProviderScheduler(
+        limits,
+        reserve=float(os.getenv("RATE_LIMIT_RESERVE", "0.2")),
+        max_wait={
+            INTERACTIVE: float(os.getenv("RATE_LIMIT_WAIT_INTERACTIVE", "0.25")),
+            BACKGROUND: float(os.getenv("RATE_LIMIT_WAIT_BACKGROUND", "30")),
+        },
+    )
+
+
+scheduler = build_scheduler()
+register_collector(scheduler.expose)
@@ -0,0 +1,171 @@
+import logging
+import os
+import random
+import secrets
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import delete, select
+from werkzeug.datastructures import CallbackDict
+
+from extensions import db, sess
+from models import ServerSession
+
+
+logger = logging.getLogger(__name__)
+
+SESSION_BACKENDS = ("cookie", "sqlalchemy", "filesystem")
+
+
+class TableSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        # Who the session belonged to when loaded; the id rotates when this changes.
+        self.loaded_user_id = self.get("user_id")
+
+
+class TableSessionInterface(SessionInterface):
+    """Sessions stored in the ``sessions`` table under a signed random id.
+
+    Rows carry an absolute expiry. A request only writes when the session
+    changed or when less than half of its lifetime is left, and roughly one
+    write in ``sweep_every`` also deletes expired rows. Storage goes through
+    its own short transactions on the primary engine, so it never commits
+    the request's ``db.session`` work.
+    """
+
+    serializer = TaggedJSONSerializer()
+    session_class = TableSession
+
+    def __init__(self, sweep_every=100):
+        self.sweep_every = sweep_every
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt="table-session")
+
+    def _lifetime(self, app):
+        return app.permanent_session_lifetime
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                table = ServerSession.__table__
+                with db.engine.connect() as conn:
+                    row = conn.execute(
+                        select(table.c.data, table.c.expires_at).where(
+                            table.c.id == sid, table.c.expires_at > datetime.utcnow()
+                        )
+                    ).first()
+                if row is not None:
+                    session = self.session_class(self.serializer.loads(row.data), sid=sid)
+                    session.expires_at = row.expires_at
+                    return session
+        return self.session_class(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        table = ServerSession.__table__
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.modified and not session.new:
+                with db.engine.begin() as conn:
+                    conn.execute(delete(table).where(table.c.id == session.sid))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = datetime.utcnow()
+        lifetime = self._lifetime(app)
+        expires_at = getattr(session, "expires_at", None)
+        if not session.modified and expires_at is not None and expires_at - now > lifetime / 2:
+            return
+
+        data = self.serializer.dumps(dict(session))
+        with db.engine.begin() as conn:
+            if not session.new and session.get("user_id") != session.loaded_user_id:
+                # A fresh id whenever the signed-in user changes rules out session
+                # fixation. Other changes (flashes, the primary pin) update in place,
+                # so overlapping requests carrying the old cookie keep working.
+                conn.execute(delete(table).where(table.c.id == session.sid))
+                session.sid = secrets.token_urlsafe(32)
+                session.new = True
+            updated = 0
+            if not session.new:
+                updated = conn.execute(
+                    table.update().where(table.c.id == session.sid).values(data=data, expires_at=now + lifetime)
+                ).rowcount
+            if not updated:
+                conn.execute(table.insert().values(id=session.sid, data=data, expires_at=now + lifetime))
+            session.new = False
+            session.loaded_user_id = session.get("user_id")
+            if random.randrange(self.sweep_every) == 0:
+                conn.execute(delete(table).where(table.c.expires_at <= now))
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def sweep_expired_sessions():
+    table = ServerSession.__table__
+    with db.engine.begin() as conn:
+        return conn.execute(delete(table).where(table.c.expires_at <= datetime.utcnow())).rowcount
+
+
+def init_session_backend(app):
+    """Install the session store named by ``SESSION_BACKEND``.
+
+    ``cookie`` (default) keeps Flask's signed, stateless cookie, which fits
+    the few small keys we store. ``sqlalchemy`` keeps sessions in the app
+    database so they are shared across containers and can be revoked.
+    ``filesystem`` is the previous Flask-Session setup.
+    """
+    backend = os.getenv("SESSION_BACKEND", "cookie").strip().lower()
+    if backend not in SESSION_BACKENDS:
+        logger.warning("Unknown SESSION_BACKEND=%r, using cookie sessions", backend)
+        backend = "cookie"
+
+    app.permanent_session_lifetime = timedelta(hours=int(os.getenv("SESSION_LIFETIME_HOURS", "24")))
+    if backend == "filesystem":
+        app.config["SESSION_TYPE"] = "filesystem"
+        sess.init_app(app)
+    elif backend == "sqlalchemy":
+        app.session_interface = TableSessionInterface(
+            sweep_every=int(os.getenv("SESSION_SWEEP_EVERY", "100")),
+        )
+    app.cli.add_command(sweep_sessions_command)
+    logger.info("Using %s session backend", backend)
+    return backend
+
+
+@click.command("sweep-sessions")
+@with_appcontext
+def sweep_sessions_command():
+    """Delete expired rows from the sessions table."""
+    click.echo(f"Deleted {sweep_expired_sessions()} expired sessions.")
@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+from trading import TradeRejected, execute_buy, execute_sell
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("SECRET_KEY", "test")
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path}/trading.db")
+    monkeypatch.setenv("MARKET_DATA_PROVIDER", "simulator")
+    monkeypatch.setenv("QUOTE_CACHE_PATH", "off")
+    monkeypatch.setenv("JINJA_CACHE_DIR", "off")
+    monkeypatch.setenv("PASSWORD_HASH_WORKERS", "0")
+    from app import create_app
+    from extensions import db
+    from models import User
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username="trader", hash="!", cash=10000.0))
+        db.session.commit()
+    return app
+
+
+def race(app, trades):
+    """Run each ``trade()`` in its own thread and app context at the same moment."""
+    from extensions import db
+
+    start = threading.Barrier(len(trades))
+    outcomes = []
+
+    def run(trade):
+        with app.app_context():
+            start.wait()
+            try:
+                trade()
+                db.session.commit()
+                outcomes.append("filled")
+            except TradeRejected:
+                db.session.rollback()
+                outcomes.append("rejected")
+
+    threads = [threading.Thread(target=run, args=(trade,)) for trade in trades]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(outcomes)
+
+
+def test_concurrent_sells_cannot_oversell(app):
+    from extensions import db
+    from models import Lot, Portfolio, Trade, User
+
+    with app.app_context():
+        execute_buy(1, "AAPL", 10, 100.0)
+        db.session.commit()
+
+    sell = lambda: execute_sell(1, "AAPL", 6, 150.0)
+    assert race(app, [sell, sell]) == ["filled", "rejected"]
+
+    with app.app_context():
+        assert Portfolio.query.filter_by(user_id=1, symbol="AAPL").one().shares == 4
+        assert sum(lot.remaining_shares for lot in Lot.query.all()) == 4
+        assert Trade.query.filter(Trade.shares < 0).count() == 1
+        assert db.session.get(User, 1).cash == 10000.0 - 1000.0 + 900.0
+
+
+def test_concurrent_buys_open_one_position(app):
+    from models import Portfolio
+
+    buy = lambda: execute_buy(1, "MSFT", 3, 100.0)
+    assert race(app, [buy, buy]) == ["filled", "filled"]
+
+    with app.app_context():
+        position = Portfolio.query.filter_by(user_id=1, symbol="MSFT").one()
+        assert (position.shares, position.total_cost_basis) == (6, 600.0)
+
+
+def test_sell_is_rejected_when_lots_do_not_cover_it(app):
+    from extensions import db
+    from models import Lot, Portfolio
+
+    with app.app_context():
+        execute_buy(1, "AAPL", 10, 100.0)
+        db.session.commit()
+        Lot.query.update({"remaining_shares": 2})
+        db.session.commit()
+
+        with pytest.raises(TradeRejected):
+            execute_sell(1, "AAPL", 5, 150.0)
+        db.session.rollback()
+        assert Portfolio.query.filter_by(user_id=1, symbol="AAPL").one().shares == 10
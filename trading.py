@@ -0,0 +1,132 @@
+import logging
+
+from sqlalchemy import and_, case, delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from leaderboard import record_trade
+from lots import close_lots, open_lot
+from models import Portfolio, Trade, User
+
+
+logger = logging.getLogger(__name__)
+
+
+class TradeRejected(Exception):
+    """The account cannot cover the trade; the message is shown to the user."""
+
+
+class Execution:
+    """An applied but uncommitted trade, plus what the leaderboard needs after commit."""
+
+    __slots__ = ("trade", "cash", "cost_delta")
+
+    def __init__(self, trade, cash, cost_delta):
+        self.trade = trade
+        self.cash = cash
+        self.cost_delta = cost_delta
+
+    def publish(self):
+        """Call once the transaction has committed."""
+        trade = self.trade
+        record_trade(trade.user_id, trade.symbol, trade.shares, self.cost_delta, self.cash, trade.price)
+
+
+def _cash(user_id):
+    users = User.__table__
+    return db.session.execute(select(users.c.cash).where(users.c.id == user_id)).scalar_one()
+
+
+def _debit_cash(user_id, amount):
+    """Take ``amount`` from the user's cash and return the new balance.
+
+    The balance check is part of the ``UPDATE``, so two trades racing for
+    the same cash cannot both pass it.
+    """
+    users = User.__table__
+    debited = db.session.execute(
+        update(users).where(users.c.id == user_id, users.c.cash >= amount).values(cash=users.c.cash - amount)
+    ).rowcount
+    if debited != 1:
+        raise TradeRejected("Cannot afford to purchase")
+    return _cash(user_id)
+
+
+def _credit_cash(user_id, amount):
+    users = User.__table__
+    db.session.execute(update(users).where(users.c.id == user_id).values(cash=users.c.cash + amount))
+    return _cash(user_id)
+
+
+def _grow_position(user_id, symbol, shares, cost):
+    portfolios = Portfolio.__table__
+    return db.session.execute(
+        update(portfolios)
+        .where(portfolios.c.user_id == user_id, portfolios.c.symbol == symbol)
+        .values(shares=portfolios.c.shares + shares, total_cost_basis=portfolios.c.total_cost_basis + cost)
+    ).rowcount
+
+
+def execute_buy(user_id, symbol, shares, price):
+    """Debit cash, grow the position and open a lot, without committing.
+
+    Callers run ``ensure_lots_populated`` first, since it commits.
+    """
+    total_cost = shares * price
+    cash = _debit_cash(user_id, total_cost)
+
+    if not _grow_position(user_id, symbol, shares, total_cost):
+        try:
+            with db.session.begin_nested():
+                db.session.execute(
+                    Portfolio.__table__.insert().values(
+                        user_id=user_id, symbol=symbol, shares=shares, total_cost_basis=total_cost
+                    )
+                )
+        except IntegrityError:
+            # A concurrent buy opened the position first; add to it instead.
+            _grow_position(user_id, symbol, shares, total_cost)
+
+    new_trade = Trade(user_id=user_id, symbol=symbol, shares=shares, price=price)
+    db.session.add(new_trade)
+    db.session.flush()
+    open_lot(new_trade)
+    return Execution(new_trade, cash, total_cost)
+
+
+def execute_sell(user_id, symbol, shares, price, lot_ids=()):
+    """Credit cash, shrink the position and close lots, without committing.
+
+    Callers run ``ensure_portfolios_populated`` and ``ensure_lots_populated``
+    first, since they commit, and roll back when ``TradeRejected`` is raised.
+    """
+    portfolios = Portfolio.__table__
+    position = and_(portfolios.c.user_id == user_id, portfolios.c.symbol == symbol)
+    # Checked and taken in one statement, so concurrent sells cannot both pass.
+    taken = db.session.execute(
+        update(portfolios).where(position, portfolios.c.shares >= shares).values(shares=portfolios.c.shares - shares)
+    ).rowcount
+    if taken != 1:
+        raise TradeRejected("You do not have enough shares to sell")
+
+    new_trade = Trade(user_id=user_id, symbol=symbol, shares=-shares, price=price)
+    db.session.add(new_trade)
+    db.session.flush()
+
+    try:
+        closed_cost = close_lots(user_id, symbol, shares, new_trade.id, lot_ids=lot_ids)
+    except ValueError:
+        logger.warning("Lots of user %s %s do not match the position; rejecting the sale", user_id, symbol)
+        raise TradeRejected("Your tax lots do not match this position; nothing was sold")
+    new_trade.realized_pnl = shares * price - closed_cost
+
+    cash = _credit_cash(user_id, shares * price)
+
+    # The basis drops by what the closed lots cost, matching /api/gains.
+    basis = portfolios.c.total_cost_basis - closed_cost
+    db.session.execute(
+        update(portfolios).where(position).values(total_cost_basis=case((basis < 0, 0.0), else_=basis))
+    )
+    db.session.execute(delete(portfolios).where(position, portfolios.c.shares <= 0))
+
+    return Execution(new_trade, cash, -closed_cost)
@@ -0,0 +1,119 @@
+import logging
+from datetime import date, timedelta
+
+import click
+import numpy as np
+from flask.cli import with_appcontext
+from sqlalchemy import select
+
+from extensions import db
+from helpers import lookup
+from models import Portfolio, PortfolioValue, User
+
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_prices(symbols):
+    """Look up each distinct symbol once; missing quotes are left out."""
+    prices = {}
+    for symbol in symbols:
+        quote = lookup(symbol)
+        if quote:
+            prices[symbol] = quote["price"]
+        else:
+            logger.warning("No price for %s, valuing its holdings at cost", symbol)
+    return prices
+
+
+def value_all_users(prices=None):
+    """Value every account at once.
+
+    Holdings are loaded as a sparse users x symbols matrix in coordinate form
+    (one entry per open position) and multiplied by the price vector with
+    ``np.bincount``, which avoids materialising a dense matrix. Positions
+    without a price fall back to their cost basis.
+
+    Returns ``(user_ids, cash, invested_cost, market_value)`` as NumPy arrays.
+    """
+    users = User.__table__
+    portfolios = Portfolio.__table__
+
+    user_rows = db.session.execute(select(users.c.id, users.c.cash).order_by(users.c.id)).all()
+    user_ids = np.fromiter((row.id for row in user_rows), dtype=np.int64, count=len(user_rows))
+    cash = np.fromiter((row.cash or 0.0 for row in user_rows), dtype=np.float64, count=len(user_rows))
+
+    holdings = db.session.execute(
+        select(portfolios.c.user_id, portfolios.c.symbol, portfolios.c.shares, portfolios.c.total_cost_basis)
+        .where(portfolios.c.shares > 0)
+    ).all()
+
+    if not holdings:
+        zeros = np.zeros(len(user_ids))
+        return user_ids, cash, zeros, zeros.copy()
+
+    symbols = sorted({row.symbol for row in holdings})
+    symbol_index = {symbol: position for position, symbol in enumerate(symbols)}
+    if prices is None:
+        prices = fetch_prices(symbols)
+    price_vector = np.array([prices.get(symbol, np.nan) for symbol in symbols], dtype=np.float64)
+
+    row_index = np.searchsorted(user_ids, np.fromiter((row.user_id for row in holdings), dtype=np.int64))
+    column_index = np.fromiter((symbol_index[row.symbol] for row in holdings), dtype=np.int64)
+    shares = np.fromiter((row.shares for row in holdings), dtype=np.float64)
+    cost = np.fromiter((row.total_cost_basis for row in holdings), dtype=np.float64)
+
+    position_values = shares * price_vector[column_index]
+    position_values = np.where(np.isnan(position_values), cost, position_values)
+
+    invested_cost = np.bincount(row_index, weights=cost, minlength=len(user_ids))
+    market_value = np.bincount(row_index, weights=position_values, minlength=len(user_ids))
+    return user_ids, cash, invested_cost, market_value
+
+
+def snapshot_portfolio_values(prices=None):
+    """Write today's ``portfolio_values`` row for every user.
+
+    Holdings and prices are today's, so there is no way to snapshot another date.
+    """
+    as_of = date.today()
+    user_ids, cash, invested_cost, market_value = value_all_users(prices=prices)
+
+    PortfolioValue.query.filter_by(as_of=as_of).delete(synchronize_session=False)
+    if len(user_ids):
+        db.session.execute(
+            PortfolioValue.__table__.insert(),
+            [
+                {
+                    "user_id": int(user_id),
+                    "as_of": as_of,
+                    "cash": float(user_cash),
+                    "invested_cost": float(user_cost),
+                    "market_value": float(user_value),
+                }
+                for user_id, user_cash, user_cost, user_value in zip(user_ids, cash, invested_cost, market_value)
+            ],
+        )
+    db.session.commit()
+
+    logger.info("Stored %s portfolio valuations for %s", len(user_ids), as_of)
+    return len(user_ids)
+
+
+def value_history(user_id, days=90):
+    """Return ``(as_of, total_value)`` rows for the last ``days`` days."""
+    values = PortfolioValue.__table__
+    stmt = (
+        select(values.c.as_of, (values.c.cash + values.c.market_value).label("total_value"))
+        .where(values.c.user_id == user_id, values.c.as_of >= date.today() - timedelta(days=days))
+        .order_by(values.c.as_of.asc())
+    )
+    return db.session.execute(stmt).all()
+
+
+@click.command("snapshot-values")
+@with_appcontext
+def snapshot_values_command():
+    """Store today's valuation for every user."""
+    count = snapshot_portfolio_values()
+    click.echo(f"Stored {count} portfolio valuations.")